@@ -0,0 +1,64 @@
+"""Конфигурация API Gateway"""
+from backend.shared.config import settings
+from pydantic_settings import BaseSettings
+
+
+class GatewaySettings(BaseSettings):
+    ASSET_SERVICE_URL: str = settings.ASSET_SERVICE_URL
+    FORECAST_SERVICE_URL: str = settings.FORECAST_SERVICE_URL
+    FORECAST_STORAGE_URL: str = settings.FORECAST_STORAGE_URL
+    MODEL_REGISTRY_URL: str = settings.MODEL_REGISTRY_URL
+    ADMIN_SERVICE_URL: str = settings.ADMIN_SERVICE_URL
+    
+    # Пул соединений на каждый upstream-сервис
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    # HTTP/2 к upstream (нужен upstream с поддержкой h2c; uvicorn его не поддерживает)
+    UPSTREAM_HTTP2: bool = False
+    
+    UPSTREAM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    UPSTREAM_READ_TIMEOUT_SECONDS: float = 30.0
+    UPSTREAM_POOL_TIMEOUT_SECONDS: float = 5.0
+    
+    # Устойчивость вызовов upstream: бюджет времени запроса (до заголовков ответа, все попытки)
+    GATEWAY_DEFAULT_TIMEOUT_SECONDS: float = 10.0
+    GATEWAY_FORECAST_TIMEOUT_SECONDS: float = 15.0
+    # Повторы идемпотентных GET при сетевых ошибках и 502/503/504, пауза - с full jitter
+    GATEWAY_RETRY_MAX_ATTEMPTS: int = 2
+    GATEWAY_RETRY_BASE_DELAY_SECONDS: float = 0.05
+    GATEWAY_RETRY_MAX_DELAY_SECONDS: float = 1.0
+    # Circuit breaker: открывается после N сбоев подряд, пробный запрос - через recovery
+    GATEWAY_BREAKER_FAILURE_THRESHOLD: int = 5
+    GATEWAY_BREAKER_RECOVERY_SECONDS: float = 30.0
+    # Hedged-запросы: дубль GET, если ответа нет дольше задержки
+    GATEWAY_HEDGE_ENABLED: bool = False
+    GATEWAY_HEDGE_DELAY_SECONDS: float = 0.2
+    
+    # Агрегация dashboard: таймауты вызовов по upstream и параллелизм по активам
+    DASHBOARD_ASSET_TIMEOUT_SECONDS: float = 2.0
+    DASHBOARD_FORECAST_STORAGE_TIMEOUT_SECONDS: float = 3.0
+    DASHBOARD_MODEL_REGISTRY_TIMEOUT_SECONDS: float = 2.0
+    DASHBOARD_MAX_ASSETS: int = 50
+    DASHBOARD_MAX_CONCURRENT_ASSETS: int = 10
+    
+    # Кеш ответов читающих маршрутов: TTL по маршрутам (секунды) и окно stale-while-revalidate
+    GATEWAY_CACHE_ENABLED: bool = True
+    GATEWAY_CACHE_MAX_ENTRIES: int = 5000
+    GATEWAY_CACHE_MAX_ENTRY_BYTES: int = 2 * 1024 * 1024
+    GATEWAY_CACHE_TTL_ASSETS: int = 300
+    GATEWAY_CACHE_TTL_MODELS: int = 300
+    GATEWAY_CACHE_TTL_FORECAST: int = 300
+    GATEWAY_CACHE_TTL_FORECAST_HISTORY: int = 120
+    GATEWAY_CACHE_STALE_SECONDS: int = 60
+    # Общий для реплик уровень кеша в Redis
+    GATEWAY_CACHE_REDIS_ENABLED: bool = False
+    REDIS_HOST: str = settings.REDIS_HOST
+    REDIS_PORT: int = settings.REDIS_PORT
+    
+    class Config:
+        env_file = ".env"
+        case_sensitive = True
+
+
+gateway_settings = GatewaySettings()
@@ -0,0 +1,123 @@
+"""Агрегация данных экрана актива из нескольких сервисов одним запросом"""
+import asyncio
+import httpx
+from typing import Any, Dict, List, Optional, Tuple
+from backend.api_gateway.config import gateway_settings
+from backend.api_gateway.proxy import UpstreamPool
+from backend.api_gateway.resilience import CircuitOpenError, UpstreamTimeoutError
+
+
+class UpstreamCallError(Exception):
+    """Ошибка вызова upstream при сборке dashboard (таймаут, сеть, статус >= 400)"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DashboardAggregator:
+    """Параллельный опрос Asset Service, Forecast Storage и Model Registry.
+    
+    Время ответа определяется самым медленным вызовом, а не их суммой. Каждый вызов
+    ограничен таймаутом своего upstream; недоступные разделы возвращаются как null
+    с описанием в errors, отсутствие самого актива - 404.
+    """
+    
+    def __init__(self, pool: UpstreamPool):
+        self.pool = pool
+        self.timeouts = {
+            "asset": gateway_settings.DASHBOARD_ASSET_TIMEOUT_SECONDS,
+            "forecast_storage": gateway_settings.DASHBOARD_FORECAST_STORAGE_TIMEOUT_SECONDS,
+            "model_registry": gateway_settings.DASHBOARD_MODEL_REGISTRY_TIMEOUT_SECONDS,
+        }
+    
+    async def _get(self, upstream: str, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET к upstream через breaker и повторы, в пределах таймаута upstream"""
+        try:
+            response = await self.pool.request(
+                upstream,
+                lambda client: client.get(path, params=params),
+                idempotent=True,
+                timeout=self.timeouts[upstream],
+                hedge=True
+            )
+        except UpstreamTimeoutError:
+            raise UpstreamCallError(f"{upstream} timed out after {self.timeouts[upstream]}s")
+        except CircuitOpenError as e:
+            raise UpstreamCallError(str(e))
+        except httpx.RequestError as e:
+            raise UpstreamCallError(f"{upstream} unavailable: {e}")
+        if response.status_code >= 400:
+            raise UpstreamCallError(f"{upstream} returned {response.status_code}", response.status_code)
+        return response.json()
+    
+    async def _model_info(self, model_id: str) -> Dict[str, Any]:
+        """Модель и ее продакшн-версия (два вызова параллельно; версии может не быть)"""
+        model, prod_version = await asyncio.gather(
+            self._get("model_registry", f"/models/{model_id}"),
+            self._get("model_registry", f"/models/{model_id}/versions/prod"),
+            return_exceptions=True
+        )
+        if isinstance(model, Exception):
+            raise model
+        return {"model": model, "prod_version": None if isinstance(prod_version, Exception) else prod_version}
+    
+    async def _latest_forecast_and_model(self, asset_id: str, model_id: Optional[str]) -> Tuple[Any, Any]:
+        """Последний прогноз; без явного model_id модель берется из прогноза (цепочка вызовов)"""
+        if model_id:
+            return await asyncio.gather(
+                self._get("forecast_storage", f"/forecasts/asset/{asset_id}/latest"),
+                self._model_info(model_id),
+                return_exceptions=True
+            )
+        try:
+            latest = await self._get("forecast_storage", f"/forecasts/asset/{asset_id}/latest")
+        except UpstreamCallError as e:
+            return e, None
+        # Forecast Service сохраняет в model_version_id идентификатор модели
+        try:
+            return latest, await self._model_info(latest["model_version_id"])
+        except UpstreamCallError as e:
+            return latest, e
+    
+    async def build(self, asset_id: str, model_id: Optional[str] = None, history_limit: int = 50) -> Dict[str, Any]:
+        """Данные экрана актива: актив, последний прогноз, история прогнозов, модель"""
+        asset, history, latest_and_model = await asyncio.gather(
+            self._get("asset", f"/assets/{asset_id}"),
+            self._get("forecast_storage", "/forecasts", {"asset_id": asset_id, "limit": history_limit}),
+            self._latest_forecast_and_model(asset_id, model_id),
+            return_exceptions=True
+        )
+        if isinstance(asset, UpstreamCallError) and asset.status_code == 404:
+            raise asset
+        latest, model = latest_and_model if not isinstance(latest_and_model, Exception) else (latest_and_model, None)
+        
+        sections = {"asset": asset, "latest_forecast": latest, "forecast_history": history, "model": model}
+        errors: Dict[str, str] = {}
+        payload: Dict[str, Any] = {"asset_id": asset_id}
+        for name, value in sections.items():
+            if isinstance(value, Exception):
+                # 404 последнего прогноза - нормальная ситуация для нового актива
+                if not (name == "latest_forecast" and getattr(value, "status_code", None) == 404):
+                    errors[name] = str(value)
+                value = None
+            payload[name] = value
+        payload["errors"] = errors
+        return payload
+    
+    async def build_many(self, asset_ids: List[str], model_id: Optional[str] = None, history_limit: int = 50) -> Dict[str, Any]:
+        """Данные нескольких активов; число одновременных сборок ограничено"""
+        semaphore = asyncio.Semaphore(gateway_settings.DASHBOARD_MAX_CONCURRENT_ASSETS)
+        
+        async def build_one(asset_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.build(asset_id, model_id, history_limit)
+        
+        results = await asyncio.gather(*(build_one(asset_id) for asset_id in asset_ids), return_exceptions=True)
+        dashboards, errors = {}, {}
+        for asset_id, result in zip(asset_ids, results):
+            if isinstance(result, Exception):
+                errors[asset_id] = str(result)
+            else:
+                dashboards[asset_id] = result
+        return {"dashboards": dashboards, "errors": errors}
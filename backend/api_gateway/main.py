@@ -1,13 +1,15 @@
 """API Gateway - единая точка входа для всех клиентов"""
-from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import httpx
-from typing import Optional
 import time
 from backend.shared.config import settings
 from backend.shared.models import HealthResponse, ErrorResponse
-from backend.shared.auth import get_current_user, create_access_token
+from backend.shared.auth import get_current_user, create_access_token, token_cache
+from backend.api_gateway.config import gateway_settings
+from backend.api_gateway.proxy import ProxyRoute, UpstreamPool, ReverseProxy, register_routes
+from backend.api_gateway.response_cache import ResponseCache
+from backend.api_gateway.dashboard import DashboardAggregator, UpstreamCallError
+from typing import Optional
 from datetime import timedelta
 
 app = FastAPI(
@@ -26,13 +28,24 @@ app.add_middleware(
 )
 
 
-# Клиент для проксирования запросов
-http_client = httpx.AsyncClient(timeout=30.0)
+# Пулы соединений к внутренним сервисам
+upstream_pool = UpstreamPool({
+    "asset": gateway_settings.ASSET_SERVICE_URL,
+    "forecast": gateway_settings.FORECAST_SERVICE_URL,
+    "forecast_storage": gateway_settings.FORECAST_STORAGE_URL,
+    "model_registry": gateway_settings.MODEL_REGISTRY_URL,
+    "admin": gateway_settings.ADMIN_SERVICE_URL,
+})
+proxy = ReverseProxy(upstream_pool)
+dashboard_aggregator = DashboardAggregator(upstream_pool)
+response_cache = ResponseCache() if gateway_settings.GATEWAY_CACHE_ENABLED else None
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    await http_client.aclose()
+    await upstream_pool.close()
+    if response_cache is not None:
+        await response_cache.close()
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -58,164 +71,90 @@ async def login(username: str, password: str):
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 
-@app.get("/api/assets")
-async def get_assets(
-    request: Request,
-    current_user: str = Depends(get_current_user)
-):
-    """Проксирование запроса к Asset Service"""
-    try:
-        url = f"{settings.ASSET_SERVICE_URL}/assets"
-        params = dict(request.query_params)
-        response = await http_client.get(url, params=params)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
-
-
-@app.post("/api/assets")
-async def create_asset(
-    request: Request,
+# Таблица проксируемых маршрутов (все требуют авторизации)
+PROXY_ROUTES = [
+    ProxyRoute(
+        ["GET"], "/api/assets", "asset", "/assets", "Список активов",
+        cache_ttl=gateway_settings.GATEWAY_CACHE_TTL_ASSETS, hedge=True
+    ),
+    ProxyRoute(
+        ["POST"], "/api/assets", "asset", "/assets", "Создание актива",
+        invalidates=["/api/assets"]
+    ),
+    ProxyRoute(
+        ["GET"], "/api/assets/{asset_id}", "asset", "/assets/{asset_id}", "Получение актива по ID",
+        cache_ttl=gateway_settings.GATEWAY_CACHE_TTL_ASSETS, hedge=True
+    ),
+    ProxyRoute(
+        ["PATCH"], "/api/assets/{asset_id}", "asset", "/assets/{asset_id}", "Обновление актива",
+        invalidates=["/api/assets", "/api/assets/{asset_id}"]
+    ),
+    ProxyRoute(
+        ["GET"], "/api/forecast/{asset_id}", "forecast", "/forecast/{asset_id}", "Получение прогноза для актива",
+        cache_ttl=gateway_settings.GATEWAY_CACHE_TTL_FORECAST,
+        # Холодная загрузка модели дольше обычного запроса; без hedging - прогноз сохраняется
+        timeout=gateway_settings.GATEWAY_FORECAST_TIMEOUT_SECONDS
+    ),
+    ProxyRoute(
+        ["GET"], "/api/forecasts/history", "forecast_storage", "/forecasts", "Получение истории прогнозов",
+        cache_ttl=gateway_settings.GATEWAY_CACHE_TTL_FORECAST_HISTORY, hedge=True
+    ),
+    ProxyRoute(
+        ["GET"], "/api/models", "model_registry", "/models", "Получение списка моделей",
+        cache_ttl=gateway_settings.GATEWAY_CACHE_TTL_MODELS, hedge=True
+    ),
+    ProxyRoute(
+        ["GET", "POST", "PATCH", "DELETE"], "/api/admin/{path:path}", "admin", "/{path}",
+        "Проксирование админских запросов"
+    ),
+]
+
+register_routes(app, proxy, PROXY_ROUTES, dependencies=[Depends(get_current_user)], cache=response_cache)
+
+
+@app.get("/api/dashboard")
+async def get_dashboards(
+    asset_ids: str = Query(..., description="ID активов через запятую"),
+    model_id: Optional[str] = Query(None),
+    history_limit: int = Query(50, ge=1, le=1000),
     current_user: str = Depends(get_current_user)
 ):
-    """Создание актива"""
-    try:
-        body = await request.json()
-        url = f"{settings.ASSET_SERVICE_URL}/assets"
-        response = await http_client.post(url, json=body)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+    """Данные экранов нескольких активов одним запросом"""
+    ids = list(dict.fromkeys(asset_id.strip() for asset_id in asset_ids.split(",") if asset_id.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="asset_ids must not be empty")
+    if len(ids) > gateway_settings.DASHBOARD_MAX_ASSETS:
+        raise HTTPException(status_code=400, detail=f"At most {gateway_settings.DASHBOARD_MAX_ASSETS} assets per request")
+    return await dashboard_aggregator.build_many(ids, model_id, history_limit)
 
 
-@app.get("/api/assets/{asset_id}")
-async def get_asset(
+@app.get("/api/dashboard/{asset_id}")
+async def get_dashboard(
     asset_id: str,
+    model_id: Optional[str] = Query(None),
+    history_limit: int = Query(50, ge=1, le=1000),
     current_user: str = Depends(get_current_user)
 ):
-    """Получение актива по ID"""
+    """Данные экрана актива: актив, последний прогноз, история прогнозов и модель"""
     try:
-        url = f"{settings.ASSET_SERVICE_URL}/assets/{asset_id}"
-        response = await http_client.get(url)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+        return await dashboard_aggregator.build(asset_id, model_id, history_limit)
+    except UpstreamCallError:
+        # build пробрасывает только 404 Asset Service, остальные ошибки - в errors
+        raise HTTPException(status_code=404, detail="Asset not found")
 
 
-@app.patch("/api/assets/{asset_id}")
-async def update_asset(
-    asset_id: str,
-    request: Request,
-    current_user: str = Depends(get_current_user)
-):
-    """Обновление актива"""
-    try:
-        body = await request.json()
-        url = f"{settings.ASSET_SERVICE_URL}/assets/{asset_id}"
-        response = await http_client.patch(url, json=body)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+@app.get("/api/cache/stats")
+async def cache_stats(current_user: str = Depends(get_current_user)):
+    """Статистика кеша ответов gateway и кеша проверенных JWT"""
+    if response_cache is None:
+        return {"enabled": False, "auth": token_cache.stats()}
+    return {"enabled": True, **response_cache.stats(), "auth": token_cache.stats()}
 
 
-@app.get("/api/forecast/{asset_id}")
-async def get_forecast(
-    asset_id: str,
-    horizon: Optional[int] = None,
-    current_user: str = Depends(get_current_user)
-):
-    """Получение прогноза для актива"""
-    try:
-        url = f"{settings.FORECAST_SERVICE_URL}/forecast/{asset_id}"
-        params = {"horizon": horizon} if horizon else {}
-        response = await http_client.get(url, params=params)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
-
-
-@app.get("/api/forecasts/history")
-async def get_forecast_history(
-    request: Request,
-    current_user: str = Depends(get_current_user)
-):
-    """Получение истории прогнозов"""
-    try:
-        url = f"{settings.FORECAST_STORAGE_URL}/forecasts"
-        params = dict(request.query_params)
-        response = await http_client.get(url, params=params)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
-
-
-@app.get("/api/models")
-async def get_models(
-    request: Request,
-    current_user: str = Depends(get_current_user)
-):
-    """Получение списка моделей"""
-    try:
-        url = f"{settings.MODEL_REGISTRY_URL}/models"
-        params = dict(request.query_params)
-        response = await http_client.get(url, params=params)
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
-
-
-@app.get("/api/admin/{path:path}")
-async def admin_proxy(
-    path: str,
-    request: Request,
-    current_user: str = Depends(get_current_user)
-):
-    """Проксирование админских запросов"""
-    try:
-        method = request.method
-        url = f"{settings.ADMIN_SERVICE_URL}/{path}"
-        params = dict(request.query_params)
-        
-        if method == "GET":
-            response = await http_client.get(url, params=params)
-        elif method == "POST":
-            body = await request.json()
-            response = await http_client.post(url, json=body, params=params)
-        elif method == "PATCH":
-            body = await request.json()
-            response = await http_client.patch(url, json=body, params=params)
-        elif method == "DELETE":
-            response = await http_client.delete(url, params=params)
-        else:
-            raise HTTPException(status_code=405, detail="Method not allowed")
-        
-        return JSONResponse(
-            content=response.json(),
-            status_code=response.status_code
-        )
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+@app.get("/api/upstreams/stats")
+async def upstream_stats(current_user: str = Depends(get_current_user)):
+    """Состояние circuit breaker, гистограммы задержек, повторы и hedging по upstream"""
+    return upstream_pool.stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,259 @@
+"""Потоковое проксирование запросов к внутренним сервисам"""
+import math
+import httpx
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from backend.api_gateway.config import gateway_settings
+from backend.api_gateway.response_cache import CachedResponse, ResponseCache
+from backend.api_gateway.resilience import CircuitOpenError, UpstreamGuard, UpstreamTimeoutError
+
+# Hop-by-hop заголовки относятся к одному соединению и не передаются дальше
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade"
+}
+
+# Не передаются при заполнении кеша: ответ должен быть полным и понятным любому клиенту
+CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since", "accept-encoding"}
+
+
+class ProxyRoute:
+    """Маршрут gateway: метод(ы) и путь -> upstream-сервис и путь в нем.
+    
+    upstream_path - шаблон с параметрами пути маршрута, например "/assets/{asset_id}".
+    cache_ttl - срок кеширования ответов GET-маршрута (None - без кеша),
+    invalidates - шаблоны путей gateway, кеш которых сбрасывается после успешного запроса.
+    timeout - бюджет времени запроса к upstream (None - GATEWAY_DEFAULT_TIMEOUT_SECONDS),
+    hedge - маршрут допускает hedged-запросы (GET без побочных эффектов).
+    """
+    
+    def __init__(
+        self,
+        methods: List[str],
+        path: str,
+        upstream: str,
+        upstream_path: str,
+        summary: str = "",
+        cache_ttl: Optional[int] = None,
+        invalidates: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        hedge: bool = False
+    ):
+        self.methods = methods
+        self.path = path
+        self.upstream = upstream
+        self.upstream_path = upstream_path
+        self.summary = summary
+        self.cache_ttl = cache_ttl
+        self.invalidates = invalidates or []
+        self.timeout = timeout
+        self.hedge = hedge
+
+
+class UpstreamPool:
+    """Отдельный пул keep-alive соединений (httpx-клиент) и UpstreamGuard на каждый upstream"""
+    
+    def __init__(self, upstreams: Dict[str, str]):
+        limits = httpx.Limits(
+            max_connections=gateway_settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=gateway_settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=gateway_settings.UPSTREAM_KEEPALIVE_EXPIRY_SECONDS
+        )
+        timeout = httpx.Timeout(
+            gateway_settings.UPSTREAM_READ_TIMEOUT_SECONDS,
+            connect=gateway_settings.UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+            pool=gateway_settings.UPSTREAM_POOL_TIMEOUT_SECONDS
+        )
+        self.clients = {
+            name: httpx.AsyncClient(
+                base_url=url,
+                limits=limits,
+                timeout=timeout,
+                http2=gateway_settings.UPSTREAM_HTTP2
+            )
+            for name, url in upstreams.items()
+        }
+        self.guards = {name: UpstreamGuard(name) for name in upstreams}
+    
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        return self.clients[upstream]
+    
+    def guard(self, upstream: str) -> UpstreamGuard:
+        return self.guards[upstream]
+    
+    async def request(
+        self,
+        upstream: str,
+        send: Callable[[httpx.AsyncClient], Awaitable[httpx.Response]],
+        idempotent: bool,
+        timeout: Optional[float] = None,
+        hedge: bool = False
+    ) -> httpx.Response:
+        """Запрос через breaker/повторы/hedging upstream; send(client) выполняет одну попытку"""
+        client = self.clients[upstream]
+        return await self.guards[upstream].call(
+            lambda: send(client),
+            idempotent,
+            timeout or gateway_settings.GATEWAY_DEFAULT_TIMEOUT_SECONDS,
+            hedge and gateway_settings.GATEWAY_HEDGE_ENABLED
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        """Состояние breaker, задержки и счетчики повторов по upstream"""
+        return {name: guard.stats() for name, guard in self.guards.items()}
+    
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+
+
+class ReverseProxy:
+    """Проксирование без разбора тела: байты upstream передаются клиенту как есть.
+    
+    Статус и заголовки (включая Content-Encoding) сохраняются, тело запроса
+    и ответа передается потоком, сжатые ответы не распаковываются.
+    """
+    
+    def __init__(self, pool: UpstreamPool):
+        self.pool = pool
+    
+    @staticmethod
+    def _request_headers(request: Request) -> Dict[str, str]:
+        headers = {
+            name: value for name, value in request.headers.items()
+            if name not in HOP_BY_HOP_HEADERS and name != "host"
+        }
+        if request.client is not None:
+            forwarded_for = request.headers.get("x-forwarded-for")
+            headers["x-forwarded-for"] = f"{forwarded_for}, {request.client.host}" if forwarded_for else request.client.host
+        return headers
+    
+    @staticmethod
+    def _response_headers(response: httpx.Response) -> List[Tuple[bytes, bytes]]:
+        """Заголовки ответа upstream (повторяющиеся, например Set-Cookie, сохраняются)"""
+        return [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in response.headers.multi_items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        ]
+    
+    @staticmethod
+    async def _stream(response: httpx.Response) -> AsyncIterator[bytes]:
+        """Сырые (без распаковки) байты ответа; соединение возвращается в пул и при обрыве клиента"""
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await response.aclose()
+    
+    async def _send(self, upstream: str, send: Callable[[httpx.AsyncClient], Awaitable[httpx.Response]], **options) -> httpx.Response:
+        """Запрос через UpstreamPool с переводом ошибок устойчивости в HTTP-ответы"""
+        try:
+            return await self.pool.request(upstream, send, **options)
+        except CircuitOpenError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Service unavailable: {str(e)}",
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        except UpstreamTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+    
+    async def fetch(
+        self,
+        request: Request,
+        upstream: str,
+        upstream_path: str,
+        timeout: Optional[float] = None,
+        hedge: bool = False
+    ) -> httpx.Response:
+        """Буферизованный GET к upstream для кеширования (тело распаковывается httpx)"""
+        headers = {
+            name: value for name, value in self._request_headers(request).items()
+            if name not in CONDITIONAL_HEADERS
+        }
+        params = request.query_params.multi_items()
+        return await self._send(
+            upstream,
+            lambda client: client.get(upstream_path, params=params, headers=headers),
+            idempotent=True,
+            timeout=timeout,
+            hedge=hedge
+        )
+    
+    async def forward(
+        self,
+        request: Request,
+        upstream: str,
+        upstream_path: str,
+        timeout: Optional[float] = None,
+        hedge: bool = False
+    ) -> StreamingResponse:
+        """Отправка запроса в upstream и потоковая передача ответа"""
+        # Тело передается потоком, только если оно есть (иначе GET ушел бы с chunked-телом)
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+        params = request.query_params.multi_items()
+        headers = self._request_headers(request)
+        
+        def send(client: httpx.AsyncClient) -> Awaitable[httpx.Response]:
+            # Запрос собирается заново для каждой попытки
+            upstream_request = client.build_request(
+                request.method,
+                upstream_path,
+                params=params,
+                headers=headers,
+                content=request.stream() if has_body else None
+            )
+            return client.send(upstream_request, stream=True)
+        
+        # Повторять и дублировать можно только запросы без тела и побочных эффектов
+        idempotent = request.method in ("GET", "HEAD") and not has_body
+        response = await self._send(upstream, send, idempotent=idempotent, timeout=timeout, hedge=hedge and idempotent)
+        
+        streaming_response = StreamingResponse(self._stream(response), status_code=response.status_code)
+        streaming_response.raw_headers = self._response_headers(response)
+        return streaming_response
+
+
+def register_routes(
+    app: FastAPI,
+    proxy: ReverseProxy,
+    routes: List[ProxyRoute],
+    dependencies: Sequence[Any] = (),
+    cache: Optional[ResponseCache] = None
+):
+    """Регистрация маршрутов таблицы как обработчиков FastAPI"""
+    for route in routes:
+        def make_handler(route: ProxyRoute):
+            async def handler(request: Request):
+                upstream_path = route.upstream_path.format(**request.path_params)
+                if cache is None:
+                    return await proxy.forward(request, route.upstream, upstream_path, route.timeout, route.hedge)
+                
+                if route.cache_ttl and request.method == "GET":
+                    async def fetch() -> CachedResponse:
+                        response = await proxy.fetch(request, route.upstream, upstream_path, route.timeout, route.hedge)
+                        return CachedResponse.from_upstream(
+                            response, route.cache_ttl, gateway_settings.GATEWAY_CACHE_STALE_SECONDS
+                        )
+                    
+                    key = cache.make_key(request.url.path, request.query_params.multi_items())
+                    entry, state = await cache.get_or_fetch(key, fetch)
+                    return cache.respond(entry, state, request.headers.get("if-none-match"))
+                
+                response = await proxy.forward(request, route.upstream, upstream_path, route.timeout, route.hedge)
+                if route.invalidates and response.status_code < 400:
+                    await cache.invalidate([path.format(**request.path_params) for path in route.invalidates])
+                return response
+            return handler
+        
+        app.add_api_route(
+            route.path,
+            make_handler(route),
+            methods=route.methods,
+            summary=route.summary or None,
+            dependencies=list(dependencies)
+        )
@@ -0,0 +1,280 @@
+"""Устойчивость вызовов upstream: circuit breaker, повторы с jitter, hedging, бюджет времени"""
+import asyncio
+import random
+import time
+import httpx
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from backend.api_gateway.config import gateway_settings
+
+# Ответы, означающие сбой upstream (учитываются breaker и повторяются для идемпотентных запросов)
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class CircuitOpenError(Exception):
+    """Upstream отключен breaker'ом; retry_after - секунд до пробного запроса"""
+    
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} circuit is open")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamTimeoutError(Exception):
+    """Исчерпан бюджет времени запроса к upstream"""
+
+
+class CircuitBreaker:
+    """Breaker по подряд идущим сбоям: closed -> open -> half_open -> closed.
+    
+    После failure_threshold сбоев подряд запросы отклоняются recovery_seconds,
+    затем пропускается один пробный запрос: успех закрывает breaker, сбой - снова открывает.
+    Каждое открытие начинает новое поколение; исходы запросов, пропущенных в прошлом
+    поколении (завершившихся после открытия), не меняют состояние.
+    """
+    
+    def __init__(self, name: str, failure_threshold: int, recovery_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.generation = 0
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self.rejected = 0
+        self.stale_outcomes = 0
+        self._probe_in_flight = False
+    
+    def before_call(self) -> int:
+        """Проверка перед запросом (CircuitOpenError, если запрос не пропускается), возвращает поколение"""
+        if self.state == "closed":
+            return self.generation
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= self.recovery_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return self.generation
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(0.0, self.recovery_seconds - elapsed))
+    
+    def _is_current(self, generation: int) -> bool:
+        if generation == self.generation:
+            return True
+        self.stale_outcomes += 1
+        return False
+    
+    def release_probe(self, generation: int):
+        """Пробный запрос отменен без исхода - следующий запрос станет пробным"""
+        # В half_open текущего поколения пропускается только пробный запрос
+        if self.state == "half_open" and generation == self.generation:
+            self._probe_in_flight = False
+    
+    def record_success(self, generation: int):
+        if not self._is_current(generation):
+            return
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = "closed"
+    
+    def record_failure(self, generation: int):
+        if not self._is_current(generation):
+            return
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened_count += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.generation += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+            "stale_outcomes": self.stale_outcomes
+        }
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами (как histogram в Prometheus)"""
+    
+    def __init__(self, buckets_ms: List[float] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+    
+    def observe(self, latency_ms: float):
+        self.counts[bisect_left(self.buckets_ms, latency_ms)] += 1
+        self.total += 1
+        self.sum_ms += latency_ms
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.total:
+            return None
+        rank = q * self.total
+        cumulative = 0
+        for bound, count in zip(self.buckets_ms + [float("inf")], self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+    
+    def stats(self) -> Dict[str, Any]:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets_ms + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.total,
+            "sum_ms": round(self.sum_ms, 2),
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+
+class UpstreamGuard:
+    """Вызовы одного upstream через breaker с повторами, hedging и бюджетом времени.
+    
+    Повторы и hedging - только для идемпотентных запросов (GET без тела): тело
+    потокового запроса нельзя отправить дважды. Бюджет ограничивает время до
+    получения заголовков ответа, включая все попытки и паузы между ними.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name,
+            gateway_settings.GATEWAY_BREAKER_FAILURE_THRESHOLD,
+            gateway_settings.GATEWAY_BREAKER_RECOVERY_SECONDS
+        )
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exceeded = 0
+    
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Экспоненциальная пауза с full jitter"""
+        cap = min(gateway_settings.GATEWAY_RETRY_MAX_DELAY_SECONDS, gateway_settings.GATEWAY_RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+        return random.uniform(0, cap)
+    
+    async def _attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Одна попытка через breaker с учетом задержки и исхода"""
+        generation = self.breaker.before_call()
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            response = await send()
+        except asyncio.CancelledError:
+            # Отмена (проигравший hedged-запрос, бюджет) - пробный слот breaker освобождается
+            self.breaker.release_probe(generation)
+            raise
+        except httpx.RequestError:
+            self.failures += 1
+            self.breaker.record_failure(generation)
+            raise
+        finally:
+            self.latency.observe((time.perf_counter() - started) * 1000)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            self.failures += 1
+            self.breaker.record_failure(generation)
+        else:
+            self.breaker.record_success(generation)
+        return response
+    
+    async def _hedged(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Основной запрос и дублирующий, если ответа нет дольше GATEWAY_HEDGE_DELAY_SECONDS"""
+        tasks = [asyncio.create_task(self._attempt(send))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=gateway_settings.GATEWAY_HEDGE_DELAY_SECONDS)
+            if not done and self.breaker.state == "closed":
+                self.hedges += 1
+                tasks.append(asyncio.create_task(self._attempt(send)))
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUS_CODES:
+                        winner = task
+                        break
+            # Все попытки неудачны - отдаем исход основной
+            winner = winner or tasks[0]
+        finally:
+            # В том числе при отмене по бюджету: незавершенные попытки отменяются,
+            # потоковые ответы, которые не будут отданы клиенту, возвращают соединение в пул
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            for task in tasks:
+                if task is not winner and task.done() and not task.cancelled() and task.exception() is None:
+                    await task.result().aclose()
+        if winner is not tasks[0]:
+            self.hedge_wins += 1
+        return winner.result()
+    
+    async def call(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        idempotent: bool,
+        budget: float,
+        hedge: bool = False
+    ) -> httpx.Response:
+        """Запрос с повторами (для идемпотентных) в пределах бюджета budget секунд"""
+        deadline = time.monotonic() + budget
+        # Таймаут относится к поколению breaker, в котором начат запрос
+        generation = self.breaker.generation
+        attempts = 1 + (gateway_settings.GATEWAY_RETRY_MAX_ATTEMPTS if idempotent else 0)
+        for attempt in range(attempts):
+            request = self._hedged(send) if hedge and idempotent else self._attempt(send)
+            error: Optional[httpx.RequestError] = None
+            try:
+                response = await asyncio.wait_for(request, timeout=deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                # Медленный upstream - такой же сбой для breaker, как недоступный
+                self.budget_exceeded += 1
+                self.failures += 1
+                self.breaker.record_failure(generation)
+                raise UpstreamTimeoutError(f"{self.name} did not respond within {budget}s")
+            except httpx.RequestError as e:
+                error = e
+            
+            # Повтор, только если после паузы останется время на попытку
+            delay = self._backoff(attempt)
+            can_retry = attempt < attempts - 1 and time.monotonic() + delay < deadline
+            if error is not None:
+                if not can_retry:
+                    raise error
+            elif response.status_code not in RETRYABLE_STATUS_CODES or not can_retry:
+                return response
+            else:
+                await response.aclose()
+            self.retries += 1
+            await asyncio.sleep(delay)
+        raise UpstreamTimeoutError(f"{self.name} did not respond within {budget}s")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "latency": self.latency.stats(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "budget_exceeded": self.budget_exceeded
+        }
@@ -0,0 +1,317 @@
+"""Кеш ответов upstream-сервисов для читающих маршрутов gateway"""
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import httpx
+import redis.asyncio as redis
+from fastapi.responses import Response
+from backend.api_gateway.config import gateway_settings
+
+# Заголовки, которые не сохраняются: тело кешируется уже распакованным, длину выставит Response
+UNCACHED_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "content-encoding", "content-length",
+    "date", "server", "set-cookie", "etag"
+}
+
+
+class CachedResponse:
+    """Сохраненный ответ upstream со сроком свежести и окном stale-while-revalidate"""
+    
+    def __init__(
+        self,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+        etag: str,
+        stored_at: float,
+        ttl: int,
+        stale_ttl: int,
+        generation: int = 0
+    ):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.stored_at = stored_at
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # Поколение пути в Redis на момент запроса к upstream
+        self.generation = generation
+    
+    @classmethod
+    def from_upstream(cls, response: httpx.Response, ttl: int, stale_ttl: int) -> "CachedResponse":
+        body = response.content
+        etag = response.headers.get("etag") or f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        headers = [
+            (name, value) for name, value in response.headers.multi_items()
+            if name.lower() not in UNCACHED_HEADERS
+        ]
+        return cls(response.status_code, headers, body, etag, time.time(), ttl, stale_ttl)
+    
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+    
+    def is_fresh(self) -> bool:
+        return self.age < self.ttl
+    
+    def is_servable(self) -> bool:
+        """Можно отдать (свежий или в окне stale-while-revalidate)"""
+        return self.age < self.ttl + self.stale_ttl
+    
+    def to_json(self) -> str:
+        return json.dumps({
+            "status_code": self.status_code,
+            "headers": self.headers,
+            "body": base64.b64encode(self.body).decode(),
+            "etag": self.etag,
+            "stored_at": self.stored_at,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "generation": self.generation
+        })
+    
+    @classmethod
+    def from_json(cls, data: str) -> "CachedResponse":
+        fields = json.loads(data)
+        fields["headers"] = [tuple(header) for header in fields["headers"]]
+        fields["body"] = base64.b64decode(fields["body"])
+        return cls(**fields)
+
+
+class ResponseCache:
+    """LRU-кеш ответов в памяти и (опционально) общий для реплик уровень в Redis.
+    
+    Ключ - путь gateway и отсортированные параметры запроса. Кешируются только 200.
+    Свежая запись отдается сразу; в окне stale-while-revalidate отдается устаревшая
+    запись и запускается фоновое обновление; конкурентные промахи по ключу
+    выполняют один запрос к upstream. Инвалидация - по пути (все варианты параметров).
+    
+    С Redis инвалидация увеличивает общее для реплик поколение пути; локальная запись
+    отдается, только если ее поколение совпадает с текущим (один GET в Redis на попадание),
+    поэтому изменение через одну реплику сразу видно на остальных.
+    """
+    
+    def __init__(self):
+        self.max_entries = gateway_settings.GATEWAY_CACHE_MAX_ENTRIES
+        self.max_entry_bytes = gateway_settings.GATEWAY_CACHE_MAX_ENTRY_BYTES
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._keys_by_path: Dict[str, Set[str]] = {}
+        # Поколение пути: ответ, запрошенный до инвалидации, не сохраняется после нее
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.redis: Optional[redis.Redis] = None
+        if gateway_settings.GATEWAY_CACHE_REDIS_ENABLED:
+            self.redis = redis.Redis(
+                host=gateway_settings.REDIS_HOST,
+                port=gateway_settings.REDIS_PORT,
+                decode_responses=True
+            )
+        self.counters = {"hit": 0, "stale": 0, "miss": 0, "coalesced": 0, "not_modified": 0, "invalidated": 0}
+    
+    @staticmethod
+    def make_key(path: str, query_items: List[Tuple[str, str]]) -> str:
+        query = "&".join(f"{name}={value}" for name, value in sorted(query_items))
+        return f"{path}?{query}"
+    
+    @staticmethod
+    def _path(key: str) -> str:
+        return key.split("?", 1)[0]
+    
+    @staticmethod
+    def _redis_key(key: str) -> str:
+        return f"gateway_cache:{key}"
+    
+    @staticmethod
+    def _redis_index_key(path: str) -> str:
+        return f"gateway_cache_index:{path}"
+    
+    @staticmethod
+    def _redis_generation_key(path: str) -> str:
+        return f"gateway_cache_generation:{path}"
+    
+    async def _remote_generation(self, path: str) -> Optional[int]:
+        """Общее поколение пути в Redis (None - Redis выключен или недоступен)"""
+        if self.redis is None:
+            return None
+        try:
+            return int(await self.redis.get(self._redis_generation_key(path)) or 0)
+        except redis.RedisError as e:
+            print(f"Gateway cache Redis read failed: {e}")
+            return None
+    
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and not entry.is_servable():
+            self._remove_local(key)
+            entry = None
+        if self.redis is None:
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+        
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(self._redis_generation_key(self._path(key)))
+            if entry is None:
+                pipe.get(self._redis_key(key))
+            results = await pipe.execute()
+        except redis.RedisError as e:
+            # Без Redis поколение не проверить - отдается локальная запись
+            print(f"Gateway cache Redis read failed: {e}")
+            return entry
+        generation = int(results[0] or 0)
+        
+        if entry is not None:
+            if entry.generation == generation:
+                self._entries.move_to_end(key)
+                return entry
+            # Путь инвалидирован на другой реплике
+            self._remove_local(key)
+            return None
+        if not results[1]:
+            return None
+        entry = CachedResponse.from_json(results[1])
+        if entry.generation != generation or not entry.is_servable():
+            return None
+        self._put_local(key, entry)
+        return entry
+    
+    def _put_local(self, key: str, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._keys_by_path.setdefault(self._path(key), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._forget_key(evicted_key)
+    
+    def _remove_local(self, key: str):
+        self._entries.pop(key, None)
+        self._forget_key(key)
+    
+    def _forget_key(self, key: str):
+        path = self._path(key)
+        keys = self._keys_by_path.get(path)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_path[path]
+    
+    async def _put(self, key: str, entry: CachedResponse):
+        self._put_local(key, entry)
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.setex(self._redis_key(key), entry.ttl + entry.stale_ttl, entry.to_json())
+            pipe.sadd(self._redis_index_key(self._path(key)), key)
+            pipe.expire(self._redis_index_key(self._path(key)), entry.ttl + entry.stale_ttl)
+            await pipe.execute()
+        except redis.RedisError as e:
+            print(f"Gateway cache Redis write failed: {e}")
+    
+    def _start_load(self, key: str, fetch: Callable[[], Awaitable[CachedResponse]]) -> asyncio.Task:
+        """Задача запроса к upstream с сохранением успешного ответа (одна на ключ)"""
+        task = self._inflight.get(key)
+        if task is not None:
+            return task
+        path = self._path(key)
+        generation = self._generations.get(path, 0)
+        
+        async def load() -> CachedResponse:
+            remote_generation = await self._remote_generation(path)
+            entry = await fetch()
+            cacheable = entry.status_code == 200 and len(entry.body) <= self.max_entry_bytes
+            if cacheable and self._generations.get(path, 0) == generation:
+                if remote_generation is None:
+                    await self._put(key, entry)
+                elif await self._remote_generation(path) == remote_generation:
+                    # Ответ, запрошенный до инвалидации на любой реплике, не сохраняется
+                    entry.generation = remote_generation
+                    await self._put(key, entry)
+            return entry
+        
+        task = asyncio.create_task(load())
+        self._inflight[key] = task
+        
+        def _done(finished: asyncio.Task):
+            self._inflight.pop(key, None)
+            # Ошибка фонового обновления (без ожидающих) только логируется
+            if not finished.cancelled() and finished.exception() is not None:
+                print(f"Gateway cache load failed for {key}: {finished.exception()}")
+        
+        task.add_done_callback(_done)
+        return task
+    
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[CachedResponse]]) -> Tuple[CachedResponse, str]:
+        """Ответ из кеша или от upstream: (ответ, hit / stale / miss / coalesced)"""
+        entry = await self._get(key)
+        if entry is not None and entry.is_fresh():
+            state = "hit"
+        elif entry is not None:
+            # Stale-while-revalidate: отдаем устаревший ответ, обновляем в фоне
+            state = "stale"
+            self._start_load(key, fetch)
+        else:
+            state = "coalesced" if key in self._inflight else "miss"
+            # shield: отключение клиента не отменяет запрос для остальных ожидающих
+            entry = await asyncio.shield(self._start_load(key, fetch))
+        self.counters[state] += 1
+        return entry, state
+    
+    def respond(self, entry: CachedResponse, state: str, if_none_match: Optional[str]) -> Response:
+        """HTTP-ответ из записи кеша: 304 при совпадении ETag"""
+        max_age = max(0, int(entry.ttl - entry.age))
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": f"max-age={max_age}, stale-while-revalidate={entry.stale_ttl}",
+            "Age": str(int(entry.age)),
+            "X-Cache": state.upper()
+        }
+        if entry.status_code == 200 and if_none_match and entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.counters["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        response = Response(content=entry.body, status_code=entry.status_code, headers=headers)
+        response.raw_headers.extend(
+            (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in entry.headers
+        )
+        return response
+    
+    async def invalidate(self, paths: List[str]) -> int:
+        """Удаление всех записей путей (в памяти, в Redis и на других репликах), возвращает число локальных записей"""
+        removed = 0
+        for path in paths:
+            self._generations[path] = self._generations.get(path, 0) + 1
+            for key in list(self._keys_by_path.get(path, ())):
+                self._remove_local(key)
+                removed += 1
+        self.counters["invalidated"] += removed
+        
+        if self.redis is not None:
+            try:
+                for path in paths:
+                    # Новое поколение делает недействительными локальные записи всех реплик
+                    await self.redis.incr(self._redis_generation_key(path))
+                    index_key = self._redis_index_key(path)
+                    keys = await self.redis.smembers(index_key)
+                    await self.redis.delete(index_key, *(self._redis_key(key) for key in keys))
+            except redis.RedisError as e:
+                print(f"Gateway cache Redis invalidation failed: {e}")
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "redis_enabled": self.redis is not None,
+            "inflight": len(self._inflight),
+            **self.counters
+        }
+    
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
@@ -3,6 +3,7 @@ from backend.feature_pipeline.clickhouse_client import FeatureClickHouseClient
 from backend.feature_pipeline.redis_client import FeatureRedisClient
 from backend.feature_pipeline.s3_client import FeatureS3Client
 from backend.feature_pipeline.feature_engineering import FeatureEngineer
+from backend.feature_pipeline.config import feature_settings
 from datetime import datetime, timedelta
 import pandas as pd
 from typing import List, Dict, Any
@@ -15,15 +16,17 @@ class BatchFeatureProcessor:
         self.s3 = FeatureS3Client()
         self.feature_engineer = FeatureEngineer()
     
-    def process_asset(self, asset_id: str, start_time: datetime, end_time: datetime):
-        """Обработка фичей для актива"""
+    def process_asset(self, asset_id: str, start_time: datetime, end_time: datetime) -> int:
+        """Обработка фичей для актива (возвращает число строк фичей)"""
         # Получение данных
         market_data = self.clickhouse.get_market_data(asset_id, start_time, end_time)
         if market_data.empty:
             print(f"No market data for {asset_id}")
-            return
+            return 0
         
-        news_data = self.clickhouse.get_news_data(asset_id, start_time, end_time)
+        # Новости берутся с запасом на самое длинное окно новостных признаков
+        news_start = start_time - timedelta(hours=max(FeatureEngineer.NEWS_WINDOWS_HOURS))
+        news_data = self.clickhouse.get_news_data(asset_id, news_start, end_time)
         
         # Вычисление фичей
         features_df = self.feature_engineer.compute_features(market_data, news_data)
@@ -33,11 +36,12 @@ class BatchFeatureProcessor:
         
         if features_df.empty:
             print(f"No features computed for {asset_id}")
-            return
+            return 0
+        
+        # Дозапись новых строк в Parquet-датасет S3
+        self.s3.save_features_parquet(asset_id, features_df)
         
-        # Сохранение в S3 (Parquet)
         latest_timestamp = features_df['timestamp'].max()
-        self.s3.save_features_parquet(asset_id, features_df, latest_timestamp)
         
         # Сохранение последних фичей в Redis
         latest_row = features_df.iloc[-1]
@@ -45,19 +49,11 @@ class BatchFeatureProcessor:
         self.redis.save_features(asset_id, features_dict, latest_timestamp)
         
         # Сохранение в ClickHouse (опционально, для аналитики)
-        clickhouse_features = []
-        for _, row in features_df.iterrows():
-            for col in features_df.columns:
-                if col != 'timestamp':
-                    clickhouse_features.append({
-                        'asset_id': asset_id,
-                        'timestamp': row['timestamp'],
-                        'feature_name': col,
-                        'feature_value': float(row[col]) if pd.notna(row[col]) else 0.0
-                    })
-        
-        if clickhouse_features:
-            self.clickhouse.save_features(clickhouse_features)
+        if feature_settings.CLICKHOUSE_FEATURES_LAYOUT == "wide":
+            self.clickhouse.save_features_wide(asset_id, features_df)
+        else:
+            self.clickhouse.save_features_long(asset_id, features_df)
         
         print(f"Processed {len(features_df)} feature rows for {asset_id}")
+        return len(features_df)
 
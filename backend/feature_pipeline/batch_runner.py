@@ -0,0 +1,270 @@
+"""Параллельный batch-расчет фичей по множеству активов"""
+from backend.feature_pipeline.config import feature_settings
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Union
+import multiprocessing
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+import httpx
+
+# Процессор создается один раз на процесс пула (свои соединения с ClickHouse/S3/Redis)
+_worker_processor = None
+
+
+def _init_worker():
+    global _worker_processor
+    from backend.feature_pipeline.batch_processor import BatchFeatureProcessor
+    _worker_processor = BatchFeatureProcessor()
+
+
+def _process_asset(asset_id: str, start_time: datetime, end_time: datetime) -> Dict[str, Any]:
+    """Обработка одного актива в процессе пула"""
+    started = time.perf_counter()
+    try:
+        rows = _worker_processor.process_asset(asset_id, start_time, end_time)
+        return {
+            "asset_id": asset_id,
+            "status": "completed",
+            "rows": rows,
+            "duration_seconds": time.perf_counter() - started
+        }
+    except Exception as e:
+        return {
+            "asset_id": asset_id,
+            "status": "failed",
+            "error": str(e),
+            "duration_seconds": time.perf_counter() - started
+        }
+
+
+class BatchJob:
+    """Состояние batch-задачи: прогресс и тайминги по каждому активу"""
+    
+    def __init__(self, asset_ids: List[str], start_time: datetime, end_time: datetime, job_id: Optional[str] = None):
+        self.job_id = job_id or str(uuid.uuid4())
+        self.start_time = start_time
+        self.end_time = end_time
+        self.assets: Dict[str, Dict[str, Any]] = {
+            asset_id: {"asset_id": asset_id, "status": "pending"} for asset_id in asset_ids
+        }
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # Ставится при постановке запуска (до старта задачи), снимается в _finish
+        self.running = False
+    
+    def pending_assets(self) -> List[str]:
+        """Активы, которые еще не обработаны успешно"""
+        return [asset_id for asset_id, state in self.assets.items() if state["status"] != "completed"]
+    
+    def failed_assets(self) -> List[str]:
+        return [asset_id for asset_id, state in self.assets.items() if state["status"] == "failed"]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for state in self.assets.values():
+            counts[state["status"]] = counts.get(state["status"], 0) + 1
+        return {
+            "job_id": self.job_id,
+            "start_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "running": self.running,
+            "total": len(self.assets),
+            "counts": counts,
+            "assets": list(self.assets.values())
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BatchJob":
+        job = cls(
+            [state["asset_id"] for state in data["assets"]],
+            datetime.fromisoformat(data["start_time"]),
+            datetime.fromisoformat(data["end_time"]),
+            job_id=data["job_id"]
+        )
+        for state in data["assets"]:
+            job.assets[state["asset_id"]] = state
+        return job
+
+
+class BatchFeatureRunner:
+    """Шардирование активов по ProcessPoolExecutor.
+    
+    Число процессов ограничивает и конкурентность запросов к ClickHouse/S3/Redis:
+    каждый процесс обрабатывает один актив за раз через свои соединения.
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or feature_settings.FEATURE_BATCH_MAX_WORKERS
+        self.jobs: Dict[str, BatchJob] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._executor
+    
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        """Сломанный пул (упал процесс) заменяется новым при следующем запуске"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def create_job(self, asset_ids: List[str], start_time: datetime, end_time: datetime) -> BatchJob:
+        job = BatchJob(asset_ids, start_time, end_time)
+        self.jobs[job.job_id] = job
+        return job
+    
+    def _on_result(self, job: BatchJob, result: Dict[str, Any]):
+        job.assets[result["asset_id"]] = result
+        print(
+            f"[{job.job_id}] {result['asset_id']}: {result['status']} "
+            f"in {result['duration_seconds']:.2f}s"
+        )
+    
+    def _on_error(self, job: BatchJob, asset_id: str, error: BaseException):
+        """Ошибка вне _process_asset (падение процесса пула) - актив помечается неуспешным"""
+        self._on_result(job, {
+            "asset_id": asset_id,
+            "status": "failed",
+            "error": f"{type(error).__name__}: {error}",
+            "duration_seconds": 0.0
+        })
+    
+    def _start(self, job: BatchJob) -> List[str]:
+        asset_ids = job.pending_assets()
+        for asset_id in asset_ids:
+            job.assets[asset_id] = {"asset_id": asset_id, "status": "running"}
+        job.started_at = datetime.utcnow()
+        job.finished_at = None
+        return asset_ids
+    
+    def _finish(self, job: BatchJob):
+        """Завершение запуска; прерванные активы остаются доступными для retry"""
+        for asset_id, state in job.assets.items():
+            if state["status"] == "running":
+                job.assets[asset_id] = {"asset_id": asset_id, "status": "failed", "error": "interrupted"}
+        job.finished_at = datetime.utcnow()
+        job.running = False
+    
+    def _submit(self, job: BatchJob) -> Tuple[ProcessPoolExecutor, Dict[Future, str]]:
+        executor = self._get_executor()
+        futures = {}
+        try:
+            for asset_id in self._start(job):
+                futures[executor.submit(_process_asset, asset_id, job.start_time, job.end_time)] = asset_id
+        except BrokenProcessPool as e:
+            self._reset_executor(executor)
+            for asset_id in job.pending_assets():
+                if asset_id not in futures.values():
+                    self._on_error(job, asset_id, e)
+        return executor, futures
+    
+    def _collect(self, job: BatchJob, executor: ProcessPoolExecutor, asset_id: str, future: Union[Future, asyncio.Future]):
+        if future.cancelled():
+            # Задачи отменяются при остановке или замене сломанного пула
+            self._on_error(job, asset_id, RuntimeError("cancelled"))
+            return
+        try:
+            self._on_result(job, future.result())
+        except BrokenProcessPool as e:
+            self._reset_executor(executor)
+            self._on_error(job, asset_id, e)
+        except Exception as e:
+            self._on_error(job, asset_id, e)
+    
+    def run(self, job: BatchJob) -> BatchJob:
+        """Синхронный запуск (CLI): обрабатываются только незавершенные активы"""
+        job.running = True
+        try:
+            executor, futures = self._submit(job)
+            for future in as_completed(futures):
+                self._collect(job, executor, futures[future], future)
+        finally:
+            self._finish(job)
+        return job
+    
+    async def run_async(self, job: BatchJob) -> BatchJob:
+        """Асинхронный запуск (API): не блокирует event loop"""
+        try:
+            executor, futures = self._submit(job)
+            pending = {asyncio.wrap_future(future): asset_id for future, asset_id in futures.items()}
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for wrapped in done:
+                    self._collect(job, executor, pending.pop(wrapped), wrapped)
+        finally:
+            self._finish(job)
+        return job
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def fetch_asset_ids(asset_service_url: str = feature_settings.ASSET_SERVICE_URL) -> List[str]:
+    """Получение списка всех активов из Asset Service"""
+    asset_ids = []
+    skip, limit = 0, 1000
+    with httpx.Client(timeout=30.0) as client:
+        while True:
+            response = client.get(f"{asset_service_url}/assets", params={"skip": skip, "limit": limit})
+            response.raise_for_status()
+            assets = response.json()
+            asset_ids.extend(asset["id"] for asset in assets)
+            if len(assets) < limit:
+                return asset_ids
+            skip += limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-расчет фичей по множеству активов")
+    parser.add_argument("--assets", nargs="*", help="ID активов (по умолчанию - все из Asset Service)")
+    parser.add_argument("--days", type=int, default=30, help="Глубина истории в днях")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов")
+    parser.add_argument("--state-file", default=None, help="Файл прогресса; при повторном запуске обрабатываются только незавершенные активы")
+    args = parser.parse_args()
+    
+    if args.state_file and os.path.exists(args.state_file):
+        with open(args.state_file) as f:
+            job = BatchJob.from_dict(json.load(f))
+        print(f"Resuming job {job.job_id}: {len(job.pending_assets())} assets left")
+    else:
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(days=args.days)
+        asset_ids = args.assets or fetch_asset_ids()
+        job = BatchJob(asset_ids, start_time, end_time)
+    
+    if feature_settings.CLICKHOUSE_FEATURES_LAYOUT == "wide":
+        from backend.feature_pipeline.clickhouse_client import FeatureClickHouseClient
+        FeatureClickHouseClient().verify_wide_schema()
+    
+    runner = BatchFeatureRunner(max_workers=args.workers)
+    try:
+        runner.run(job)
+    finally:
+        runner.shutdown()
+        if args.state_file:
+            with open(args.state_file, "w") as f:
+                json.dump(job.to_dict(), f, indent=2)
+    
+    summary = job.to_dict()
+    print(f"Job {job.job_id} finished: {summary['counts']}")
+    if job.failed_assets():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
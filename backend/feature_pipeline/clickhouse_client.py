@@ -1,8 +1,10 @@
 """Клиент для работы с ClickHouse"""
 from clickhouse_driver import Client
 from backend.feature_pipeline.config import feature_settings
+from backend.feature_pipeline.feature_engineering import FeatureEngineer
 import pandas as pd
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
 
 
@@ -16,52 +18,83 @@ class FeatureClickHouseClient:
             database=feature_settings.CLICKHOUSE_DB
         )
     
-    def get_market_data(self, asset_id: str, start_time: datetime, end_time: datetime) -> pd.DataFrame:
-        """Получение рыночных данных"""
-        query = """
+    MARKET_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    NEWS_COLUMNS = ['timestamp', 'sentiment', 'importance']
+    
+    def _query_assets(
+        self,
+        table: str,
+        columns: List[str],
+        asset_ids: List[str],
+        start_time: datetime,
+        end_time: datetime
+    ) -> pd.DataFrame:
+        """Выборка по нескольким активам одним запросом в колоночном режиме"""
+        query = f"""
         SELECT 
-            timestamp,
-            open,
-            high,
-            low,
-            close,
-            volume
-        FROM market_data
-        WHERE asset_id = %s
-        AND timestamp >= %s
-        AND timestamp <= %s
-        ORDER BY timestamp
+            asset_id,
+            {", ".join(columns)}
+        FROM {table}
+        WHERE asset_id IN %(asset_ids)s
+        AND timestamp >= %(start_time)s
+        AND timestamp <= %(end_time)s
+        ORDER BY asset_id, timestamp
         """
+        params = {'asset_ids': tuple(asset_ids), 'start_time': start_time, 'end_time': end_time}
         
-        result = self.client.execute(query, [asset_id, start_time, end_time])
+        # columnar=True возвращает колонки целиком, без построчных кортежей
+        result = self.client.execute(query, params, columnar=True)
         
-        if not result:
-            return pd.DataFrame()
+        if not result or not result[0]:
+            return pd.DataFrame(columns=['asset_id'] + columns)
         
-        df = pd.DataFrame(result, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        return df
+        return pd.DataFrame(dict(zip(['asset_id'] + columns, result)))
+    
+    @staticmethod
+    def _split_by_asset(df: pd.DataFrame, asset_ids: List[str]) -> Dict[str, pd.DataFrame]:
+        frames = {
+            asset_id: group.drop(columns=['asset_id']).reset_index(drop=True)
+            for asset_id, group in df.groupby('asset_id', sort=False)
+        }
+        return {asset_id: frames.get(asset_id, pd.DataFrame()) for asset_id in asset_ids}
+    
+    def get_market_data_bulk(
+        self,
+        asset_ids: List[str],
+        start_time: datetime,
+        end_time: datetime,
+        as_frame: bool = False
+    ) -> Union[Dict[str, pd.DataFrame], pd.DataFrame]:
+        """Получение рыночных данных по нескольким активам одним запросом.
+        
+        Возвращает dict asset_id -> DataFrame или, при as_frame=True,
+        один DataFrame с MultiIndex (asset_id, timestamp).
+        """
+        df = self._query_assets('market_data', self.MARKET_COLUMNS, asset_ids, start_time, end_time)
+        if as_frame:
+            return df.set_index(['asset_id', 'timestamp'])
+        return self._split_by_asset(df, asset_ids)
+    
+    def get_news_data_bulk(
+        self,
+        asset_ids: List[str],
+        start_time: datetime,
+        end_time: datetime,
+        as_frame: bool = False
+    ) -> Union[Dict[str, pd.DataFrame], pd.DataFrame]:
+        """Получение новостей по нескольким активам одним запросом"""
+        df = self._query_assets('news_feed', self.NEWS_COLUMNS, asset_ids, start_time, end_time)
+        if as_frame:
+            return df.set_index(['asset_id', 'timestamp'])
+        return self._split_by_asset(df, asset_ids)
+    
+    def get_market_data(self, asset_id: str, start_time: datetime, end_time: datetime) -> pd.DataFrame:
+        """Получение рыночных данных"""
+        return self.get_market_data_bulk([asset_id], start_time, end_time)[asset_id]
     
     def get_news_data(self, asset_id: str, start_time: datetime, end_time: datetime) -> pd.DataFrame:
         """Получение новостей"""
-        query = """
-        SELECT 
-            timestamp,
-            sentiment,
-            importance
-        FROM news_feed
-        WHERE asset_id = %s
-        AND timestamp >= %s
-        AND timestamp <= %s
-        ORDER BY timestamp
-        """
-        
-        result = self.client.execute(query, [asset_id, start_time, end_time])
-        
-        if not result:
-            return pd.DataFrame()
-        
-        df = pd.DataFrame(result, columns=['timestamp', 'sentiment', 'importance'])
-        return df
+        return self.get_news_data_bulk([asset_id], start_time, end_time)[asset_id]
     
     def save_features(self, features: List[Dict[str, Any]]):
         """Сохранение фичей в ClickHouse"""
@@ -77,3 +110,128 @@ class FeatureClickHouseClient:
             features
         )
 
+    
+    @staticmethod
+    def _feature_matrix(df: pd.DataFrame):
+        """Колонки фичей, timestamps и матрица значений (NaN -> 0.0)"""
+        feature_cols = [col for col in df.columns if col != 'timestamp']
+        values = np.nan_to_num(df[feature_cols].to_numpy(dtype=np.float64), nan=0.0)
+        timestamps = np.asarray(pd.to_datetime(df['timestamp']).dt.to_pydatetime(), dtype=object)
+        return feature_cols, timestamps, values
+    
+    def save_features_long(self, asset_id: str, df: pd.DataFrame):
+        """Колоночная вставка фичей в long-формате (таблица features).
+        
+        Вместо dict на каждую пару (строка, фича) разворачивает матрицу фичей
+        в четыре массива и передает их драйверу с columnar=True.
+        """
+        if df.empty:
+            return
+        
+        feature_cols, timestamps, values = self._feature_matrix(df)
+        n_rows, n_features = values.shape
+        
+        self.client.execute(
+            """
+            INSERT INTO features 
+            (asset_id, timestamp, feature_name, feature_value)
+            VALUES
+            """,
+            [
+                [asset_id] * (n_rows * n_features),
+                np.repeat(timestamps, n_features).tolist(),
+                feature_cols * n_rows,
+                values.ravel().tolist()
+            ],
+            columnar=True
+        )
+    
+    def verify_wide_schema(self):
+        """Сверка колонок features_wide с FeatureEngineer.feature_names() (вызывается при старте).
+        
+        Расхождение схемы иначе проявится только на вставке посреди batch-расчета.
+        """
+        rows = self.client.execute("DESCRIBE TABLE features_wide")
+        expected = ['asset_id', 'timestamp'] + FeatureEngineer.feature_names()
+        # Колонки с выражением по умолчанию (created_at) заполняет сама таблица
+        required = [row[0] for row in rows if not row[2]]
+        missing = [name for name in expected if name not in {row[0] for row in rows}]
+        unexpected = [name for name in required if name not in expected]
+        if missing or unexpected:
+            raise RuntimeError(
+                f"features_wide schema does not match FeatureEngineer.feature_names(): "
+                f"missing columns {missing}, columns without default not computed {unexpected}"
+            )
+    
+    def save_features_wide(self, asset_id: str, df: pd.DataFrame):
+        """Колоночная вставка фичей в wide-формате (таблица features_wide, колонка на фичу).
+        
+        Набор колонок - FeatureEngineer.feature_names(), а не колонки df: отсутствующая
+        фича - ошибка до вставки, лишние колонки df в таблицу не пишутся.
+        """
+        if df.empty:
+            return
+        
+        feature_cols = FeatureEngineer.feature_names()
+        missing = [col for col in feature_cols if col not in df.columns]
+        if missing:
+            raise ValueError(f"Features missing for features_wide: {missing}")
+        feature_cols, timestamps, values = self._feature_matrix(df[['timestamp'] + feature_cols])
+        columns = ", ".join(["asset_id", "timestamp"] + feature_cols)
+        
+        self.client.execute(
+            f"INSERT INTO features_wide ({columns}) VALUES",
+            [[asset_id] * len(df), timestamps.tolist()] + [values[:, i].tolist() for i in range(len(feature_cols))],
+            columnar=True
+        )
+    
+    def get_features(
+        self,
+        asset_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        feature_names: Optional[List[str]] = None,
+        layout: str = "long"
+    ) -> pd.DataFrame:
+        """Получение фичей в виде таблицы timestamp x фичи"""
+        if layout == "wide":
+            columns = ", ".join(["timestamp"] + feature_names) if feature_names else "*"
+            query = f"""
+            SELECT {columns}
+            FROM features_wide
+            WHERE asset_id = %(asset_id)s
+            AND timestamp >= %(start_time)s
+            AND timestamp <= %(end_time)s
+            ORDER BY timestamp
+            """
+            params = {'asset_id': asset_id, 'start_time': start_time, 'end_time': end_time}
+            result, column_types = self.client.execute(query, params, with_column_types=True, columnar=True)
+            if not result or not result[0]:
+                return pd.DataFrame()
+            df = pd.DataFrame({name: values for (name, _), values in zip(column_types, result)})
+            return df.drop(columns=['asset_id', 'created_at'], errors='ignore')
+        
+        query = """
+        SELECT 
+            timestamp,
+            feature_name,
+            feature_value
+        FROM features
+        WHERE asset_id = %(asset_id)s
+        AND timestamp >= %(start_time)s
+        AND timestamp <= %(end_time)s
+        """
+        params = {'asset_id': asset_id, 'start_time': start_time, 'end_time': end_time}
+        if feature_names:
+            query += "AND feature_name IN %(feature_names)s\n"
+            params['feature_names'] = tuple(feature_names)
+        query += "ORDER BY timestamp"
+        
+        result = self.client.execute(query, params, columnar=True)
+        if not result or not result[0]:
+            return pd.DataFrame()
+        
+        long_df = pd.DataFrame({'timestamp': result[0], 'feature_name': result[1], 'feature_value': result[2]})
+        df = long_df.pivot_table(index='timestamp', columns='feature_name', values='feature_value', aggfunc='last')
+        df.columns.name = None
+        return df.reset_index()
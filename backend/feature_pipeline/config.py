@@ -18,6 +18,20 @@ class FeaturePipelineSettings(BaseSettings):
     MINIO_SECRET_KEY: str = settings.MINIO_SECRET_KEY
     MINIO_BUCKET_FEATURES: str = settings.MINIO_BUCKET_FEATURES
     
+    # Parquet-датасет фичей: размер row group (неделя часовых баров) и порог компакции part-файлов месяца
+    FEATURE_PARQUET_ROW_GROUP_SIZE: int = 168
+    FEATURE_PARQUET_COMPACT_THRESHOLD: int = 24
+    # Попытки условной записи манифеста датасета при конкурентных писателях
+    FEATURE_MANIFEST_MAX_RETRIES: int = 10
+    
+    ASSET_SERVICE_URL: str = settings.ASSET_SERVICE_URL
+    
+    # Число процессов для batch-расчета по множеству активов
+    FEATURE_BATCH_MAX_WORKERS: int = 4
+    
+    # Формат таблицы фичей в ClickHouse: "long" (features, EAV) или "wide" (features_wide)
+    CLICKHOUSE_FEATURES_LAYOUT: str = "long"
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -8,6 +8,41 @@ from datetime import datetime, timedelta
 class FeatureEngineer:
     """Класс для вычисления фичей"""
     
+    # Параметры фичей (общие для batch и инкрементального вычисления)
+    CLOSE_LAGS = [1, 2, 3, 5, 10, 20]
+    CLOSE_MA_WINDOWS = [5, 10, 20, 50]
+    VOLUME_MA_WINDOWS = [5, 10, 20]
+    CLOSE_VOLATILITY_WINDOWS = [5, 10, 20]
+    NEWS_WINDOWS_HOURS = [1, 6, 24]
+    
+    # Колонки, которые compute_features добавляет к рыночным данным, кроме окон выше
+    MARKET_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+    CALENDAR_FEATURES = ['hour', 'day_of_week', 'day_of_month', 'month', 'is_weekend']
+    NEWS_FEATURES = ['news_count', 'avg_sentiment', 'max_sentiment', 'min_sentiment', 'avg_importance', 'negative_news_count']
+    NEWS_WINDOW_FEATURES = [
+        'news_count', 'news_sentiment_mean', 'news_sentiment_min',
+        'news_sentiment_max', 'news_negative_count', 'news_importance_mean'
+    ]
+    DERIVED_FEATURES = ['price_change', 'high_low_ratio', 'volume_price_trend']
+    
+    @classmethod
+    def feature_names(cls) -> List[str]:
+        """Колонки результата compute_features (без timestamp) в порядке вычисления.
+        
+        Единый список для хранилищ с фиксированной схемой (ClickHouse features_wide).
+        """
+        return (
+            cls.MARKET_COLUMNS
+            + [f"close_lag_{lag}" for lag in cls.CLOSE_LAGS]
+            + [f"close_ma_{window}" for window in cls.CLOSE_MA_WINDOWS]
+            + [f"volume_ma_{window}" for window in cls.VOLUME_MA_WINDOWS]
+            + [f"close_volatility_{window}" for window in cls.CLOSE_VOLATILITY_WINDOWS]
+            + cls.CALENDAR_FEATURES
+            + cls.NEWS_FEATURES
+            + [f"{name}_{hours}h" for hours in cls.NEWS_WINDOWS_HOURS for name in cls.NEWS_WINDOW_FEATURES]
+            + cls.DERIVED_FEATURES
+        )
+    
     @staticmethod
     def calculate_lags(df: pd.DataFrame, column: str, lags: List[int] = [1, 2, 3, 5, 10]) -> pd.DataFrame:
         """Вычисление лагов"""
@@ -62,33 +97,85 @@ class FeatureEngineer:
             "negative_news_count": int((news_df['sentiment'] < 0).sum()) if 'sentiment' in news_df.columns else 0
         }
     
+    @staticmethod
+    def _window_reduce(ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Агрегация values[start:end] для каждой пары границ одним вызовом reduceat"""
+        # Sentinel в конце, чтобы граница end == len(values) была валидным индексом
+        padded = np.append(values, 0.0)
+        bounds = np.empty(len(starts) * 2, dtype=np.int64)
+        bounds[0::2] = starts
+        bounds[1::2] = ends
+        reduced = ufunc.reduceat(padded, bounds)[0::2]
+        return np.where(ends > starts, reduced, 0.0)
+    
+    @classmethod
+    def calculate_rolling_news_features(cls, timestamps: pd.Series, news_df: pd.DataFrame) -> pd.DataFrame:
+        """Признаки новостей по скользящим окнам (as-of на момент каждого бара).
+        
+        Для бара t учитываются только новости из интервала (t - window, t],
+        поэтому будущие новости не попадают в прошлые строки.
+        """
+        bar_times = pd.to_datetime(timestamps).to_numpy(dtype='datetime64[ns]')
+        if news_df is not None and not news_df.empty:
+            news = news_df.sort_values('timestamp')
+            news_times = pd.to_datetime(news['timestamp']).to_numpy(dtype='datetime64[ns]')
+            sentiment = news['sentiment'].to_numpy(dtype=np.float64) if 'sentiment' in news.columns else np.zeros(len(news))
+            importance = news['importance'].to_numpy(dtype=np.float64) if 'importance' in news.columns else np.zeros(len(news))
+        else:
+            news_times = np.array([], dtype='datetime64[ns]')
+            sentiment = np.array([], dtype=np.float64)
+            importance = np.array([], dtype=np.float64)
+        
+        # Кумулятивные суммы: count/sum/negative по окну = разность двух префиксов
+        cum_sentiment = np.concatenate([[0.0], np.cumsum(sentiment)])
+        cum_importance = np.concatenate([[0.0], np.cumsum(importance)])
+        cum_negative = np.concatenate([[0], np.cumsum(sentiment < 0)])
+        
+        ends = np.searchsorted(news_times, bar_times, side='right')
+        features = {}
+        for hours in cls.NEWS_WINDOWS_HOURS:
+            starts = np.searchsorted(news_times, bar_times - np.timedelta64(hours, 'h'), side='right')
+            count = ends - starts
+            safe_count = np.maximum(count, 1)
+            features[f"news_count_{hours}h"] = count
+            features[f"news_sentiment_mean_{hours}h"] = np.where(count > 0, (cum_sentiment[ends] - cum_sentiment[starts]) / safe_count, 0.0)
+            features[f"news_sentiment_min_{hours}h"] = cls._window_reduce(np.minimum, sentiment, starts, ends)
+            features[f"news_sentiment_max_{hours}h"] = cls._window_reduce(np.maximum, sentiment, starts, ends)
+            features[f"news_negative_count_{hours}h"] = cum_negative[ends] - cum_negative[starts]
+            features[f"news_importance_mean_{hours}h"] = np.where(count > 0, (cum_importance[ends] - cum_importance[starts]) / safe_count, 0.0)
+        
+        # Агрегаты прежнего формата - как окно 24 часа
+        longest = max(cls.NEWS_WINDOWS_HOURS)
+        legacy = {
+            "news_count": features[f"news_count_{longest}h"],
+            "avg_sentiment": features[f"news_sentiment_mean_{longest}h"],
+            "max_sentiment": features[f"news_sentiment_max_{longest}h"],
+            "min_sentiment": features[f"news_sentiment_min_{longest}h"],
+            "avg_importance": features[f"news_importance_mean_{longest}h"],
+            "negative_news_count": features[f"news_negative_count_{longest}h"],
+        }
+        return pd.DataFrame({**legacy, **features}, index=timestamps.index)
+    
     def compute_features(self, market_data: pd.DataFrame, news_data: pd.DataFrame = None) -> pd.DataFrame:
         """Вычисление всех фичей"""
         df = market_data.copy()
         
         # Лаги цены закрытия
-        df = self.calculate_lags(df, 'close', lags=[1, 2, 3, 5, 10, 20])
+        df = self.calculate_lags(df, 'close', lags=self.CLOSE_LAGS)
         
         # Скользящие средние
-        df = self.calculate_moving_averages(df, 'close', windows=[5, 10, 20, 50])
-        df = self.calculate_moving_averages(df, 'volume', windows=[5, 10, 20])
+        df = self.calculate_moving_averages(df, 'close', windows=self.CLOSE_MA_WINDOWS)
+        df = self.calculate_moving_averages(df, 'volume', windows=self.VOLUME_MA_WINDOWS)
         
         # Волатильность
-        df = self.calculate_volatility(df, 'close', windows=[5, 10, 20])
+        df = self.calculate_volatility(df, 'close', windows=self.CLOSE_VOLATILITY_WINDOWS)
         
         # Календарные признаки
         df = self.calculate_calendar_features(df)
         
-        # Признаки новостей (агрегированные)
-        if news_data is not None and not news_data.empty:
-            news_features = self.calculate_news_features(news_data)
-            for key, value in news_features.items():
-                df[key] = value
-        else:
-            # Заполнение нулями, если новостей нет
-            news_features = self.calculate_news_features(pd.DataFrame())
-            for key, value in news_features.items():
-                df[key] = value
+        # Признаки новостей (скользящие окна, выровненные по времени баров)
+        news_features = self.calculate_rolling_news_features(df['timestamp'], news_data)
+        df = pd.concat([df, news_features], axis=1)
         
         # Дополнительные признаки
         df['price_change'] = df['close'].pct_change()
@@ -0,0 +1,175 @@
+"""Инкрементальное (потоковое) вычисление фичей"""
+from backend.feature_pipeline.feature_engineering import FeatureEngineer
+from collections import deque
+from datetime import datetime
+import math
+import pandas as pd
+from typing import Dict, Any, Optional, Deque
+
+
+class RollingWindow:
+    """Скользящее окно с накопленными суммой и суммой квадратов (O(1) на обновление)"""
+
+    # Через сколько обновлений пересчитывать суммы по буферу (защита от накопления ошибки)
+    RESYNC_INTERVAL = 10_000
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: Deque[float] = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.updates = 0
+
+    def push(self, value: float):
+        """Добавление нового значения с вытеснением самого старого"""
+        if len(self.values) == self.window:
+            oldest = self.values[0]
+            self.total -= oldest
+            self.total_sq -= oldest * oldest
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+
+        self.updates += 1
+        if self.updates % self.RESYNC_INTERVAL == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    def is_full(self) -> bool:
+        return len(self.values) == self.window
+
+    def mean(self) -> float:
+        """Среднее по окну (NaN, пока окно не заполнено - как rolling().mean())"""
+        if not self.is_full():
+            return float('nan')
+        return self.total / self.window
+
+    def std(self) -> float:
+        """Выборочное стандартное отклонение (ddof=1, как rolling().std())"""
+        if not self.is_full() or self.window < 2:
+            return float('nan')
+        variance = (self.total_sq - self.total * self.total / self.window) / (self.window - 1)
+        return math.sqrt(max(variance, 0.0))
+
+
+class AssetFeatureState:
+    """Состояние инкрементального вычисления фичей для одного актива"""
+
+    def __init__(self):
+        max_lag = max(FeatureEngineer.CLOSE_LAGS)
+        # Последние закрытия: текущее + max_lag предыдущих
+        self.closes: Deque[float] = deque(maxlen=max_lag + 1)
+        self.close_ma = {w: RollingWindow(w) for w in FeatureEngineer.CLOSE_MA_WINDOWS}
+        self.volume_ma = {w: RollingWindow(w) for w in FeatureEngineer.VOLUME_MA_WINDOWS}
+        self.close_volatility = {w: RollingWindow(w) for w in FeatureEngineer.CLOSE_VOLATILITY_WINDOWS}
+        self.last_timestamp: Optional[datetime] = None
+        self.last_features: Optional[Dict[str, Any]] = None
+
+
+class IncrementalFeatureEngine:
+    """Потоковый движок фичей с состоянием по активам.
+
+    Каждый новый бар обновляет кольцевые буферы и накопленные суммы за O(1),
+    вместо пересчета всех лагов и скользящих окон по полной истории.
+    Набор и порядок колонок совпадают с FeatureEngineer.compute_features.
+    """
+
+    def __init__(self):
+        self.states: Dict[str, AssetFeatureState] = {}
+        # Признаки новостей при отсутствии новостей (нули)
+        self.empty_news_features = self.calculate_news_features(pd.Timestamp(0), pd.DataFrame())
+
+    @staticmethod
+    def calculate_news_features(timestamp: datetime, news_data: pd.DataFrame) -> Dict[str, Any]:
+        """Признаки новостей по скользящим окнам на момент timestamp"""
+        news_features = FeatureEngineer.calculate_rolling_news_features(pd.Series([timestamp]), news_data)
+        return {name: values.iloc[0].item() for name, values in news_features.items()}
+
+    def get_last_timestamp(self, asset_id: str) -> Optional[datetime]:
+        """Timestamp последнего учтенного бара"""
+        state = self.states.get(asset_id)
+        return state.last_timestamp if state else None
+
+    def reset(self, asset_id: str):
+        """Сброс состояния актива"""
+        self.states.pop(asset_id, None)
+
+    def update(self, asset_id: str, bar: Dict[str, Any], news_features: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Учет нового бара и вычисление фичей для него.
+
+        Бары с timestamp не новее уже учтенного игнорируются (возвращается None).
+        """
+        state = self.states.get(asset_id)
+        if state is None:
+            state = AssetFeatureState()
+            self.states[asset_id] = state
+
+        timestamp = bar['timestamp']
+        if state.last_timestamp is not None and timestamp <= state.last_timestamp:
+            return None
+
+        close = float(bar['close'])
+        volume = float(bar['volume'])
+
+        prev_close = state.closes[-1] if state.closes else None
+        state.closes.append(close)
+        for window in state.close_ma.values():
+            window.push(close)
+        for window in state.volume_ma.values():
+            window.push(volume)
+        for window in state.close_volatility.values():
+            window.push(close)
+        state.last_timestamp = timestamp
+
+        features = dict(bar)
+
+        # Лаги цены закрытия
+        n_closes = len(state.closes)
+        for lag in FeatureEngineer.CLOSE_LAGS:
+            features[f"close_lag_{lag}"] = state.closes[-1 - lag] if n_closes > lag else float('nan')
+
+        # Скользящие средние
+        for w, window in state.close_ma.items():
+            features[f"close_ma_{w}"] = window.mean()
+        for w, window in state.volume_ma.items():
+            features[f"volume_ma_{w}"] = window.mean()
+
+        # Волатильность
+        for w, window in state.close_volatility.items():
+            features[f"close_volatility_{w}"] = window.std()
+
+        # Календарные признаки
+        ts = pd.Timestamp(timestamp)
+        features['hour'] = ts.hour
+        features['day_of_week'] = ts.dayofweek
+        features['day_of_month'] = ts.day
+        features['month'] = ts.month
+        features['is_weekend'] = int(ts.dayofweek >= 5)
+
+        # Признаки новостей
+        features.update(self.empty_news_features if news_features is None else news_features)
+
+        # Дополнительные признаки
+        features['price_change'] = close / prev_close - 1 if prev_close else float('nan')
+        features['high_low_ratio'] = bar['high'] / bar['low']
+        features['volume_price_trend'] = volume * close
+
+        state.last_features = features
+        return features
+
+    def update_many(self, asset_id: str, market_data: pd.DataFrame, news_features: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Учет пачки баров (по возрастанию timestamp), возвращает фичи последнего бара"""
+        if not market_data.empty:
+            for bar in market_data.to_dict('records'):
+                self.update(asset_id, bar, news_features)
+        return self.get_latest_features(asset_id, news_features)
+
+    def get_latest_features(self, asset_id: str, news_features: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Фичи последнего учтенного бара (с обновленными признаками новостей)"""
+        state = self.states.get(asset_id)
+        if state is None or state.last_features is None:
+            return None
+        features = dict(state.last_features)
+        if news_features is not None:
+            features.update(news_features)
+        return features
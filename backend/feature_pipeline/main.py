@@ -1,10 +1,14 @@
 """Feature Pipeline Service - вычисление фичей"""
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Body
+from fastapi.concurrency import run_in_threadpool
 from backend.shared.models import HealthResponse
 from backend.feature_pipeline.batch_processor import BatchFeatureProcessor
+from backend.feature_pipeline.batch_runner import BatchFeatureRunner, fetch_asset_ids
 from backend.feature_pipeline.online_processor import OnlineFeatureProcessor
+from backend.feature_pipeline.config import feature_settings
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
+import asyncio
 import time
 
 app = FastAPI(
@@ -15,6 +19,19 @@ app = FastAPI(
 
 batch_processor = BatchFeatureProcessor()
 online_processor = OnlineFeatureProcessor()
+batch_runner = BatchFeatureRunner()
+batch_tasks = set()
+
+
+@app.on_event("startup")
+async def startup():
+    if feature_settings.CLICKHOUSE_FEATURES_LAYOUT == "wide":
+        await run_in_threadpool(batch_processor.clickhouse.verify_wide_schema)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    batch_runner.shutdown()
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -40,8 +57,75 @@ async def compute_batch_features(
         end_time = datetime.utcnow()
     
     try:
-        batch_processor.process_asset(asset_id, start_time, end_time)
-        return {"status": "completed", "asset_id": asset_id}
+        rows = await run_in_threadpool(batch_processor.process_asset, asset_id, start_time, end_time)
+        return {"status": "completed", "asset_id": asset_id, "rows": rows}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _start_batch_job(job):
+    # Отметка до create_task: повторный retry сразу следом уже видит задачу запущенной
+    job.running = True
+    task = asyncio.create_task(batch_runner.run_async(job))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+
+
+@app.post("/features/batch")
+async def compute_batch_features_bulk(
+    asset_ids: Optional[List[str]] = Body(None),
+    start_time: Optional[datetime] = Query(None),
+    end_time: Optional[datetime] = Query(None)
+):
+    """Batch-вычисление фичей для множества активов (по умолчанию - для всех)"""
+    if not start_time:
+        start_time = datetime.utcnow() - timedelta(days=30)
+    if not end_time:
+        end_time = datetime.utcnow()
+    
+    try:
+        if not asset_ids:
+            asset_ids = await run_in_threadpool(fetch_asset_ids)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Asset Service unavailable: {str(e)}")
+    
+    job = batch_runner.create_job(asset_ids, start_time, end_time)
+    _start_batch_job(job)
+    return {"status": "started", "job_id": job.job_id, "total": len(asset_ids)}
+
+
+@app.get("/features/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """Прогресс batch-задачи по активам"""
+    job = batch_runner.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.post("/features/batch/jobs/{job_id}/retry")
+async def retry_batch_job(job_id: str):
+    """Повторный запуск только неуспешных активов задачи"""
+    job = batch_runner.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.running:
+        raise HTTPException(status_code=409, detail="Job is still running")
+    
+    failed = job.failed_assets()
+    if failed:
+        _start_batch_job(job)
+    return {"status": "started" if failed else "nothing_to_retry", "job_id": job_id, "retrying": len(failed)}
+
+
+@app.post("/features/online/batch")
+async def compute_online_features_bulk(
+    asset_ids: List[str] = Body(...),
+    lookback_hours: int = Query(24, ge=1, le=168)
+):
+    """Online-вычисление фичей для нескольких активов (активы без данных отсутствуют в ответе)"""
+    try:
+        return await run_in_threadpool(online_processor.compute_features_bulk, asset_ids, lookback_hours)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -53,7 +137,8 @@ async def compute_online_features(
 ):
     """Online-вычисление фичей для актива"""
     try:
-        features = online_processor.compute_features(asset_id, lookback_hours)
+        # В пуле потоков, как и пакетный маршрут: состояние актива защищено блокировкой
+        features = await run_in_threadpool(online_processor.compute_features, asset_id, lookback_hours)
         if not features:
             raise HTTPException(status_code=404, detail="No features available")
         return features
@@ -2,49 +2,126 @@
 from backend.feature_pipeline.clickhouse_client import FeatureClickHouseClient
 from backend.feature_pipeline.redis_client import FeatureRedisClient
 from backend.feature_pipeline.feature_engineering import FeatureEngineer
+from backend.feature_pipeline.incremental_engine import IncrementalFeatureEngine
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timedelta
 import pandas as pd
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Iterator, List, Optional
 
 
 class OnlineFeatureProcessor:
+    """Online-фичи поверх общего IncrementalFeatureEngine.
+    
+    Методы вызываются из пула потоков; состояние актива в движке (проверка последнего
+    бара, дочитывание и учет новых баров, чтение фичей) защищено блокировкой актива,
+    иначе конкурентные запросы учли бы одни и те же бары дважды.
+    """
+    
     def __init__(self):
         self.clickhouse = FeatureClickHouseClient()
         self.redis = FeatureRedisClient()
         self.feature_engineer = FeatureEngineer()
+        self.engine = IncrementalFeatureEngine()
+        self._asset_locks: Dict[str, threading.Lock] = {}
+        self._asset_locks_guard = threading.Lock()
+    
+    def _asset_lock(self, asset_id: str) -> threading.Lock:
+        with self._asset_locks_guard:
+            return self._asset_locks.setdefault(asset_id, threading.Lock())
+    
+    @contextmanager
+    def _locked(self, asset_ids: List[str]) -> Iterator[None]:
+        """Блокировки нескольких активов (в порядке id, чтобы пакетные запросы не взаимоблокировались)"""
+        with ExitStack() as stack:
+            for asset_id in sorted(set(asset_ids)):
+                stack.enter_context(self._asset_lock(asset_id))
+            yield
+    
+    @staticmethod
+    def _is_fresh(cached: Optional[Dict[str, Any]]) -> bool:
+        """Кеш актуален менее часа"""
+        if not cached:
+            return False
+        cached_time = datetime.fromisoformat(cached.get('timestamp', ''))
+        return (datetime.utcnow() - cached_time).total_seconds() < 3600
+    
+    def _market_start(self, asset_id: str, start_time: datetime) -> datetime:
+        """Начало чтения баров: если состояние актива есть и не устарело, дочитываем только новые бары"""
+        last_timestamp = self.engine.get_last_timestamp(asset_id)
+        if last_timestamp is not None and pd.Timestamp(last_timestamp) >= pd.Timestamp(start_time):
+            return last_timestamp
+        self.engine.reset(asset_id)
+        return start_time
     
     def compute_features(self, asset_id: str, lookback_hours: int = 24) -> Optional[Dict[str, Any]]:
         """Вычисление фичей онлайн"""
         # Проверка кеша в Redis
         cached = self.redis.get_latest_features(asset_id)
-        if cached:
-            cached_time = datetime.fromisoformat(cached.get('timestamp', ''))
-            if (datetime.utcnow() - cached_time).total_seconds() < 3600:  # Кеш актуален менее часа
-                return cached
+        if self._is_fresh(cached):
+            return cached
         
-        # Получение данных из ClickHouse
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=lookback_hours)
+        with self._locked([asset_id]):
+            end_time = datetime.utcnow()
+            start_time = end_time - timedelta(hours=lookback_hours)
+            market_start = self._market_start(asset_id, start_time)
+            
+            market_data = self.clickhouse.get_market_data(asset_id, market_start, end_time)
+            
+            # Инкрементальное обновление фичей (O(1) на бар)
+            self.engine.update_many(asset_id, market_data)
+            latest_timestamp = self.engine.get_last_timestamp(asset_id)
+            if latest_timestamp is None:
+                return None
+            
+            # Признаки новостей на момент последнего бара
+            news_start = latest_timestamp - timedelta(hours=max(FeatureEngineer.NEWS_WINDOWS_HOURS))
+            news_data = self.clickhouse.get_news_data(asset_id, news_start, latest_timestamp)
+            news_features = self.engine.calculate_news_features(latest_timestamp, news_data)
+            features_dict = self.engine.get_latest_features(asset_id, news_features)
         
-        market_data = self.clickhouse.get_market_data(asset_id, start_time, end_time)
-        if market_data.empty:
-            return None
-        
-        news_data = self.clickhouse.get_news_data(asset_id, start_time, end_time)
+        # Сохранение в Redis
+        self.redis.save_features(asset_id, features_dict, latest_timestamp)
         
-        # Вычисление фичей
-        features_df = self.feature_engineer.compute_features(market_data, news_data)
+        return features_dict
+    
+    def compute_features_bulk(self, asset_ids: List[str], lookback_hours: int = 24) -> Dict[str, Dict[str, Any]]:
+        """Вычисление фичей онлайн для нескольких активов.
         
-        if features_df.empty:
-            return None
+        Кеш Redis читается одним pipeline, недостающие активы досчитываются
+        по одному запросу в ClickHouse на рынок и на новости. Активы без данных пропускаются.
+        """
+        asset_ids = list(dict.fromkeys(asset_ids))
+        cached = self.redis.get_latest_features_bulk(asset_ids)
+        result = {asset_id: features for asset_id, features in cached.items() if self._is_fresh(features)}
         
-        # Взять последнюю строку
-        latest_row = features_df.iloc[-1]
-        features_dict = latest_row.to_dict()
+        stale_ids = [asset_id for asset_id in asset_ids if asset_id not in result]
+        if not stale_ids:
+            return result
         
-        # Сохранение в Redis
-        latest_timestamp = features_df['timestamp'].max()
-        self.redis.save_features(asset_id, features_dict, latest_timestamp)
+        with self._locked(stale_ids):
+            end_time = datetime.utcnow()
+            start_time = end_time - timedelta(hours=lookback_hours)
+            market_start = min(self._market_start(asset_id, start_time) for asset_id in stale_ids)
+            
+            # Уже учтенные бары движок пропускает, поэтому общее окно для всех активов безопасно
+            market_data = self.clickhouse.get_market_data_bulk(stale_ids, market_start, end_time)
+            latest_timestamps = {}
+            for asset_id in stale_ids:
+                self.engine.update_many(asset_id, market_data[asset_id])
+                latest_timestamp = self.engine.get_last_timestamp(asset_id)
+                if latest_timestamp is not None:
+                    latest_timestamps[asset_id] = latest_timestamp
+            if not latest_timestamps:
+                return result
+            
+            # Новости за объединенное окно, признаки - на момент последнего бара каждого актива
+            news_start = min(latest_timestamps.values()) - timedelta(hours=max(FeatureEngineer.NEWS_WINDOWS_HOURS))
+            news_data = self.clickhouse.get_news_data_bulk(list(latest_timestamps), news_start, max(latest_timestamps.values()))
+            for asset_id, latest_timestamp in latest_timestamps.items():
+                news_features = self.engine.calculate_news_features(latest_timestamp, news_data[asset_id])
+                features_dict = self.engine.get_latest_features(asset_id, news_features)
+                self.redis.save_features(asset_id, features_dict, latest_timestamp)
+                result[asset_id] = features_dict
         
-        return features_dict
-
+        return result
@@ -1,9 +1,32 @@
-"""Клиент для работы с Redis (Feature Store)"""
+"""Клиент для работы с Redis (Feature Store)
+
+Раскладка ключей:
+- features:{asset_id}:{timestamp} - снапшот фичей (JSON, TTL 24 часа)
+- feature_index:{asset_id} - ZSET снапшотов актива, score = unix timestamp
+- feature_latest:{asset_id} - HASH с последними фичами актива (O(1) чтение)
+"""
 import redis
 import json
+import time
 from backend.feature_pipeline.config import feature_settings
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from datetime import datetime
+import pandas as pd
+
+FEATURES_TTL = 3600 * 24  # TTL 24 часа
+
+
+def _json_default(value: Any):
+    """Сериализация datetime/numpy значений в JSON"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _to_score(timestamp: datetime) -> float:
+    return pd.Timestamp(timestamp).timestamp()
 
 
 class FeatureRedisClient:
@@ -14,38 +37,130 @@ class FeatureRedisClient:
             decode_responses=True
         )
     
+    @staticmethod
+    def _snapshot_key(asset_id: str, timestamp: datetime) -> str:
+        return f"features:{asset_id}:{timestamp.isoformat()}"
+    
+    @staticmethod
+    def _index_key(asset_id: str) -> str:
+        return f"feature_index:{asset_id}"
+    
+    @staticmethod
+    def _latest_key(asset_id: str) -> str:
+        return f"feature_latest:{asset_id}"
+    
     def save_features(self, asset_id: str, features: Dict[str, Any], timestamp: datetime):
         """Сохранение фичей в Redis"""
-        key = f"features:{asset_id}:{timestamp.isoformat()}"
-        self.redis_client.setex(
-            key,
-            3600 * 24,  # TTL 24 часа
-            json.dumps(features)
-        )
+        features = dict(features)
+        features['timestamp'] = timestamp.isoformat()
+        score = _to_score(timestamp)
+        snapshot_key = self._snapshot_key(asset_id, timestamp)
+        index_key = self._index_key(asset_id)
+        latest_key = self._latest_key(asset_id)
+        
+        def write(pipe: redis.client.Pipeline):
+            # Latest-указатель обновляется только более свежими фичами; WATCH на latest_key:
+            # если его изменил конкурентный писатель, транзакция повторяется с новым значением
+            current = pipe.hget(latest_key, 'timestamp')
+            is_latest = current is None or score >= _to_score(datetime.fromisoformat(json.loads(current)))
+            
+            pipe.multi()
+            pipe.setex(snapshot_key, FEATURES_TTL, json.dumps(features, default=_json_default))
+            pipe.zadd(index_key, {snapshot_key: score})
+            # Чистка индекса от баров старше TTL относительно текущего времени: порог от
+            # timestamp записываемого бара зависел бы от порядка записи (запоздавший бар
+            # ничего не чистит, бар с опережающим timestamp удаляет живые снапшоты)
+            pipe.zremrangebyscore(index_key, '-inf', f"({time.time() - FEATURES_TTL}")
+            pipe.expire(index_key, FEATURES_TTL)
+            if is_latest:
+                pipe.delete(latest_key)
+                pipe.hset(latest_key, mapping={
+                    name: json.dumps(value, default=_json_default) for name, value in features.items()
+                })
+                pipe.expire(latest_key, FEATURES_TTL)
+        
+        self.redis_client.transaction(write, latest_key)
+    
+    @staticmethod
+    def _decode_hash(data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if not data:
+            return None
+        return {name: json.loads(value) for name, value in data.items()}
     
     def get_latest_features(self, asset_id: str) -> Optional[Dict[str, Any]]:
         """Получение последних фичей для актива"""
-        # Поиск последнего ключа
-        pattern = f"features:{asset_id}:*"
-        keys = self.redis_client.keys(pattern)
-        
-        if not keys:
-            return None
-        
-        # Сортировка по timestamp
-        keys.sort(reverse=True)
-        latest_key = keys[0]
-        
-        data = self.redis_client.get(latest_key)
-        if data:
-            return json.loads(data)
-        return None
+        return self._decode_hash(self.redis_client.hgetall(self._latest_key(asset_id)))
+    
+    def get_latest_features_bulk(self, asset_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Получение последних фичей для нескольких активов за один round trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for asset_id in asset_ids:
+            pipe.hgetall(self._latest_key(asset_id))
+        results = pipe.execute()
+        return {asset_id: self._decode_hash(data) for asset_id, data in zip(asset_ids, results)}
     
     def get_features_by_timestamp(self, asset_id: str, timestamp: datetime) -> Optional[Dict[str, Any]]:
         """Получение фичей по timestamp"""
-        key = f"features:{asset_id}:{timestamp.isoformat()}"
+        key = self._snapshot_key(asset_id, timestamp)
         data = self.redis_client.get(key)
         if data:
             return json.loads(data)
         return None
+    
+    def get_features_range(self, asset_id: str, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+        """Получение снапшотов фичей за период (по возрастанию timestamp)"""
+        keys = self.redis_client.zrangebyscore(
+            self._index_key(asset_id), _to_score(start_time), _to_score(end_time)
+        )
+        if not keys:
+            return []
+        return [json.loads(data) for data in self.redis_client.mget(keys) if data]
+    
+    def migrate_legacy_keys(self, batch_size: int = 1000) -> int:
+        """Перенос старых ключей features:{asset_id}:{timestamp} в индекс и latest-хеши.
+        
+        Использует SCAN (не блокирует Redis), возвращает число перенесенных ключей.
+        """
+        latest: Dict[str, tuple] = {}
+        migrated = 0
+        pipe = self.redis_client.pipeline(transaction=False)
+        
+        for key in self.redis_client.scan_iter(match="features:*", count=batch_size):
+            parts = key.split(":", 2)
+            if len(parts) != 3:
+                continue
+            _, asset_id, timestamp_str = parts
+            try:
+                score = _to_score(datetime.fromisoformat(timestamp_str))
+            except ValueError:
+                continue
+            
+            pipe.zadd(self._index_key(asset_id), {key: score})
+            pipe.expire(self._index_key(asset_id), FEATURES_TTL)
+            if asset_id not in latest or score > latest[asset_id][0]:
+                latest[asset_id] = (score, key)
+            migrated += 1
+            
+            if migrated % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        
+        # Заполнение latest-хешей по самым свежим снапшотам
+        for asset_id, (_, key) in latest.items():
+            data = self.redis_client.get(key)
+            if not data or self.redis_client.exists(self._latest_key(asset_id)):
+                continue
+            features = json.loads(data)
+            timestamp_str = key.split(":", 2)[2]
+            features.setdefault('timestamp', timestamp_str)
+            self.redis_client.hset(self._latest_key(asset_id), mapping={
+                name: json.dumps(value, default=_json_default) for name, value in features.items()
+            })
+            self.redis_client.expire(self._latest_key(asset_id), FEATURES_TTL)
+        
+        return migrated
+
 
+if __name__ == "__main__":
+    migrated = FeatureRedisClient().migrate_legacy_keys()
+    print(f"Migrated {migrated} feature keys")
@@ -1,10 +1,24 @@
-"""Клиент для работы с S3 (сохранение фичей)"""
+"""Клиент для работы с S3 (сохранение фичей)
+
+Раскладка датасета фичей:
+- features/{asset_id}/year=YYYY/month=MM/part-{first_ts}-{last_ts}.parquet
+- features/{asset_id}/_manifest.json - последний записанный timestamp и
+  min/max timestamp каждого part-файла (для отсечения файлов при чтении);
+  обновляется условной записью (If-Match по ETag), конкурентные изменения не теряются
+"""
 import boto3
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from backend.feature_pipeline.config import feature_settings
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
 from datetime import datetime
 from io import BytesIO
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import json
 
 
 class FeatureS3Client:
@@ -16,26 +30,249 @@ class FeatureS3Client:
             aws_secret_access_key=feature_settings.MINIO_SECRET_KEY,
             config=Config(signature_version='s3v4')
         )
+        # Файловая система Arrow: чтение отдельных row group и колонок range-запросами
+        self.filesystem = fs.S3FileSystem(
+            access_key=feature_settings.MINIO_ACCESS_KEY,
+            secret_key=feature_settings.MINIO_SECRET_KEY,
+            endpoint_override=feature_settings.MINIO_ENDPOINT,
+            scheme='http'
+        )
         self.bucket = feature_settings.MINIO_BUCKET_FEATURES
     
-    def save_features_parquet(self, asset_id: str, df: pd.DataFrame, timestamp: datetime):
-        """Сохранение фичей в формате Parquet"""
-        year = timestamp.year
-        month = timestamp.month
-        day = timestamp.day
-        
-        key = f"features/{asset_id}/{year}/{month:02d}/{day:02d}/features.parquet"
+    @staticmethod
+    def _manifest_key(asset_id: str) -> str:
+        return f"features/{asset_id}/_manifest.json"
+    
+    def get_manifest(self, asset_id: str) -> Dict[str, Any]:
+        """Манифест датасета актива (пустой, если данных еще нет)"""
+        manifest, _ = self._read_manifest(asset_id)
+        return manifest
+    
+    def _read_manifest(self, asset_id: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Манифест и его ETag (None - манифеста еще нет)"""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._manifest_key(asset_id))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return {"last_timestamp": None, "parts": []}, None
+            raise
+        return json.loads(response['Body'].read()), response['ETag']
+    
+    def _update_manifest(self, asset_id: str, update: Callable[[Dict[str, Any]], bool]) -> Optional[Dict[str, Any]]:
+        """Read-modify-write манифеста с условной записью.
         
+        update изменяет свежепрочитанный манифест и возвращает False, если изменение
+        больше неприменимо (тогда манифест не пишется и возвращается None). Если манифест
+        изменил другой писатель, он перечитывается и update применяется заново.
+        """
+        for _ in range(feature_settings.FEATURE_MANIFEST_MAX_RETRIES):
+            manifest, etag = self._read_manifest(asset_id)
+            if not update(manifest):
+                return None
+            condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.bucket,
+                    Key=self._manifest_key(asset_id),
+                    Body=json.dumps(manifest),
+                    ContentType='application/json',
+                    **condition
+                )
+                return manifest
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                    raise
+        raise RuntimeError(
+            f"Feature manifest of {asset_id} is modified concurrently, "
+            f"gave up after {feature_settings.FEATURE_MANIFEST_MAX_RETRIES} attempts"
+        )
+    
+    def _write_part(self, key: str, df: pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
         buffer = BytesIO()
-        df.to_parquet(buffer, index=False)
-        buffer.seek(0)
-        
+        pq.write_table(
+            table,
+            buffer,
+            row_group_size=feature_settings.FEATURE_PARQUET_ROW_GROUP_SIZE,
+            compression='zstd',
+            write_statistics=True
+        )
         self.s3_client.put_object(
             Bucket=self.bucket,
             Key=key,
             Body=buffer.getvalue(),
             ContentType='application/octet-stream'
         )
+    
+    def save_features_parquet(self, asset_id: str, df: pd.DataFrame) -> List[str]:
+        """Дозапись фичей в партиционированный Parquet-датасет.
         
-        return key
-
+        Записываются только строки новее последнего сохраненного timestamp,
+        по одному part-файлу на затронутый месяц. Возвращает ключи новых файлов.
+        """
+        manifest = self.get_manifest(asset_id)
+        
+        df = df.sort_values('timestamp')
+        if manifest["last_timestamp"]:
+            df = df[df['timestamp'] > pd.Timestamp(manifest["last_timestamp"])]
+        if df.empty:
+            return []
+        
+        timestamps = pd.to_datetime(df['timestamp'])
+        keys = []
+        new_parts = []
+        for (year, month), part in df.groupby([timestamps.dt.year, timestamps.dt.month], sort=True):
+            first_ts = pd.Timestamp(part['timestamp'].iloc[0])
+            last_ts = pd.Timestamp(part['timestamp'].iloc[-1])
+            key = (
+                f"features/{asset_id}/year={year}/month={month:02d}/"
+                f"part-{first_ts:%Y%m%dT%H%M%S}-{last_ts:%Y%m%dT%H%M%S}.parquet"
+            )
+            self._write_part(key, part)
+            new_parts.append({
+                "key": key,
+                "min_timestamp": first_ts.isoformat(),
+                "max_timestamp": last_ts.isoformat(),
+                "rows": len(part)
+            })
+            keys.append(key)
+        
+        # Манифест обновляется последним: при сбое записи строки будут дописаны повторно
+        last_timestamp = pd.Timestamp(df['timestamp'].iloc[-1])
+        
+        def add_parts(current: Dict[str, Any]) -> bool:
+            known = {part["key"] for part in current["parts"]}
+            current["parts"].extend(part for part in new_parts if part["key"] not in known)
+            if not current["last_timestamp"] or pd.Timestamp(current["last_timestamp"]) < last_timestamp:
+                current["last_timestamp"] = last_timestamp.isoformat()
+            return True
+        
+        manifest = self._update_manifest(asset_id, add_parts)
+        
+        for key in keys:
+            self._compact_partition(asset_id, manifest, key.rsplit("/", 1)[0])
+        
+        return keys
+    
+    def _compact_partition(self, asset_id: str, manifest: Dict[str, Any], prefix: str):
+        """Слияние мелких part-файлов месяца в один, когда их становится слишком много"""
+        parts = [part for part in manifest["parts"] if part["key"].startswith(prefix + "/")]
+        if len(parts) <= feature_settings.FEATURE_PARQUET_COMPACT_THRESHOLD:
+            return
+        
+        frames = []
+        for part in parts:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=part["key"])
+            frames.append(pq.read_table(BytesIO(response['Body'].read())).to_pandas())
+        merged = pd.concat(frames, ignore_index=True).sort_values('timestamp')
+        
+        first_ts = pd.Timestamp(merged['timestamp'].iloc[0])
+        last_ts = pd.Timestamp(merged['timestamp'].iloc[-1])
+        key = f"{prefix}/part-{first_ts:%Y%m%dT%H%M%S}-{last_ts:%Y%m%dT%H%M%S}.parquet"
+        self._write_part(key, merged)
+        
+        merged_keys = {part["key"] for part in parts}
+        
+        def replace_parts(current: Dict[str, Any]) -> bool:
+            # Слитые файлы уже заменил конкурентный писатель - результат не используется
+            if not merged_keys <= {part["key"] for part in current["parts"]}:
+                return False
+            current["parts"] = [part for part in current["parts"] if part["key"] not in merged_keys]
+            current["parts"].append({
+                "key": key,
+                "min_timestamp": first_ts.isoformat(),
+                "max_timestamp": last_ts.isoformat(),
+                "rows": len(merged)
+            })
+            return True
+        
+        if self._update_manifest(asset_id, replace_parts) is None:
+            if key not in merged_keys:
+                self.s3_client.delete_object(Bucket=self.bucket, Key=key)
+            return
+        
+        # Старые файлы удаляются после переключения манифеста на новый
+        for old_key in merged_keys - {key}:
+            self.s3_client.delete_object(Bucket=self.bucket, Key=old_key)
+    
+    def read_features(
+        self,
+        asset_id: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """Чтение фичей с проекцией колонок и фильтром по времени.
+        
+        Part-файлы вне интервала отсекаются по манифесту, внутри файлов
+        фильтр по timestamp проталкивается до статистик row group.
+        """
+        table = self.read_features_table(asset_id, start_time, end_time, columns)
+        if table is None:
+            return pd.DataFrame()
+        return table.to_pandas()
+    
+    def read_features_table(
+        self,
+        asset_id: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        columns: Optional[List[str]] = None
+    ) -> Optional[pa.Table]:
+        """То же, что read_features, но без конвертации в pandas"""
+        dataset = self.get_dataset(asset_id, start_time, end_time)
+        if dataset is None:
+            return None
+        
+        if columns is not None and 'timestamp' not in columns:
+            columns = ['timestamp'] + list(columns)
+        
+        return dataset.to_table(columns=columns, filter=self.time_filter(start_time, end_time))
+    
+    def iter_feature_batches(
+        self,
+        asset_id: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        columns: Optional[List[str]] = None,
+        batch_size: int = 65536
+    ):
+        """Потоковое чтение фичей пачками RecordBatch (память ограничена размером пачки)"""
+        dataset = self.get_dataset(asset_id, start_time, end_time)
+        if dataset is None:
+            return
+        
+        if columns is not None and 'timestamp' not in columns:
+            columns = ['timestamp'] + list(columns)
+        
+        yield from dataset.to_batches(
+            columns=columns,
+            filter=self.time_filter(start_time, end_time),
+            batch_size=batch_size
+        )
+    
+    def get_dataset(self, asset_id: str, start_time: Optional[datetime], end_time: Optional[datetime]) -> Optional[ds.Dataset]:
+        parts = [
+            part for part in self.get_manifest(asset_id)["parts"]
+            if (end_time is None or pd.Timestamp(part["min_timestamp"]) <= pd.Timestamp(end_time))
+            and (start_time is None or pd.Timestamp(part["max_timestamp"]) >= pd.Timestamp(start_time))
+        ]
+        if not parts:
+            return None
+        parts.sort(key=lambda part: part["min_timestamp"])
+        paths = [f"{self.bucket}/{part['key']}" for part in parts]
+        dataset = ds.dataset(paths, filesystem=self.filesystem, format='parquet')
+        # Схема - объединение схем всех part-файлов (по умолчанию берется схема первого,
+        # и колонки, добавленные в более новых партициях, терялись бы)
+        schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()])
+        return ds.dataset(paths, schema=schema, filesystem=self.filesystem, format='parquet')
+    
+    @staticmethod
+    def time_filter(start_time: Optional[datetime], end_time: Optional[datetime]):
+        expression = None
+        if start_time is not None:
+            expression = ds.field('timestamp') >= pa.scalar(pd.Timestamp(start_time).to_pydatetime())
+        if end_time is not None:
+            upper = ds.field('timestamp') <= pa.scalar(pd.Timestamp(end_time).to_pydatetime())
+            expression = upper if expression is None else expression & upper
+        return expression
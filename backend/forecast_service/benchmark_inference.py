@@ -0,0 +1,63 @@
+"""Сравнение нативного и компилированного backend инференса на артефакте модели
+
+Пример: python -m backend.forecast_service.benchmark_inference model.bundle --iterations 1000
+"""
+import argparse
+import json
+import time
+import numpy as np
+from typing import Dict, Any
+from backend.model_training.model_bundle import MultiHorizonModel
+
+
+def benchmark(model: MultiHorizonModel, iterations: int, batch_size: int) -> Dict[str, Any]:
+    """Задержка прогноза одной строки (p50/p99) и пропускная способность на батче"""
+    rng = np.random.default_rng(0)
+    row = rng.normal(size=(1, model.input_size)).astype(np.float32)
+    batch = rng.normal(size=(batch_size, model.input_size)).astype(np.float32)
+    
+    # Прогрев
+    for _ in range(10):
+        model.predict_with_quantiles(row)
+    
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model.predict_with_quantiles(row)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    
+    batch_iterations = max(1, iterations // 10)
+    start = time.perf_counter()
+    for _ in range(batch_iterations):
+        model.predict_with_quantiles(batch)
+    elapsed = time.perf_counter() - start
+    
+    return {
+        "backend": model.backend,
+        "single_row_p50_us": round(float(np.percentile(latencies, 50)), 1),
+        "single_row_p99_us": round(float(np.percentile(latencies, 99)), 1),
+        "batch_rows_per_second": round(batch_iterations * batch_size / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark native vs compiled inference backend")
+    parser.add_argument("bundle", help="Path to model.bundle")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    
+    with open(args.bundle, "rb") as f:
+        data = f.read()
+    
+    results = [
+        benchmark(MultiHorizonModel.from_bytes(data, backend), args.iterations, args.batch_size)
+        for backend in ("native", "compiled")
+    ]
+    if results[1]["backend"] == "native":
+        print("Compiled backend is not available for this bundle, both runs are native")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,8 +16,46 @@ class ForecastSettings(BaseSettings):
     REDIS_HOST: str = settings.REDIS_HOST
     REDIS_PORT: int = settings.REDIS_PORT
     
-    # Кеширование моделей в памяти
-    MODEL_CACHE_SIZE: int = 10
+    # Кеширование моделей в памяти (LRU, суммарный размер артефактов)
+    MODEL_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # Через сколько секунд перепроверять версию модели в Model Registry (If-None-Match)
+    MODEL_METADATA_TTL_SECONDS: int = 60
+    # Предельный возраст неподтвержденной версии: дальше запрос ждет перепроверку, при ее сбое - 503
+    MODEL_METADATA_MAX_STALE_SECONDS: int = 900
+    # Пул потоков для скачивания и десериализации моделей
+    MODEL_LOAD_WORKERS: int = 4
+    MODEL_DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+    # Подписка на смены версий в Redis pub/sub (иначе версия обновляется по MODEL_METADATA_TTL_SECONDS)
+    MODEL_EVENTS_ENABLED: bool = True
+    MODEL_EVENTS_CHANNEL: str = settings.MODEL_EVENTS_CHANNEL
+    MODEL_EVENTS_RECONNECT_SECONDS: float = 5.0
+    
+    # Backend инференса по умолчанию: native или compiled (ONNX/TorchScript из bundle,
+    # с откатом на native); для модели переопределяется training_config.inference_backend
+    INFERENCE_BACKEND: str = "native"
+    
+    # Micro-batching: конкурентные прогнозы одной модели объединяются в один predict
+    PREDICT_BATCHING_ENABLED: bool = True
+    PREDICT_BATCH_MAX_SIZE: int = 64
+    PREDICT_BATCH_MAX_WAIT_MS: float = 2.0
+    
+    # Кеш результатов прогноза по (актив, версия модели, фичи, горизонты)
+    FORECAST_CACHE_ENABLED: bool = True
+    FORECAST_CACHE_MAX_ENTRIES: int = 10000
+    FORECAST_CACHE_TTL_SECONDS: int = 3600
+    # Второй уровень кеша в Redis, общий для реплик
+    FORECAST_CACHE_REDIS_ENABLED: bool = False
+    
+    # Прогрев prod/canary моделей при старте (readiness - после прогрева)
+    MODEL_WARMUP_ENABLED: bool = True
+    MODEL_WARMUP_TIMEOUT_SECONDS: int = 300
+    
+    # Отложенная пакетная запись прогнозов в Forecast Storage
+    FORECAST_WRITE_QUEUE_SIZE: int = 10000
+    FORECAST_WRITE_BATCH_SIZE: int = 500
+    FORECAST_WRITE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    FORECAST_WRITE_ENQUEUE_TIMEOUT_SECONDS: float = 0.05
+    FORECAST_WRITE_MAX_RETRIES: int = 3
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,56 @@
+"""Сборка входной матрицы модели из словарей фичей"""
+import numpy as np
+from operator import itemgetter
+from typing import Dict, Any, List, Tuple
+
+
+class FeatureAssembler:
+    """Сборщик float32-матрицы по схеме входа модели.
+    
+    Для каждой раскладки ключей словаря фичей (ответы Feature Pipeline имеют
+    одинаковый порядок ключей) один раз компилируются индексы источника и
+    приемника, после чего строка заполняется одним gather через itemgetter.
+    """
+    
+    def __init__(self, columns: List[str], fill_value: float = 0.0):
+        self.columns = list(columns)
+        self.input_size = len(self.columns)
+        self.fill_value = fill_value
+        self._column_index = {column: i for i, column in enumerate(self.columns)}
+        self._layouts: Dict[Tuple[str, ...], Tuple[Any, np.ndarray]] = {}
+    
+    def _compile(self, layout: Tuple[str, ...]) -> Tuple[Any, np.ndarray]:
+        """Индексы значений словаря, попадающих во вход модели, и их колонки"""
+        compiled = self._layouts.get(layout)
+        if compiled is None:
+            pairs = [(i, self._column_index[key]) for i, key in enumerate(layout) if key in self._column_index]
+            source = [i for i, _ in pairs]
+            target = np.array([j for _, j in pairs], dtype=np.intp)
+            # itemgetter с одним индексом возвращает скаляр - приводим к кортежу
+            getter = itemgetter(*source) if len(source) > 1 else (lambda values: tuple(values[i] for i in source))
+            compiled = (getter, target)
+            self._layouts[layout] = compiled
+        return compiled
+    
+    def assemble(self, features_list: List[Dict[str, Any]]) -> np.ndarray:
+        """Матрица (n_rows, input_size); отсутствующие и null значения - fill_value"""
+        X = np.full((len(features_list), self.input_size), self.fill_value, dtype=np.float32)
+        for row, features in enumerate(features_list):
+            getter, target = self._compile(tuple(features))
+            if not len(target):
+                continue
+            values = getter(list(features.values()))
+            try:
+                X[row, target] = np.array(values, dtype=np.float32)
+            except (TypeError, ValueError):
+                # Нечисловые значения (строки и т.п.) заменяются fill_value
+                X[row, target] = [self._to_float(value) for value in values]
+        if not np.isnan(self.fill_value):
+            # null из JSON приводится к NaN - заменяем на значение по умолчанию
+            X[np.isnan(X)] = self.fill_value
+        return X
+    
+    def _to_float(self, value: Any) -> float:
+        if isinstance(value, (int, float)):
+            return float(value)
+        return self.fill_value
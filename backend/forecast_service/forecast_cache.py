@@ -0,0 +1,196 @@
+"""Кеш результатов прогноза: в памяти процесса и (опционально) в Redis"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import redis.asyncio as redis
+from backend.forecast_service.config import forecast_settings
+from backend.forecast_service.model_cache import single_flight
+
+# (asset_id, model_id, version_id, версия фичей, горизонты)
+CacheKey = Tuple[str, str, str, str, Tuple[int, ...]]
+
+
+class ForecastResultCache:
+    """Кеш прогнозов по входам модели.
+    
+    Прогноз детерминирован при неизменных фичах и версии модели, поэтому ключ -
+    (актив, модель, версия, timestamp и хеш фичей, горизонты): новые фичи или смена
+    продакшн-версии дают новый ключ, а старые записи истекают по TTL.
+    Первый уровень - LRU в памяти, второй - общий для реплик Redis.
+    Конкурентные промахи по одному ключу выполняют один расчет.
+    
+    Прогноз из кеша сохраняет timestamp_forecasted исходного расчета. Его сохранение
+    в Forecast Storage отмечается отдельно (claim_save), чтобы прогноз, рассчитанный
+    с save=false или потерянный при записи, был сохранен следующим запросом с save=true.
+    """
+    
+    def __init__(self):
+        self.max_entries = forecast_settings.FORECAST_CACHE_MAX_ENTRIES
+        self.ttl = forecast_settings.FORECAST_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[CacheKey, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        # Отметки сохраненных прогнозов: токен прогноза -> срок отметки
+        self._saved: "OrderedDict[str, float]" = OrderedDict()
+        self.redis: Optional[redis.Redis] = None
+        if forecast_settings.FORECAST_CACHE_REDIS_ENABLED:
+            self.redis = redis.Redis(
+                host=forecast_settings.REDIS_HOST,
+                port=forecast_settings.REDIS_PORT,
+                decode_responses=True
+            )
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def features_version(features: Dict[str, Any]) -> str:
+        """Версия фичей: timestamp бара и хеш значений.
+        
+        Признаки новостей пересчитываются и для того же бара, поэтому одного timestamp мало.
+        """
+        digest = hashlib.blake2b(json.dumps(features, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
+        return f"{features.get('timestamp')}#{digest}"
+    
+    @classmethod
+    def make_key(cls, asset_id: str, model_id: str, version_id: str, features: Dict[str, Any], horizons: List[int]) -> CacheKey:
+        return (asset_id, str(model_id), version_id, cls.features_version(features), tuple(horizons))
+    
+    @staticmethod
+    def _redis_key(key: CacheKey) -> str:
+        asset_id, model_id, version_id, features_version, horizons = key
+        return f"forecast_cache:{asset_id}:{model_id}:{version_id}:{features_version}:{','.join(map(str, horizons))}"
+    
+    def _get_local(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+    
+    def _put_local(self, key: CacheKey, result: Dict[str, Any]):
+        self._entries[key] = (result, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def _get_redis(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        try:
+            data = await self.redis.get(self._redis_key(key))
+        except redis.RedisError as e:
+            # Redis - только ускорение: при недоступности считаем промахом
+            print(f"Forecast cache Redis read failed: {e}")
+            return None
+        return json.loads(data) if data else None
+    
+    async def _put_redis(self, key: CacheKey, result: Dict[str, Any]):
+        try:
+            await self.redis.setex(self._redis_key(key), self.ttl, json.dumps(result))
+        except redis.RedisError as e:
+            print(f"Forecast cache Redis write failed: {e}")
+    
+    async def get_or_compute(
+        self,
+        key: CacheKey,
+        compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Прогноз из кеша или расчет через compute(): (результат, взят ли из кеша)"""
+        result = self._get_local(key)
+        if result is not None:
+            self.hits += 1
+            return result, True
+        
+        joined = key in self._inflight
+        if joined:
+            self.coalesced += 1
+        
+        async def load() -> Tuple[Dict[str, Any], bool]:
+            if self.redis is not None:
+                cached = await self._get_redis(key)
+                if cached is not None:
+                    self.redis_hits += 1
+                    self._put_local(key, cached)
+                    return cached, True
+            self.misses += 1
+            computed = await compute()
+            self._put_local(key, computed)
+            if self.redis is not None:
+                await self._put_redis(key, computed)
+            return computed, False
+        
+        result, cached = await single_flight(self._inflight, key, load)
+        # Присоединившийся к чужому расчету получает его результат как кешированный
+        return result, cached or joined
+    
+    @staticmethod
+    def save_token(result: Dict[str, Any]) -> str:
+        """Идентификатор расчета прогноза (у результата из кеша - тот же, что у исходного)"""
+        horizons = ",".join(sorted(result["forecasts"]))
+        return f"{result['asset_id']}:{result['model_id']}:{result['timestamp_forecasted']}:{horizons}"
+    
+    async def claim_save(self, result: Dict[str, Any]) -> bool:
+        """Отметка прогноза как сохраняемого: True - вызывающий должен его сохранить"""
+        token = self.save_token(result)
+        if self.redis is not None:
+            try:
+                # Отметка общая для реплик, как и сами записи кеша в Redis
+                return bool(await self.redis.set(f"forecast_saved:{token}", 1, nx=True, ex=self.ttl))
+            except redis.RedisError as e:
+                print(f"Forecast cache Redis write failed: {e}")
+        expires_at = self._saved.get(token)
+        if expires_at is not None and expires_at > time.monotonic():
+            return False
+        self._saved[token] = time.monotonic() + self.ttl
+        self._saved.move_to_end(token)
+        while len(self._saved) > self.max_entries:
+            self._saved.popitem(last=False)
+        return True
+    
+    async def release_save(self, result: Dict[str, Any]):
+        """Снятие отметки (записи потеряны) - прогноз сохранит следующий запрос с save=true"""
+        token = self.save_token(result)
+        self._saved.pop(token, None)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(f"forecast_saved:{token}")
+            except redis.RedisError as e:
+                print(f"Forecast cache Redis write failed: {e}")
+    
+    def invalidate(self, asset_id: Optional[str] = None, model_id: Optional[str] = None) -> int:
+        """Удаление локальных записей актива и/или модели, возвращает их число.
+        
+        Записи Redis не удаляются: после смены фичей или версии их ключи больше не запрашиваются.
+        """
+        keys = [
+            key for key in self._entries
+            if (asset_id is None or key[0] == asset_id) and (model_id is None or key[1] == str(model_id))
+        ]
+        for key in keys:
+            del self._entries[key]
+        self.invalidations += len(keys)
+        return len(keys)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "redis_enabled": self.redis is not None,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations
+        }
+    
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
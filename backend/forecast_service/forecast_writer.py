@@ -0,0 +1,172 @@
+"""Отложенная (write-behind) запись прогнозов в Forecast Storage"""
+import asyncio
+import math
+import time
+import uuid
+import httpx
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from backend.forecast_service.config import forecast_settings
+
+# Запись в очереди: данные прогноза и обработчик потери записи (None - без уведомления)
+OnDrop = Optional[Callable[[], Awaitable[None]]]
+QueuedRecord = Tuple[Dict[str, Any], OnDrop]
+
+
+class ForecastWriter:
+    """Очередь записи прогнозов с пакетной отправкой в /forecasts/batch.
+    
+    Записи от разных запросов объединяются: пакет уходит при наборе
+    FORECAST_WRITE_BATCH_SIZE записей или через FORECAST_WRITE_FLUSH_INTERVAL_SECONDS
+    после первой записи пакета. Очередь ограничена: при переполнении submit ждет
+    не дольше FORECAST_WRITE_ENQUEUE_TIMEOUT_SECONDS, затем запись отбрасывается.
+    Записи, которые хранилище заведомо отклонит (не UUID, нечисловой прогноз),
+    отбрасываются при постановке, чтобы не терять вместе с ними весь пакет.
+    При любой потере записей вызывается on_drop, переданный в submit.
+    """
+    
+    def __init__(self, http_client: httpx.AsyncClient):
+        self.http_client = http_client
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=forecast_settings.FORECAST_WRITE_QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_batches = 0
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    @staticmethod
+    def _normalize(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Запись в виде, который примет ForecastCreate хранилища (None - запись невалидна)"""
+        try:
+            uuid.UUID(str(payload["asset_id"]))
+            uuid.UUID(str(payload["model_version_id"]))
+            point_forecast = float(payload["point_forecast"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not math.isfinite(point_forecast):
+            return None
+        normalized = dict(payload, point_forecast=point_forecast)
+        # NaN/inf в границах не сериализуются в JSON - граница сохраняется пустой
+        for bound in ("low_bound", "high_bound"):
+            value = payload.get(bound)
+            normalized[bound] = float(value) if value is not None and math.isfinite(float(value)) else None
+        return normalized
+    
+    @staticmethod
+    async def _notify(callbacks: List[OnDrop]):
+        """Уведомление о потере записей (по одному разу на вызов submit)"""
+        for on_drop in {id(callback): callback for callback in callbacks if callback is not None}.values():
+            try:
+                await on_drop()
+            except Exception as e:
+                print(f"Forecast drop handler failed: {e}")
+    
+    async def submit(self, payloads: List[Dict[str, Any]], on_drop: OnDrop = None) -> int:
+        """Постановка записей в очередь, возвращает число принятых"""
+        valid = [normalized for normalized in map(self._normalize, payloads) if normalized is not None]
+        if len(valid) < len(payloads):
+            self.rejected += len(payloads) - len(valid)
+            print(f"Skipped {len(payloads) - len(valid)} invalid forecast records")
+            await self._notify([on_drop])
+        accepted = 0
+        for payload in valid:
+            record = (payload, on_drop)
+            try:
+                self.queue.put_nowait(record)
+            except asyncio.QueueFull:
+                # Backpressure: короткое ожидание места, затем отказ
+                try:
+                    await asyncio.wait_for(
+                        self.queue.put(record),
+                        timeout=forecast_settings.FORECAST_WRITE_ENQUEUE_TIMEOUT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    self.dropped += len(valid) - accepted
+                    print(f"Forecast write queue is full, dropped {len(valid) - accepted} records")
+                    await self._notify([on_drop])
+                    return accepted
+            accepted += 1
+        return accepted
+    
+    async def _next_batch(self) -> List[QueuedRecord]:
+        """Ожидание первой записи и добор пакета до размера или таймаута"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + forecast_settings.FORECAST_WRITE_FLUSH_INTERVAL_SECONDS
+        while len(batch) < forecast_settings.FORECAST_WRITE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                # Любая ошибка теряет только этот пакет, запись продолжается
+                await self._drop(batch, f"Failed to save {len(batch)} forecasts: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+    
+    async def _drop(self, batch: List[QueuedRecord], message: str):
+        self.failed_batches += 1
+        self.dropped += len(batch)
+        print(message)
+        await self._notify([on_drop for _, on_drop in batch])
+    
+    async def _write(self, batch: List[QueuedRecord]):
+        """Отправка пакета с повторами сетевых ошибок и 5xx; 422 - пакет делится пополам"""
+        url = f"{forecast_settings.FORECAST_STORAGE_URL}/forecasts/batch"
+        payloads = [payload for payload, _ in batch]
+        for attempt in range(forecast_settings.FORECAST_WRITE_MAX_RETRIES + 1):
+            try:
+                response = await self.http_client.post(url, json=payloads)
+            except httpx.TransportError as e:
+                error = str(e)
+            else:
+                if response.status_code < 400:
+                    self.written += len(batch)
+                    return
+                if response.status_code == 422 and len(batch) > 1:
+                    # Невалидная запись не должна отбрасывать записи других запросов
+                    middle = len(batch) // 2
+                    await self._write(batch[:middle])
+                    await self._write(batch[middle:])
+                    return
+                if response.status_code < 500:
+                    await self._drop(batch, f"Forecast Storage rejected {len(batch)} forecasts: {response.status_code} {response.text[:200]}")
+                    return
+                error = f"HTTP {response.status_code}"
+            if attempt == forecast_settings.FORECAST_WRITE_MAX_RETRIES:
+                await self._drop(batch, f"Failed to save {len(batch)} forecasts: {error}")
+                return
+            await asyncio.sleep(0.5 * 2 ** attempt)
+    
+    async def close(self):
+        """Сброс оставшихся записей и остановка"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=forecast_settings.FORECAST_WRITE_FLUSH_INTERVAL_SECONDS * 10)
+        except asyncio.TimeoutError:
+            print(f"Forecast writer stopped with {self.queue.qsize()} unsaved records")
+        self._task.cancel()
+        self._task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "failed_batches": self.failed_batches
+        }
@@ -1,11 +1,15 @@
 """Forecast Service - онлайновое прогнозирование"""
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Body
 from backend.shared.models import HealthResponse
 from backend.forecast_service.predictor import ForecastPredictor
+from backend.forecast_service.forecast_writer import ForecastWriter
+from backend.forecast_service.model_events import ModelEventSubscriber
+from backend.forecast_service.model_loader import ModelVersionUnavailableError
 from backend.forecast_service.config import forecast_settings
-from typing import List, Optional
+from typing import Dict, Any, List, Optional
 from uuid import UUID
 import time
+import asyncio
 import httpx
 
 app = FastAPI(
@@ -16,11 +20,54 @@ app = FastAPI(
 
 predictor = ForecastPredictor()
 http_client = httpx.AsyncClient()
+forecast_writer = ForecastWriter(http_client)
+
+
+def _on_model_version_change(model_id: str):
+    """Перепроверка закешированной модели и сброс ее прогнозов после смены версии"""
+    predictor.model_loader.invalidate(model_id)
+    if predictor.result_cache is not None:
+        predictor.result_cache.invalidate(model_id=model_id)
+
+
+model_events = ModelEventSubscriber(_on_model_version_change) if forecast_settings.MODEL_EVENTS_ENABLED else None
+
+DEFAULT_MODEL_ID = "00000000-0000-0000-0000-000000000001"
+
+# Состояние прогрева моделей (для readiness)
+warm_up_state = {"ready": not forecast_settings.MODEL_WARMUP_ENABLED, "result": None}
+
+
+async def _warm_up():
+    """Прогрев моделей; сервис готов после завершения (даже при ошибках - тогда загрузка ленивая)"""
+    try:
+        warm_up_state["result"] = await asyncio.wait_for(
+            predictor.warm_up(),
+            timeout=forecast_settings.MODEL_WARMUP_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        warm_up_state["result"] = {"error": str(e) or type(e).__name__}
+    finally:
+        warm_up_state["ready"] = True
+        print(f"Model warm-up finished: {warm_up_state['result']}")
+
+
+@app.on_event("startup")
+async def startup():
+    forecast_writer.start()
+    if model_events is not None:
+        model_events.start()
+    if forecast_settings.MODEL_WARMUP_ENABLED:
+        # В фоне: liveness отвечает сразу, readiness ждет прогрева
+        app.state.warm_up_task = asyncio.create_task(_warm_up())
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    if model_events is not None:
+        await model_events.close()
     await predictor.close()
+    await forecast_writer.close()
     await http_client.aclose()
 
 
@@ -34,6 +81,14 @@ async def health():
     )
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 503, пока не завершен прогрев моделей"""
+    if not warm_up_state["ready"]:
+        raise HTTPException(status_code=503, detail="Model warm-up in progress")
+    return {"status": "ready", "warm_up": warm_up_state["result"]}
+
+
 @app.get("/forecast/{asset_id}")
 async def get_forecast(
     asset_id: str,
@@ -41,7 +96,7 @@ async def get_forecast(
     horizons: Optional[str] = Query("1,7,30"),  # дни
     save: bool = Query(True)
 ):
-    """Получение прогноза для актива"""
+    """Получение прогноза для актива (из кеша - с "cached": true и временем исходного расчета)"""
     try:
         # Парсинг горизонтов
         horizon_list = [int(h.strip()) for h in horizons.split(",")]
@@ -50,38 +105,130 @@ async def get_forecast(
         if not model_id:
             # В реальной реализации здесь будет логика выбора модели
             # Для примера используем фиксированный ID
-            model_id = "00000000-0000-0000-0000-000000000001"
+            model_id = DEFAULT_MODEL_ID
         
         # Выполнение прогноза
         forecast_result = await predictor.predict(asset_id, model_id, horizon_list)
         
-        # Сохранение в Forecast Storage
+        # Сохранение в Forecast Storage - в фоне, пакетами (ответ не ждет хранилище)
         if save:
-            for horizon_key, forecast_data in forecast_result["forecasts"].items():
-                horizon = int(horizon_key.split("_")[1])
-                forecast_payload = {
-                    "asset_id": asset_id,
-                    "model_version_id": model_id,
-                    "timestamp_forecasted": forecast_result["timestamp_forecasted"],
-                    "horizon": horizon,
-                    "point_forecast": forecast_data["point_forecast"],
-                    "low_bound": forecast_data["low_bound"],
-                    "high_bound": forecast_data["high_bound"]
-                }
-                
-                try:
-                    await http_client.post(
-                        f"{forecast_settings.FORECAST_STORAGE_URL}/forecasts",
-                        json=forecast_payload
-                    )
-                except Exception as e:
-                    print(f"Failed to save forecast: {e}")
+            await _save_forecast(forecast_result)
         
         return forecast_result
+    except ModelVersionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        # Нет фичей или модель не обучена на запрошенные горизонты
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _save_forecast(forecast_result: Dict[str, Any]):
+    """Постановка прогноза в очередь записи, если он еще не сохранен (в т.ч. прогноз из кеша)"""
+    cache = predictor.result_cache
+    if cache is None:
+        await forecast_writer.submit(_storage_payloads(forecast_result))
+        return
+    if not await cache.claim_save(forecast_result):
+        return
+    # Потерянные при записи прогнозы снова доступны для сохранения
+    await forecast_writer.submit(
+        _storage_payloads(forecast_result),
+        on_drop=lambda: cache.release_save(forecast_result)
+    )
+
+
+def _storage_payloads(forecast_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Записи Forecast Storage (по одной на горизонт) для результата прогноза"""
+    return [
+        {
+            "asset_id": forecast_result["asset_id"],
+            "model_version_id": forecast_result["model_id"],
+            "timestamp_forecasted": forecast_result["timestamp_forecasted"],
+            "horizon": int(horizon_key.split("_")[1]),
+            "point_forecast": forecast_data["point_forecast"],
+            "low_bound": forecast_data["low_bound"],
+            "high_bound": forecast_data["high_bound"]
+        }
+        for horizon_key, forecast_data in forecast_result["forecasts"].items()
+    ]
+
+
+@app.post("/forecast/batch")
+async def get_forecast_batch(
+    asset_ids: List[str] = Body(..., embed=True),
+    model_id: Optional[str] = Body(None, embed=True),
+    asset_models: Optional[Dict[str, str]] = Body(None, embed=True),  # asset_id -> model_id
+    horizons: List[int] = Body([1, 7, 30], embed=True),  # дни
+    save: bool = Body(True, embed=True)
+):
+    """Прогноз для многих активов: один запрос фичей, один predict на модель, одна запись в хранилище"""
+    default_model_id = model_id or DEFAULT_MODEL_ID
+    asset_models = {
+        asset_id: (asset_models or {}).get(asset_id, default_model_id)
+        for asset_id in dict.fromkeys(asset_ids)
+    }
+    
+    try:
+        batch_result = await predictor.predict_batch(asset_models, horizons)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Feature Pipeline unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # Сохранение всех прогнозов в Forecast Storage через очередь пакетной записи
+    if save and batch_result["results"]:
+        await forecast_writer.submit(
+            [payload for result in batch_result["results"] for payload in _storage_payloads(result)]
+        )
+    
+    return batch_result
+
+
+@app.get("/models/cache/stats")
+async def model_cache_stats():
+    """Счетчики кеша моделей: попадания, промахи, вытеснения, занятая память"""
+    return predictor.model_loader.cache_stats()
+
+
+@app.get("/predictor/batching/stats")
+async def predictor_batching_stats():
+    """Micro-batching прогнозов: глубина очередей по моделям и размеры батчей"""
+    if predictor.batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **predictor.batcher.stats()}
+
+
+@app.get("/storage/writer/stats")
+async def forecast_writer_stats():
+    """Состояние очереди записи прогнозов в Forecast Storage"""
+    return forecast_writer.stats()
+
+
+@app.post("/models/{model_id}/invalidate")
+async def invalidate_model(model_id: str):
+    """Смена версии модели на этой реплике (резервный путь, если Redis pub/sub недоступен)"""
+    _on_model_version_change(model_id)
+    return {"status": "ok", "model_id": model_id}
+
+
+@app.get("/forecast/cache/stats")
+async def forecast_cache_stats():
+    """Кеш результатов прогноза: попадания (в памяти и Redis), промахи, объединенные запросы"""
+    if predictor.result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **predictor.result_cache.stats()}
+
+
+@app.post("/forecast/cache/invalidate")
+async def invalidate_forecast_cache(asset_id: Optional[str] = Query(None), model_id: Optional[str] = Query(None)):
+    """Сброс закешированных прогнозов актива и/или модели (без параметров - всех)"""
+    if predictor.result_cache is None:
+        return {"invalidated": 0}
+    return {"invalidated": predictor.result_cache.invalidate(asset_id, model_id)}
+
+
 @app.get("/forecast/{asset_id}/latest")
 async def get_latest_forecast(
     asset_id: str,
@@ -0,0 +1,131 @@
+"""Объединение конкурентных прогнозов одной модели в батч (micro-batching)"""
+import asyncio
+import numpy as np
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """Очередь строк фичей на модель с одним батчевым predict на группу запросов.
+    
+    Запросы к одной модели копятся не дольше max_wait_ms или до max_batch_size строк,
+    затем выполняется один predict_with_quantiles в пуле потоков, и каждому вызывающему
+    возвращаются его строки. Обработчик очереди модели живет, пока есть запросы,
+    поэтому выгруженные из кеша модели не удерживаются в памяти.
+    """
+    
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Ключ - id(модели): модель удерживается обработчиком, пока он есть в словаре
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._labels: Dict[int, str] = {}
+        self.batches = 0
+        self.rows = 0
+        self.max_observed_batch = 0
+        self.batch_sizes: Deque[int] = deque(maxlen=1000)
+    
+    async def predict(self, model: Any, X: np.ndarray, label: str = "") -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Прогноз строк X в составе общего батча: (точечный прогноз, квантили)"""
+        key = id(model)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[key] = queue
+            self._labels[key] = label
+            self._workers[key] = asyncio.create_task(self._run(key, model, queue))
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((X, future))
+        return await future
+    
+    async def _next_batch(self, queue: asyncio.Queue) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """Первый запрос и добор до max_batch_size строк или до истечения max_wait"""
+        batch = [queue.get_nowait()]
+        rows = batch[0][0].shape[0]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch_size:
+            if queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = queue.get_nowait()
+            batch.append(item)
+            rows += item[0].shape[0]
+        return batch
+    
+    async def _run(self, key: int, model: Any, queue: asyncio.Queue):
+        try:
+            while not queue.empty():
+                batch = await self._next_batch(queue)
+                # Отмененные вызывающие (отключившиеся клиенты) не попадают в predict
+                batch = [(X, future) for X, future in batch if not future.done()]
+                if batch:
+                    await self._predict_batch(model, batch)
+        finally:
+            del self._queues[key]
+            del self._workers[key]
+            del self._labels[key]
+            # Запросы, поставленные после остановки обработчика (при отмене задачи)
+            while not queue.empty():
+                _, future = queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Micro-batcher stopped"))
+    
+    async def _predict_batch(self, model: Any, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        """Один predict на весь батч и раздача результатов по вызывающим"""
+        X = np.concatenate([rows for rows, _ in batch]) if len(batch) > 1 else batch[0][0]
+        self.batches += 1
+        self.rows += X.shape[0]
+        self.max_observed_batch = max(self.max_observed_batch, X.shape[0])
+        self.batch_sizes.append(X.shape[0])
+        try:
+            point, quantile_preds = await asyncio.to_thread(model.predict_with_quantiles, X)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        offset = 0
+        for rows, future in batch:
+            end = offset + rows.shape[0]
+            if not future.done():
+                future.set_result((
+                    point[offset:end],
+                    quantile_preds[offset:end] if quantile_preds is not None else None
+                ))
+            offset = end
+    
+    async def close(self):
+        """Остановка обработчиков очередей"""
+        for task in list(self._workers.values()):
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очередей и размеры батчей"""
+        queue_depth: Dict[str, int] = {}
+        for key, queue in self._queues.items():
+            label = self._labels[key]
+            queue_depth[label] = queue_depth.get(label, 0) + queue.qsize()
+        recent = list(self.batch_sizes)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "active_models": len(self._workers),
+            "queue_depth": sum(queue_depth.values()),
+            "queue_depth_by_model": queue_depth,
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size_observed": self.max_observed_batch,
+            "recent_batch_size_p50": float(np.percentile(recent, 50)) if recent else 0.0,
+            "recent_batch_size_p99": float(np.percentile(recent, 99)) if recent else 0.0
+        }
@@ -0,0 +1,108 @@
+"""LRU-кеш загруженных моделей с бюджетом памяти"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+async def single_flight(inflight: Dict[Hashable, asyncio.Task], key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Одна загрузка на ключ: конкурентные вызовы ждут общую задачу.
+    
+    Задача защищена от отмены ожидающих (shield), поэтому отключившийся клиент
+    не прерывает загрузку для остальных.
+    """
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(factory())
+        inflight[key] = task
+        
+        def _done(finished: asyncio.Task):
+            inflight.pop(key, None)
+            # Ошибка доставляется ожидающим; помечаем ее полученной, если их не осталось
+            if not finished.cancelled():
+                finished.exception()
+        
+        task.add_done_callback(_done)
+    return await asyncio.shield(task)
+
+
+class ModelCache:
+    """LRU-кеш моделей по ключу (model_id, version_id) с ограничением по байтам.
+    
+    Размер модели - размер ее артефакта. Вытесняются давно не использованные
+    модели, пока суммарный размер превышает бюджет (последняя модель остается всегда).
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.load_failures = 0
+    
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._entries
+    
+    def get(self, key: Tuple[str, str]) -> Any:
+        """Модель из кеша (None при промахе) с обновлением позиции LRU"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+    
+    def put(self, key: Tuple[str, str], model: Any, size_bytes: int):
+        """Добавление модели и вытеснение LRU-записей сверх бюджета"""
+        self.discard(key)
+        self._entries[key] = (model, size_bytes)
+        self.total_bytes += size_bytes
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+    
+    def discard(self, key: Tuple[str, str]):
+        """Удаление модели (например, версии, снятой с продакшна)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+    
+    async def get_or_load(self, key: Tuple[str, str], loader: Callable[[], Awaitable[Tuple[Any, int]]]) -> Any:
+        """Модель из кеша или загрузка через loader() -> (модель, размер в байтах)"""
+        model = self.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+        
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        
+        async def load() -> Any:
+            try:
+                loaded, size_bytes = await loader()
+            except Exception:
+                self.load_failures += 1
+                raise
+            self.put(key, loaded, size_bytes)
+            return loaded
+        
+        return await single_flight(self._inflight, key, load)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики и заполненность кеша"""
+        return {
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "load_failures": self.load_failures,
+            "keys": [f"{model_id}:{version_id}" for model_id, version_id in self._entries]
+        }
@@ -0,0 +1,51 @@
+"""Подписка на события смены версий моделей (Redis pub/sub от Model Registry)"""
+import asyncio
+import redis.asyncio as redis
+from typing import Callable, Optional
+from backend.forecast_service.config import forecast_settings
+
+
+class ModelEventSubscriber:
+    """Фоновая подписка на канал MODEL_EVENTS_CHANNEL.
+    
+    Сообщение - id модели; каждая реплика получает его и сбрасывает свой кеш.
+    При потере соединения подписка восстанавливается; пропущенные за это время
+    смены версий подхватываются по MODEL_METADATA_TTL_SECONDS.
+    """
+    
+    def __init__(self, on_change: Callable[[str], None]):
+        self.on_change = on_change
+        self.redis = redis.Redis(
+            host=forecast_settings.REDIS_HOST,
+            port=forecast_settings.REDIS_PORT,
+            decode_responses=True
+        )
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(forecast_settings.MODEL_EVENTS_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        self.received += 1
+                        try:
+                            self.on_change(message["data"])
+                        except Exception as e:
+                            print(f"Model event handling failed for {message['data']}: {e}")
+            except redis.RedisError as e:
+                print(f"Model events subscription lost: {e}")
+            await asyncio.sleep(forecast_settings.MODEL_EVENTS_RECONNECT_SECONDS)
+    
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.redis.aclose()
@@ -1,18 +1,61 @@
 """Загрузчик моделей из Model Registry и S3"""
 import httpx
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 from botocore.config import Config
 from io import BytesIO
 import lightgbm as lgb
 import torch
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Deque, List, Optional, Tuple
 from backend.forecast_service.config import forecast_settings
-from backend.model_training.trainers import LightGBMTrainer, NeuralTrainer
+from backend.forecast_service.model_cache import ModelCache, single_flight
+from backend.model_training.trainers import LightGBMTrainer
+from backend.model_training.trainers.neural_trainer import SimpleTimeSeriesNN
+from backend.model_training.model_bundle import MultiHorizonModel, is_bundle
 from uuid import UUID
 
 
+class ModelVersionUnavailableError(Exception):
+    """Продакшн-версию не удается подтвердить в Model Registry дольше допустимого"""
+
+
+class CachedVersion:
+    """Запись продакшн-версии из Model Registry и ее ETag"""
+    
+    def __init__(self, version: Dict[str, Any], etag: Optional[str]):
+        self.version = version
+        self.etag = etag
+        self.checked_at = time.monotonic()
+    
+    @property
+    def version_id(self) -> str:
+        return str(self.version.get("id") or self.version.get("version"))
+    
+    @property
+    def age(self) -> float:
+        """Секунд с последнего подтверждения версии в Model Registry"""
+        return time.monotonic() - self.checked_at
+    
+    def is_fresh(self) -> bool:
+        return self.age < forecast_settings.MODEL_METADATA_TTL_SECONDS
+    
+    def is_expired(self) -> bool:
+        return self.age >= forecast_settings.MODEL_METADATA_MAX_STALE_SECONDS
+
+
 class ModelLoader:
-    """Загрузчик и кеширование моделей"""
+    """Загрузчик и кеширование моделей.
+    
+    Продакшн-версия модели кешируется отдельно от самих моделей. По истечении TTL
+    запрос сразу получает закешированную модель, а версия перепроверяется в фоне
+    (If-None-Match) - задержка прогноза не зависит от Model Registry. Версия, которую
+    не удается подтвердить дольше MODEL_METADATA_MAX_STALE_SECONDS, не используется:
+    запрос ждет перепроверку и при ее сбое получает ModelVersionUnavailableError.
+    Модели хранятся в LRU-кеше по (model_id, version_id) с бюджетом памяти.
+    """
     
     def __init__(self):
         self.http_client = httpx.AsyncClient()
@@ -23,78 +66,265 @@ class ModelLoader:
             aws_secret_access_key=forecast_settings.MINIO_SECRET_KEY,
             config=Config(signature_version='s3v4')
         )
-        self.model_cache: Dict[str, Any] = {}
+        self.versions: Dict[str, CachedVersion] = {}
+        self.model_cache = ModelCache(forecast_settings.MODEL_CACHE_MAX_BYTES)
+        self._version_fetches: Dict[str, asyncio.Task] = {}
+        self._revalidations: Dict[str, asyncio.Task] = {}
+        # Отдельный пул для блокирующих boto3 и десериализации - event loop не блокируется
+        self.executor = ThreadPoolExecutor(
+            max_workers=forecast_settings.MODEL_LOAD_WORKERS,
+            thread_name_prefix="model-loader"
+        )
+        self.load_timings: Deque[Dict[str, Any]] = deque(maxlen=50)
         self.lightgbm_trainer = LightGBMTrainer()
     
     async def get_prod_model_version(self, model_id: UUID) -> Dict[str, Any]:
-        """Получение продакшн-версии модели из Model Registry"""
+        """Получение продакшн-версии модели (из кеша, если модель уже загружена)"""
+        cached = self.versions.get(str(model_id))
+        if cached is not None:
+            return cached.version
+        version, _ = await self.fetch_prod_model_version(model_id)
+        return version
+    
+    async def fetch_prod_model_version(self, model_id: UUID, etag: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Запрос продакшн-версии в Model Registry.
+        
+        С etag выполняется условный запрос: (None, etag), если версия не изменилась.
+        """
         url = f"{forecast_settings.MODEL_REGISTRY_URL}/models/{model_id}/versions/prod"
-        response = await self.http_client.get(url)
+        headers = {"If-None-Match": etag} if etag else None
+        response = await self.http_client.get(url, headers=headers)
+        if response.status_code == 304:
+            return None, etag
         if response.status_code == 200:
-            return response.json()
+            return response.json(), response.headers.get("ETag")
         raise ValueError(f"No production model found for {model_id}")
     
-    async def load_model_from_s3(self, artifact_path: str, model_type: str) -> Any:
-        """Загрузка модели из S3"""
+    def download_artifact(self, artifact_path: str) -> bytes:
+        """Загрузка артефакта модели из S3"""
         # Парсинг пути S3
         bucket = forecast_settings.MINIO_BUCKET_MODELS
         key = artifact_path.replace(f"s3://{bucket}/", "").lstrip("/")
         
-        # Загрузка из S3
+        # Потоковое чтение из S3 в заранее выделенный буфер
         response = self.s3_client.get_object(Bucket=bucket, Key=key)
-        model_bytes = response['Body'].read()
+        buffer = bytearray(response.get('ContentLength') or 0)
+        offset = 0
+        for chunk in response['Body'].iter_chunks(chunk_size=forecast_settings.MODEL_DOWNLOAD_CHUNK_SIZE):
+            end = offset + len(chunk)
+            buffer[offset:end] = chunk
+            offset = end
+        del buffer[offset:]
+        return bytes(buffer)
+    
+    async def load_model_from_s3(self, artifact_path: str, model_type: str) -> MultiHorizonModel:
+        """Загрузка модели из S3 (скачивание и десериализация вне event loop)"""
+        model, _ = await self._load_artifact(artifact_path, model_type)
+        return model
+    
+    async def _load_artifact(
+        self,
+        artifact_path: str,
+        model_type: str,
+        model_id: Optional[str] = None,
+        backend: str = "native"
+    ) -> Tuple[MultiHorizonModel, int]:
+        """Скачивание и десериализация в пуле потоков с замером времени этапов"""
+        loop = asyncio.get_running_loop()
+        
+        started = time.perf_counter()
+        model_bytes = await loop.run_in_executor(self.executor, self.download_artifact, artifact_path)
+        downloaded = time.perf_counter()
+        model = await loop.run_in_executor(self.executor, self.deserialize_model, model_bytes, model_type, backend)
+        finished = time.perf_counter()
         
-        # Десериализация в зависимости от типа
+        timing = {
+            "model_id": model_id,
+            "artifact_path": artifact_path,
+            "bytes": len(model_bytes),
+            "backend": model.backend,
+            "download_ms": round((downloaded - started) * 1000, 2),
+            "deserialize_ms": round((finished - downloaded) * 1000, 2),
+            "total_ms": round((finished - started) * 1000, 2)
+        }
+        self.load_timings.append(timing)
+        print(f"Model loaded: {timing}")
+        return model, len(model_bytes)
+    
+    def deserialize_model(self, model_bytes: bytes, model_type: str, backend: str = "native") -> MultiHorizonModel:
+        """Десериализация артефакта (bundle или одиночная модель старого формата)"""
+        # Bundle со всеми горизонтами
+        if is_bundle(model_bytes):
+            return MultiHorizonModel.from_bytes(model_bytes, backend)
+        
+        # Артефакт старого формата - одна модель на горизонт 1 день
         if model_type == "lightgbm":
-            buffer = BytesIO(model_bytes)
-            model = lgb.Booster(model_file=buffer)
-            return model
+            model = lgb.Booster(model_str=model_bytes.decode())
+            return MultiHorizonModel(model_type, [1], [model])
         elif model_type == "neural":
-            # Для нейросетевых моделей нужен input_size
-            # В реальной реализации это должно храниться в метаданных модели
             buffer = BytesIO(model_bytes)
             state_dict = torch.load(buffer, map_location='cpu')
-            # Создание модели с правильной архитектурой
-            # Здесь упрощенно - в реальности нужна полная архитектура
-            from backend.model_training.trainers.neural_trainer import SimpleTimeSeriesNN
-            input_size = 10  # Должно быть из метаданных
+            # Размерность входа берется из весов LSTM
+            input_size = state_dict['lstm.weight_ih_l0'].shape[1]
             model = SimpleTimeSeriesNN(input_size=input_size)
             model.load_state_dict(state_dict)
             model.eval()
-            return model
+            return MultiHorizonModel(model_type, [1], model)
         else:
             raise ValueError(f"Unknown model type: {model_type}")
     
-    async def get_model(self, model_id: UUID, use_cache: bool = True) -> Any:
+    async def _load_version(self, model_version: Dict[str, Any]) -> Tuple[MultiHorizonModel, int]:
+        """Загрузка артефакта версии модели: (модель, размер артефакта в байтах)"""
+        artifact_path = model_version.get("artifact_path")
+        training_config = model_version.get("training_config") or {}
+        model_type = training_config.get("model_type", "lightgbm")
+        # Backend выбирается для каждой модели, по умолчанию - из настроек сервиса
+        backend = training_config.get("inference_backend", forecast_settings.INFERENCE_BACKEND)
+        
+        if not artifact_path:
+            raise ValueError("Model artifact path not found")
+        
+        return await self._load_artifact(artifact_path, model_type, model_version.get("model_id"), backend)
+    
+    async def _fetch_version(self, model_id: UUID) -> CachedVersion:
+        model_version, etag = await self.fetch_prod_model_version(model_id)
+        cached = CachedVersion(model_version, etag)
+        self.versions[str(model_id)] = cached
+        return cached
+    
+    async def get_model(self, model_id: UUID, use_cache: bool = True) -> MultiHorizonModel:
         """Получение модели (с кешированием)"""
+        model, _ = await self.get_model_with_version(model_id, use_cache)
+        return model
+    
+    async def get_model_with_version(self, model_id: UUID, use_cache: bool = True) -> Tuple[MultiHorizonModel, str]:
+        """Модель и id ее продакшн-версии"""
         cache_key = str(model_id)
+        if not use_cache:
+            model_version, _ = await self.fetch_prod_model_version(model_id)
+            model, _ = await self._load_version(model_version)
+            return model, CachedVersion(model_version, None).version_id
         
-        # Проверка кеша
-        if use_cache and cache_key in self.model_cache:
-            return self.model_cache[cache_key]
+        # Устаревшая версия используется сразу, перепроверка - в фоне
+        cached = self.versions.get(cache_key)
+        if cached is None:
+            cached = await single_flight(self._version_fetches, cache_key, lambda: self._fetch_version(model_id))
+        elif cached.is_expired():
+            # Возможно, версия давно сменилась (пропущено уведомление) - ждем ответа Registry
+            await asyncio.shield(self._schedule_revalidation(model_id))
+            cached = self.versions.get(cache_key)
+            if cached is None or cached.is_expired():
+                raise ModelVersionUnavailableError(
+                    f"Production version of model {model_id} could not be revalidated "
+                    f"for over {forecast_settings.MODEL_METADATA_MAX_STALE_SECONDS}s"
+                )
+        elif not cached.is_fresh():
+            self._schedule_revalidation(model_id)
         
-        # Получение информации о модели
-        model_version = await self.get_prod_model_version(model_id)
-        artifact_path = model_version.get("artifact_path")
-        model_type = model_version.get("training_config", {}).get("model_type", "lightgbm")
+        # Конкурентные запросы холодной модели разделяют одну загрузку
+        model = await self.model_cache.get_or_load(
+            (cache_key, cached.version_id),
+            lambda: self._load_version(cached.version)
+        )
+        return model, cached.version_id
+    
+    def _schedule_revalidation(self, model_id: UUID) -> asyncio.Task:
+        """Фоновая перепроверка версии (не более одной одновременно на модель)"""
+        cache_key = str(model_id)
+        task = self._revalidations.get(cache_key)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(self._revalidate(model_id))
+        self._revalidations[cache_key] = task
+        task.add_done_callback(lambda _: self._revalidations.pop(cache_key, None))
+        return task
+    
+    async def _revalidate(self, model_id: UUID):
+        """Условный запрос версии: 304 продлевает TTL, новая версия - загрузка и переключение"""
+        cache_key = str(model_id)
+        cached = self.versions.get(cache_key)
+        if cached is None:
+            return
+        try:
+            model_version, etag = await self.fetch_prod_model_version(model_id, cached.etag)
+            if model_version is None or CachedVersion(model_version, etag).version_id == cached.version_id:
+                cached.version = model_version or cached.version
+                cached.etag = etag
+                cached.checked_at = time.monotonic()
+                return
+            
+            # Новая версия загружается до переключения - запросы не ждут загрузки
+            new_version = CachedVersion(model_version, etag)
+            await self.model_cache.get_or_load(
+                (cache_key, new_version.version_id),
+                lambda: self._load_version(model_version)
+            )
+            self.versions[cache_key] = new_version
+            self.model_cache.discard((cache_key, cached.version_id))
+        except Exception as e:
+            # Registry/S3 недоступны - закешированная версия отдается до MODEL_METADATA_MAX_STALE_SECONDS
+            print(
+                f"Model {model_id} revalidation failed, serving cached version {cached.version_id} "
+                f"confirmed {cached.age:.0f}s ago: {e}"
+            )
+    
+    async def fetch_active_versions(self, statuses: List[str] = ["prod", "canary"]) -> List[Dict[str, Any]]:
+        """Версии всех моделей с указанными статусами из Model Registry"""
+        url = f"{forecast_settings.MODEL_REGISTRY_URL}/model-versions"
+        response = await self.http_client.get(url, params={"status": statuses})
+        response.raise_for_status()
+        return response.json()
+    
+    async def preload(self) -> Tuple[Dict[str, MultiHorizonModel], Dict[str, str]]:
+        """Параллельная загрузка всех prod/canary версий в кеш.
         
-        if not artifact_path:
-            raise ValueError("Model artifact path not found")
+        Для prod-версий сразу заполняется запись продакшн-версии модели.
+        Возвращает загруженные модели и ошибки по ключу "model_id:version_id".
+        """
+        versions = await self.fetch_active_versions()
         
-        # Загрузка модели
-        model = await self.load_model_from_s3(artifact_path, model_type)
+        async def load(model_version: Dict[str, Any]) -> MultiHorizonModel:
+            model_id = str(model_version["model_id"])
+            cached = CachedVersion(model_version, None)
+            model = await self.model_cache.get_or_load(
+                (model_id, cached.version_id),
+                lambda: self._load_version(model_version)
+            )
+            if model_version.get("status") == "prod":
+                self.versions.setdefault(model_id, cached)
+            return model
         
-        # Кеширование
-        if use_cache:
-            if len(self.model_cache) >= forecast_settings.MODEL_CACHE_SIZE:
-                # Удаление самого старого элемента (FIFO)
-                oldest_key = next(iter(self.model_cache))
-                del self.model_cache[oldest_key]
-            self.model_cache[cache_key] = model
+        keys = [f"{version['model_id']}:{CachedVersion(version, None).version_id}" for version in versions]
+        results = await asyncio.gather(*(load(version) for version in versions), return_exceptions=True)
         
-        return model
+        models, errors = {}, {}
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                errors[key] = str(result)
+            else:
+                models[key] = result
+        return models, errors
+    
+    def invalidate(self, model_id: UUID):
+        """Уведомление об изменении версии: немедленная фоновая перепроверка"""
+        cached = self.versions.get(str(model_id))
+        if cached is not None:
+            # Версия устаревает сразу, но до перепроверки запросы не ждут Registry
+            cached.checked_at = min(cached.checked_at, time.monotonic() - forecast_settings.MODEL_METADATA_TTL_SECONDS)
+            self._schedule_revalidation(model_id)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Статистика кеша моделей"""
+        return {
+            **self.model_cache.stats(),
+            "versions": len(self.versions),
+            "recent_loads": list(self.load_timings)
+        }
     
     async def close(self):
         """Закрытие соединений"""
+        for task in list(self._revalidations.values()):
+            task.cancel()
         await self.http_client.aclose()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
@@ -3,10 +3,22 @@ import numpy as np
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import httpx
-import torch
+import asyncio
+import time
+from weakref import WeakKeyDictionary
 from backend.forecast_service.config import forecast_settings
 from backend.forecast_service.model_loader import ModelLoader
-from backend.model_training.trainers import LightGBMTrainer, NeuralTrainer
+from backend.forecast_service.feature_assembler import FeatureAssembler
+from backend.forecast_service.micro_batcher import MicroBatcher
+from backend.forecast_service.forecast_cache import ForecastResultCache
+from backend.model_training.model_bundle import MultiHorizonModel
+
+
+# Порядок фичей артефактов, обученных до сохранения схемы фичей в bundle
+LEGACY_FEATURE_ORDER = [
+    'close_lag_1', 'close_lag_2', 'close_ma_5', 'close_ma_10',
+    'close_volatility_5', 'news_count', 'avg_sentiment'
+]
 
 
 class ForecastPredictor:
@@ -15,8 +27,16 @@ class ForecastPredictor:
     def __init__(self):
         self.model_loader = ModelLoader()
         self.http_client = httpx.AsyncClient()
-        self.lightgbm_trainer = LightGBMTrainer()
-        self.neural_trainer = NeuralTrainer()
+        self._assemblers: "WeakKeyDictionary[MultiHorizonModel, FeatureAssembler]" = WeakKeyDictionary()
+        self.batcher: Optional[MicroBatcher] = None
+        if forecast_settings.PREDICT_BATCHING_ENABLED:
+            self.batcher = MicroBatcher(
+                forecast_settings.PREDICT_BATCH_MAX_SIZE,
+                forecast_settings.PREDICT_BATCH_MAX_WAIT_MS
+            )
+        self.result_cache: Optional[ForecastResultCache] = None
+        if forecast_settings.FORECAST_CACHE_ENABLED:
+            self.result_cache = ForecastResultCache()
     
     async def get_features(self, asset_id: str) -> Optional[Dict[str, Any]]:
         """Получение фичей из Feature Pipeline"""
@@ -26,73 +46,168 @@ class ForecastPredictor:
             return response.json()
         return None
     
-    def prepare_features_array(self, features: Dict[str, Any], feature_order: List[str]) -> np.ndarray:
-        """Подготовка массива фичей для модели"""
-        feature_values = []
-        for feature_name in feature_order:
-            value = features.get(feature_name, 0.0)
-            if isinstance(value, (int, float)):
-                feature_values.append(float(value))
-            else:
-                feature_values.append(0.0)
-        return np.array(feature_values).reshape(1, -1)
+    async def get_features_bulk(self, asset_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Получение фичей нескольких активов одним запросом к Feature Pipeline"""
+        url = f"{forecast_settings.FEATURE_PIPELINE_URL}/features/online/batch"
+        response = await self.http_client.post(url, json=asset_ids, params={"lookback_hours": 24})
+        response.raise_for_status()
+        return response.json()
+    
+    def get_assembler(self, model: MultiHorizonModel) -> FeatureAssembler:
+        """Сборщик входа по схеме фичей модели (компилируется один раз на модель)"""
+        assembler = self._assemblers.get(model)
+        if assembler is None:
+            schema = model.feature_schema
+            columns = schema["columns"] if schema else LEGACY_FEATURE_ORDER
+            # LightGBM обучен с пропусками (NaN) и обрабатывает их сам, нейросеть - нет
+            fill_value = np.nan if model.model_type == "lightgbm" else 0.0
+            assembler = FeatureAssembler(columns, fill_value)
+            self._assemblers[model] = assembler
+        return assembler
+    
+    @staticmethod
+    def format_forecasts(
+        horizons: List[int],
+        point_forecasts: np.ndarray,
+        quantile_forecasts: Optional[np.ndarray]
+    ) -> Dict[str, Dict[str, float]]:
+        """Прогнозы одного актива по горизонтам: точечный прогноз и границы интервала"""
+        if quantile_forecasts is not None:
+            # Крайние квантили (0.1 / 0.9) - границы интервала
+            low_bounds = quantile_forecasts[:, 0]
+            high_bounds = quantile_forecasts[:, -1]
+        else:
+            # Артефакты без квантильных моделей - фиксированный диапазон ±5%
+            low_bounds = point_forecasts * 0.95
+            high_bounds = point_forecasts * 1.05
+        
+        return {
+            f"horizon_{horizon}": {
+                "point_forecast": float(point_forecast),
+                "low_bound": float(low_bound),
+                "high_bound": float(high_bound)
+            }
+            for horizon, point_forecast, low_bound, high_bound in zip(horizons, point_forecasts, low_bounds, high_bounds)
+        }
     
     async def predict(self, asset_id: str, model_id: str, horizons: List[int] = [1, 7, 30]) -> Dict[str, Any]:
-        """Выполнение прогноза"""
+        """Выполнение прогноза.
+        
+        При неизменных фичах и версии модели возвращается ранее рассчитанный прогноз
+        с "cached": True; timestamp_forecasted у него - время исходного расчета.
+        """
         # Получение фичей
         features = await self.get_features(asset_id)
         if not features:
             raise ValueError(f"No features available for asset {asset_id}")
         
-        # Загрузка модели
-        model = await self.model_loader.get_model(model_id)
+        # Загрузка модели (все горизонты в одном артефакте)
+        model, version_id = await self.model_loader.get_model_with_version(model_id)
+        horizon_indices = model.horizon_indices(horizons)
         
-        # Определение типа модели
-        model_version = await self.model_loader.get_prod_model_version(model_id)
-        model_type = model_version.get("training_config", {}).get("model_type", "lightgbm")
+        async def compute() -> Dict[str, Any]:
+            # Схема фичей сохранена в артефакте (у старых артефактов - фиксированный список)
+            X = self.get_assembler(model).assemble([features])
+            
+            # Один вызов на все горизонты; конкурентные запросы к модели объединяются в батч
+            if self.batcher is not None:
+                point, quantile_preds = await self.batcher.predict(model, X, model_id)
+            else:
+                point, quantile_preds = await asyncio.to_thread(model.predict_with_quantiles, X)
+            
+            return {
+                "asset_id": asset_id,
+                "model_id": model_id,
+                "timestamp_forecasted": datetime.utcnow().isoformat(),
+                "forecasts": self.format_forecasts(
+                    horizons,
+                    point[0, horizon_indices],
+                    quantile_preds[0, horizon_indices] if quantile_preds is not None else None
+                )
+            }
         
-        # Подготовка фичей
-        # В реальной реализации порядок фичей должен быть сохранен в метаданных модели
-        feature_order = [
-            'close_lag_1', 'close_lag_2', 'close_ma_5', 'close_ma_10',
-            'close_volatility_5', 'news_count', 'avg_sentiment'
-        ]
-        X = self.prepare_features_array(features, feature_order)
+        if self.result_cache is None:
+            return {**await compute(), "cached": False}
         
-        # Прогнозирование
-        if model_type == "lightgbm":
-            point_forecast = self.lightgbm_trainer.predict(model, X)[0]
-        elif model_type == "neural":
-            X_3d = X.reshape(X.shape[0], 1, X.shape[1])
-            point_forecast = self.neural_trainer.predict(model, X_3d)[0][0]
-        else:
-            raise ValueError(f"Unknown model type: {model_type}")
+        key = self.result_cache.make_key(asset_id, model_id, version_id, features, horizons)
+        result, cached = await self.result_cache.get_or_compute(key, compute)
+        return {**result, "cached": cached}
+    
+    async def predict_batch(self, asset_models: Dict[str, str], horizons: List[int] = [1, 7, 30]) -> Dict[str, Any]:
+        """Прогноз для многих активов: asset_id -> model_id.
         
-        # Вычисление диапазонов (упрощенно - в реальности нужны квантильные модели)
-        low_bound = point_forecast * 0.95
-        high_bound = point_forecast * 1.05
+        Фичи запрашиваются одним вызовом, активы группируются по модели,
+        и для каждой модели выполняется один predict по матрице фичей всех ее активов.
+        Ошибки отдельных активов/моделей возвращаются в errors, не прерывая остальные.
+        """
+        features_by_asset = await self.get_features_bulk(list(asset_models))
+        timestamp_forecasted = datetime.utcnow().isoformat()
         
-        # Прогнозы для разных горизонтов
-        forecasts = {}
-        for horizon in horizons:
-            # Упрощенная экстраполяция для разных горизонтов
-            # В реальности нужны отдельные модели для каждого горизонта
-            horizon_multiplier = 1.0 + (horizon - 1) * 0.01  # Простая линейная экстраполяция
-            forecasts[f"horizon_{horizon}"] = {
-                "point_forecast": float(point_forecast * horizon_multiplier),
-                "low_bound": float(low_bound * horizon_multiplier),
-                "high_bound": float(high_bound * horizon_multiplier)
-            }
+        results: List[Dict[str, Any]] = []
+        errors: Dict[str, str] = {}
+        
+        assets_by_model: Dict[str, List[str]] = {}
+        for asset_id, model_id in asset_models.items():
+            if not features_by_asset.get(asset_id):
+                errors[asset_id] = f"No features available for asset {asset_id}"
+                continue
+            assets_by_model.setdefault(model_id, []).append(asset_id)
+        
+        for model_id, model_asset_ids in assets_by_model.items():
+            try:
+                model = await self.model_loader.get_model(model_id)
+                horizon_indices = model.horizon_indices(horizons)
+            except Exception as e:
+                errors.update({asset_id: str(e) for asset_id in model_asset_ids})
+                continue
+            
+            X = self.get_assembler(model).assemble([features_by_asset[asset_id] for asset_id in model_asset_ids])
+            
+            # Один векторизованный вызов на модель - в потоке, чтобы не блокировать event loop
+            point, quantile_preds = await asyncio.to_thread(model.predict_with_quantiles, X)
+            point = point[:, horizon_indices]
+            if quantile_preds is not None:
+                quantile_preds = quantile_preds[:, horizon_indices]
+            
+            for i, asset_id in enumerate(model_asset_ids):
+                results.append({
+                    "asset_id": asset_id,
+                    "model_id": model_id,
+                    "timestamp_forecasted": timestamp_forecasted,
+                    "forecasts": self.format_forecasts(
+                        horizons,
+                        point[i],
+                        quantile_preds[i] if quantile_preds is not None else None
+                    )
+                })
+        
+        return {"results": results, "errors": errors}
+    
+    async def warm_up(self) -> Dict[str, Any]:
+        """Прогрев: загрузка prod/canary моделей и пробный прогноз каждой"""
+        started = time.perf_counter()
+        models, errors = await self.model_loader.preload()
+        
+        for key, model in models.items():
+            assembler = self.get_assembler(model)
+            try:
+                # Первый вызов инициализирует нативный код LightGBM/torch
+                await asyncio.to_thread(model.predict_with_quantiles, np.zeros((1, assembler.input_size), dtype=np.float32))
+            except Exception as e:
+                errors[key] = f"Warm-up predict failed: {e}"
         
         return {
-            "asset_id": asset_id,
-            "model_id": model_id,
-            "timestamp_forecasted": datetime.utcnow().isoformat(),
-            "forecasts": forecasts
+            "models": len(models),
+            "errors": errors,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
         }
     
     async def close(self):
         """Закрытие соединений"""
+        if self.batcher is not None:
+            await self.batcher.close()
+        if self.result_cache is not None:
+            await self.result_cache.close()
         await self.model_loader.close()
         await self.http_client.aclose()
 
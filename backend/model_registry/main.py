@@ -1,11 +1,15 @@
 """Model Registry Service - управление версиями моделей"""
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
 from backend.model_registry.database import get_db, Base, engine
 from backend.model_registry import models, schemas
 from backend.shared.models import HealthResponse
+from backend.shared.config import settings
+import hashlib
+import httpx
+import redis.asyncio as redis
 import time
 
 app = FastAPI(
@@ -14,12 +18,20 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# События смены версий для всех реплик Forecast Service
+redis_client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, decode_responses=True)
+
 # Создание таблиц при старте
 @app.on_event("startup")
 async def startup():
     Base.metadata.create_all(bind=engine)
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await redis_client.aclose()
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health():
     """Health check"""
@@ -114,6 +126,38 @@ async def get_model_versions(
     return versions
 
 
+def _version_etag(version: models.ModelVersion) -> str:
+    """ETag записи версии: меняется при смене продакшн-версии, статуса или артефакта"""
+    digest = hashlib.sha256(f"{version.id}:{version.status}:{version.artifact_path}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+# Объявлен до /versions/{version_id}, иначе "prod" разбирается как UUID
+@app.get("/models/{model_id}/versions/prod", response_model=schemas.ModelVersionResponse)
+async def get_prod_version(
+    model_id: UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Получение продакшн-версии модели (поддерживает If-None-Match)"""
+    version = db.query(models.ModelVersion).filter(
+        models.ModelVersion.model_id == model_id,
+        models.ModelVersion.status == "prod"
+    ).first()
+    if not version:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No production version found for this model"
+        )
+    
+    etag = _version_etag(version)
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return version
+
+
 @app.get("/models/{model_id}/versions/{version_id}", response_model=schemas.ModelVersionWithMetrics)
 async def get_model_version(
     model_id: UUID,
@@ -145,6 +189,7 @@ async def update_model_version_status(
     model_id: UUID,
     version_id: UUID,
     new_status: str,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Обновление статуса версии модели"""
@@ -175,22 +220,41 @@ async def update_model_version_status(
     version.status = new_status
     db.commit()
     db.refresh(version)
+    
+    # Forecast Service перепроверяет закешированную продакшн-версию
+    background_tasks.add_task(_notify_version_change, model_id)
     return version
 
 
-@app.get("/models/{model_id}/versions/prod", response_model=schemas.ModelVersionResponse)
-async def get_prod_version(model_id: UUID, db: Session = Depends(get_db)):
-    """Получение продакшн-версии модели"""
-    version = db.query(models.ModelVersion).filter(
-        models.ModelVersion.model_id == model_id,
-        models.ModelVersion.status == "prod"
-    ).first()
-    if not version:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No production version found for this model"
-        )
-    return version
+async def _notify_version_change(model_id: UUID):
+    """Уведомление всех реплик Forecast Service о смене версии модели"""
+    try:
+        # Pub/sub: сообщение получает каждая подписанная реплика
+        receivers = await redis_client.publish(settings.MODEL_EVENTS_CHANNEL, str(model_id))
+        if receivers:
+            return
+    except redis.RedisError as e:
+        print(f"Failed to publish version change of model {model_id}: {e}")
+    
+    # Резерв: POST через балансировщик доходит только до одной реплики,
+    # остальные подхватят версию по истечении TTL метаданных
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            await client.post(f"{settings.FORECAST_SERVICE_URL}/models/{model_id}/invalidate")
+    except httpx.HTTPError as e:
+        print(f"Failed to notify forecast service about model {model_id}: {e}")
+
+
+@app.get("/model-versions", response_model=List[schemas.ModelVersionResponse])
+async def get_versions_by_status(
+    status_filter: List[str] = Query(["prod", "canary"], alias="status"),
+    db: Session = Depends(get_db)
+):
+    """Версии всех моделей с указанными статусами (для прогрева Forecast Service)"""
+    versions = db.query(models.ModelVersion).filter(
+        models.ModelVersion.status.in_(status_filter)
+    ).order_by(models.ModelVersion.trained_at.desc()).all()
+    return versions
 
 
 @app.post("/model-versions/{version_id}/metrics", response_model=schemas.ModelMetricResponse, status_code=status.HTTP_201_CREATED)
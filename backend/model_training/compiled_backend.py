@@ -0,0 +1,117 @@
+"""Компилированный backend инференса: ONNX для LightGBM, TorchScript для LSTM
+
+ONNX-зависимости необязательны (extra "compiled"): без них экспорт LightGBM
+пропускается, а модели обслуживаются нативным путем.
+"""
+import numpy as np
+import torch
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import onnxruntime as ort
+    from onnxmltools import convert_lightgbm
+    from onnxmltools.convert.common.data_types import FloatTensorType
+except ImportError:
+    ort = None
+    convert_lightgbm = None
+
+ONNX_AVAILABLE = ort is not None and convert_lightgbm is not None
+
+# Допустимое расхождение компилированного и нативного прогноза при проверке
+PARITY_RTOL = 1e-3
+PARITY_ATOL = 1e-3
+
+
+def export_booster_onnx(booster: Any) -> bytes:
+    """Экспорт бустера LightGBM в ONNX (вход float32 [n, n_features])"""
+    if not ONNX_AVAILABLE:
+        raise RuntimeError("onnxmltools/onnxruntime are not installed")
+    initial_types = [("input", FloatTensorType([None, booster.num_feature()]))]
+    return convert_lightgbm(booster, initial_types=initial_types).SerializeToString()
+
+
+def export_torchscript(network: torch.nn.Module, input_size: int) -> bytes:
+    """Трассировка LSTM в TorchScript (вход float32 [n, 1, input_size])"""
+    network = network.cpu().eval()
+    example = torch.zeros(2, 1, input_size, dtype=torch.float32)
+    with torch.no_grad():
+        traced = torch.jit.trace(network, example)
+    buffer = BytesIO()
+    torch.jit.save(traced, buffer)
+    return buffer.getvalue()
+
+
+class OnnxBoosterRunner:
+    """Прогноз бустера через onnxruntime"""
+    
+    def __init__(self, model_bytes: bytes):
+        options = ort.SessionOptions()
+        # Один поток на вызов: параллелизм дают конкурентные запросы
+        options.intra_op_num_threads = 1
+        self.session = ort.InferenceSession(model_bytes, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(X, dtype=np.float32)})[0].reshape(-1)
+
+
+class TorchScriptRunner:
+    """Прогноз LSTM через TorchScript"""
+    
+    def __init__(self, model_bytes: bytes):
+        self.module = torch.jit.load(BytesIO(model_bytes), map_location="cpu")
+        self.module.eval()
+    
+    def __call__(self, X_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.module(X_tensor)
+
+
+def export_compiled(
+    model_type: str,
+    horizons: List[int],
+    quantiles: List[float],
+    models: Any,
+    quantile_models: Optional[List[List[Any]]]
+) -> Tuple[Dict[str, bytes], Optional[Dict[str, Any]]]:
+    """Компилированные артефакты модели: (файлы для bundle, описание backend или None)"""
+    if model_type == "lightgbm":
+        if not ONNX_AVAILABLE:
+            return {}, None
+        files = {
+            f"compiled/horizon_{horizon}.onnx": export_booster_onnx(booster)
+            for horizon, booster in zip(horizons, models)
+        }
+        if quantile_models is not None:
+            for horizon, horizon_boosters in zip(horizons, quantile_models):
+                for quantile, booster in zip(quantiles, horizon_boosters):
+                    files[f"compiled/horizon_{horizon}_q{quantile}.onnx"] = export_booster_onnx(booster)
+        return files, {"format": "onnx"}
+    elif model_type == "neural":
+        files = {"compiled/model.ts": export_torchscript(models, models.lstm.input_size)}
+        return files, {"format": "torchscript"}
+    raise ValueError(f"Unknown model type: {model_type}")
+
+
+def load_compiled(
+    compiled: Dict[str, Any],
+    horizons: List[int],
+    quantiles: List[float],
+    files: Dict[str, bytes]
+) -> Tuple[Any, Optional[List[List[Any]]]]:
+    """Загрузка компилированных моделей из файлов bundle: (модели, квантильные модели)"""
+    if compiled["format"] == "onnx":
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed")
+        models = [OnnxBoosterRunner(files[f"compiled/horizon_{horizon}.onnx"]) for horizon in horizons]
+        quantile_models = None
+        if quantiles and all(f"compiled/horizon_{horizon}_q{quantile}.onnx" in files for horizon in horizons for quantile in quantiles):
+            quantile_models = [
+                [OnnxBoosterRunner(files[f"compiled/horizon_{horizon}_q{quantile}.onnx"]) for quantile in quantiles]
+                for horizon in horizons
+            ]
+        return models, quantile_models
+    elif compiled["format"] == "torchscript":
+        return TorchScriptRunner(files["compiled/model.ts"]), None
+    raise ValueError(f"Unknown compiled format: {compiled['format']}")
@@ -1,11 +1,13 @@
 """Конфигурация Model Training"""
 from backend.shared.config import settings
 from pydantic_settings import BaseSettings
+from typing import List
 
 
 class TrainingSettings(BaseSettings):
     FEATURE_PIPELINE_URL: str = "http://feature-pipeline:8005"
     MODEL_REGISTRY_URL: str = "http://model-registry:8007"
+    ASSET_SERVICE_URL: str = settings.ASSET_SERVICE_URL
     MINIO_ENDPOINT: str = settings.MINIO_ENDPOINT
     MINIO_ACCESS_KEY: str = settings.MINIO_ACCESS_KEY
     MINIO_SECRET_KEY: str = settings.MINIO_SECRET_KEY
@@ -17,6 +19,20 @@ class TrainingSettings(BaseSettings):
     VALIDATION_SPLIT: float = 0.1
     RANDOM_STATE: int = 42
     
+    # Горизонты прогноза в днях (если у актива нет AssetConfig.forecast_horizons)
+    DEFAULT_FORECAST_HORIZONS: List[int] = [1, 7, 30]
+    
+    # Квантили для интервалов прогноза (крайние - low_bound/high_bound)
+    QUANTILES: List[float] = [0.1, 0.5, 0.9]
+    
+    # Экспорт ONNX/TorchScript-версий моделей в bundle при регистрации
+    EXPORT_COMPILED_MODELS: bool = True
+    
+    # Загрузка фичей из Feature Store
+    FEATURE_CACHE_DIR: str = "/tmp/feature-cache"
+    FEATURE_LOAD_BATCH_SIZE: int = 65536
+    CLICKHOUSE_FEATURES_LAYOUT: str = "long"
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,178 @@
+"""Загрузка фичей из Feature Store для обучения"""
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+from datetime import datetime
+import hashlib
+import json
+import os
+import shutil
+from backend.model_training.config import training_settings
+from backend.feature_pipeline.s3_client import FeatureS3Client
+from backend.feature_pipeline.clickhouse_client import FeatureClickHouseClient
+
+
+class FeatureMatrix:
+    """Матрица фичей для обучения: timestamps, значения float32 и имена колонок"""
+    
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray, feature_names: List[str]):
+        self.timestamps = timestamps
+        self.values = values
+        self.feature_names = feature_names
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+    
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self.feature_names.index(name)]
+
+
+class FeatureLoader:
+    """Потоковая загрузка фичей из Parquet (S3) с fallback на ClickHouse и локальным кешем.
+    
+    Матрица заполняется пачками прямо в предвыделенный float32-массив,
+    поэтому пиковая память ограничена итоговой матрицей и одной пачкой.
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.s3 = FeatureS3Client()
+        self._clickhouse = None
+        self.cache_dir = cache_dir or training_settings.FEATURE_CACHE_DIR
+    
+    @property
+    def clickhouse(self) -> FeatureClickHouseClient:
+        if self._clickhouse is None:
+            self._clickhouse = FeatureClickHouseClient()
+        return self._clickhouse
+    
+    def _cache_path(self, asset_id: str, start_date: datetime, end_date: datetime, feature_names: Optional[List[str]]) -> str:
+        feature_set = json.dumps(sorted(feature_names) if feature_names else "*")
+        feature_hash = hashlib.sha256(feature_set.encode()).hexdigest()[:16]
+        name = f"{start_date:%Y%m%dT%H%M%S}_{end_date:%Y%m%dT%H%M%S}_{feature_hash}"
+        return os.path.join(self.cache_dir, asset_id, name)
+    
+    def _load_cache(self, path: str) -> Optional[FeatureMatrix]:
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return FeatureMatrix(
+            np.load(os.path.join(path, "timestamps.npy")),
+            np.load(os.path.join(path, "values.npy"), mmap_mode='r'),
+            meta["feature_names"]
+        )
+    
+    def _save_cache(self, path: str, matrix: FeatureMatrix):
+        # Запись во временный каталог и атомарное переименование
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "timestamps.npy"), matrix.timestamps)
+        np.save(os.path.join(tmp_path, "values.npy"), matrix.values)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"feature_names": matrix.feature_names}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    
+    def load(
+        self,
+        asset_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        feature_names: Optional[List[str]] = None,
+        use_cache: bool = True
+    ) -> FeatureMatrix:
+        """Загрузка матрицы фичей за период"""
+        cache_path = self._cache_path(asset_id, start_date, end_date, feature_names)
+        if use_cache:
+            cached = self._load_cache(cache_path)
+            if cached is not None:
+                return cached
+        
+        matrix = self._load_from_parquet(asset_id, start_date, end_date, feature_names)
+        if matrix is None:
+            matrix = self._load_from_clickhouse(asset_id, start_date, end_date, feature_names)
+        
+        if use_cache and len(matrix):
+            self._save_cache(cache_path, matrix)
+        return matrix
+    
+    def _load_from_parquet(
+        self,
+        asset_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        feature_names: Optional[List[str]]
+    ) -> Optional[FeatureMatrix]:
+        """Чтение Parquet-датасета пачками в предвыделенную float32-матрицу"""
+        dataset = self.s3.get_dataset(asset_id, start_date, end_date)
+        if dataset is None:
+            return None
+        
+        time_filter = self.s3.time_filter(start_date, end_date)
+        if feature_names is None:
+            feature_names = [name for name in dataset.schema.names if name != 'timestamp']
+        
+        n_rows = dataset.count_rows(filter=time_filter)
+        if n_rows == 0:
+            return None
+        
+        timestamps = np.empty(n_rows, dtype='datetime64[ns]')
+        values = np.empty((n_rows, len(feature_names)), dtype=np.float32)
+        
+        offset = 0
+        for batch in dataset.to_batches(
+            columns=['timestamp'] + feature_names,
+            filter=time_filter,
+            batch_size=training_settings.FEATURE_LOAD_BATCH_SIZE
+        ):
+            size = batch.num_rows
+            timestamps[offset:offset + size] = batch.column(0).to_numpy().astype('datetime64[ns]')
+            for j in range(len(feature_names)):
+                values[offset:offset + size, j] = batch.column(j + 1).to_numpy(zero_copy_only=False)
+            offset += size
+        
+        return self._sorted(FeatureMatrix(timestamps[:offset], values[:offset], feature_names))
+    
+    def _load_from_clickhouse(
+        self,
+        asset_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        feature_names: Optional[List[str]]
+    ) -> FeatureMatrix:
+        """Чтение таблицы features помесячными окнами (каждый чанк сразу в float32)"""
+        layout = training_settings.CLICKHOUSE_FEATURES_LAYOUT
+        timestamp_chunks, value_chunks = [], []
+        
+        chunk_start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + pd.DateOffset(months=1), end)
+            df = self.clickhouse.get_features(asset_id, chunk_start, chunk_end, feature_names, layout=layout)
+            if not df.empty:
+                # Граница chunk_end входит в оба окна - отбрасываем дубль
+                df = df[df['timestamp'] < chunk_end] if chunk_end < end else df
+                if feature_names is None:
+                    feature_names = [name for name in df.columns if name != 'timestamp']
+                timestamp_chunks.append(pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]'))
+                value_chunks.append(df.reindex(columns=feature_names).to_numpy(dtype=np.float32))
+            if chunk_end >= end:
+                break
+            chunk_start = chunk_end
+        
+        if not value_chunks:
+            return FeatureMatrix(
+                np.empty(0, dtype='datetime64[ns]'),
+                np.empty((0, len(feature_names or [])), dtype=np.float32),
+                feature_names or []
+            )
+        
+        return self._sorted(FeatureMatrix(np.concatenate(timestamp_chunks), np.concatenate(value_chunks), feature_names))
+    
+    @staticmethod
+    def _sorted(matrix: FeatureMatrix) -> FeatureMatrix:
+        if len(matrix) and np.any(np.diff(matrix.timestamps) < np.timedelta64(0)):
+            order = np.argsort(matrix.timestamps, kind='stable')
+            return FeatureMatrix(matrix.timestamps[order], matrix.values[order], matrix.feature_names)
+        return matrix
@@ -2,6 +2,7 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from backend.shared.models import HealthResponse
 from backend.model_training.training_pipeline import TrainingPipeline
+from typing import Optional
 from uuid import UUID
 import time
 import asyncio
@@ -30,10 +31,10 @@ async def health():
     )
 
 
-async def train_model_task(asset_id: str, model_id: str, model_type: str):
+async def train_model_task(asset_id: str, model_id: str, model_type: str, inference_backend: Optional[str] = None):
     """Фоновая задача обучения модели"""
     try:
-        result = await training_pipeline.train_and_register(asset_id, model_id, model_type)
+        result = await training_pipeline.train_and_register(asset_id, model_id, model_type, inference_backend)
         print(f"Training completed: {result}")
     except Exception as e:
         print(f"Training failed: {e}")
@@ -44,19 +45,22 @@ async def train_model(
     asset_id: str,
     model_id: str,
     model_type: str = "lightgbm",
+    inference_backend: Optional[str] = None,
     background_tasks: BackgroundTasks = None
 ):
     """Запуск обучения модели"""
     if model_type not in ["lightgbm", "neural"]:
         raise HTTPException(status_code=400, detail="model_type must be 'lightgbm' or 'neural'")
+    if inference_backend not in [None, "native", "compiled"]:
+        raise HTTPException(status_code=400, detail="inference_backend must be 'native' or 'compiled'")
     
     # Запуск в фоне
     if background_tasks:
-        background_tasks.add_task(train_model_task, asset_id, model_id, model_type)
+        background_tasks.add_task(train_model_task, asset_id, model_id, model_type, inference_backend)
         return {"status": "training_started", "asset_id": asset_id, "model_id": model_id}
     else:
         # Синхронное выполнение (для тестирования)
-        result = await training_pipeline.train_and_register(asset_id, model_id, model_type)
+        result = await training_pipeline.train_and_register(asset_id, model_id, model_type, inference_backend)
         return result
 
 
@@ -0,0 +1,232 @@
+"""Артефакт модели: модели всех горизонтов и метаданные в одном zip-архиве"""
+import numpy as np
+import lightgbm as lgb
+import torch
+import zipfile
+import json
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Tuple
+from backend.model_training.trainers.neural_trainer import SimpleTimeSeriesNN
+from backend.model_training.compiled_backend import export_compiled, load_compiled, PARITY_RTOL, PARITY_ATOL
+
+METADATA_FILE = "metadata.json"
+BUNDLE_FORMAT_VERSION = 1
+
+
+def build_feature_schema(columns: List[str], dtype: str = "float32") -> Dict[str, Any]:
+    """Схема входа модели: порядок колонок, их типы и размерность"""
+    return {
+        "columns": list(columns),
+        "dtypes": {column: dtype for column in columns},
+        "input_size": len(columns)
+    }
+
+
+def pack_bundle(metadata: Dict[str, Any], files: Dict[str, bytes]) -> bytes:
+    """Упаковка файлов моделей и метаданных в zip"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(METADATA_FILE, json.dumps({"format_version": BUNDLE_FORMAT_VERSION, **metadata}))
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def unpack_bundle(data: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """Распаковка zip-артефакта: (метаданные, файлы)"""
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        metadata = json.loads(archive.read(METADATA_FILE))
+        files = {name: archive.read(name) for name in archive.namelist() if name != METADATA_FILE}
+    return metadata, files
+
+
+def is_bundle(data: bytes) -> bool:
+    """Артефакт в формате bundle (а не одиночная модель старого формата)"""
+    return zipfile.is_zipfile(BytesIO(data))
+
+
+class MultiHorizonModel:
+    """Модель прямого прогнозирования на несколько горизонтов.
+    
+    LightGBM - по бустеру на горизонт, нейросеть - одна модель с выходом на все горизонты.
+    predict возвращает матрицу (n_rows, n_horizons) за один проход по батчу фичей.
+    
+    Интервалы: у LightGBM - квантильные бустеры (quantile_models[горизонт][квантиль]),
+    у нейросети - квантили остатков на валидации (metadata["residual_quantiles"]).
+    """
+    
+    def __init__(
+        self,
+        model_type: str,
+        horizons: List[int],
+        models: Any,
+        metadata: Dict[str, Any] = None,
+        quantiles: Optional[List[float]] = None,
+        quantile_models: Optional[List[List[Any]]] = None
+    ):
+        self.model_type = model_type
+        self.horizons = list(horizons)
+        self.models = models
+        self.metadata = metadata or {}
+        self.quantiles = list(quantiles or [])
+        self.quantile_models = quantile_models
+        # native - lgb.Booster / nn.Module, onnx / torchscript - компилированный backend
+        self.backend = "native"
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Прогноз для всех горизонтов: (n_rows, n_horizons)"""
+        if self.model_type == "lightgbm":
+            return np.column_stack([booster.predict(X) for booster in self.models])
+        elif self.model_type == "neural":
+            X_tensor = torch.as_tensor(X, dtype=torch.float32).reshape(X.shape[0], 1, X.shape[1])
+            with torch.no_grad():
+                return self.models(X_tensor).cpu().numpy().reshape(X.shape[0], len(self.horizons))
+        raise ValueError(f"Unknown model type: {self.model_type}")
+    
+    def predict_with_quantiles(self, X: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Точечный прогноз (n_rows, n_horizons) и квантили (n_rows, n_horizons, n_quantiles).
+        
+        Квантили None, если модель обучена без них (артефакты старого формата).
+        """
+        point = self.predict(X)
+        if self.quantile_models is not None:
+            # (n_horizons, n_quantiles, n_rows) -> (n_rows, n_horizons, n_quantiles)
+            quantile_preds = np.array([
+                [booster.predict(X) for booster in horizon_boosters]
+                for horizon_boosters in self.quantile_models
+            ]).transpose(2, 0, 1)
+        elif "residual_quantiles" in self.metadata:
+            quantile_preds = point[:, :, None] + np.asarray(self.metadata["residual_quantiles"])[None]
+        else:
+            return point, None
+        # Независимые квантильные модели могут пересекаться - упорядочиваем
+        return point, np.sort(quantile_preds, axis=2)
+    
+    @property
+    def feature_schema(self) -> Optional[Dict[str, Any]]:
+        """Схема входа (для bundle без схемы - по сохраненному списку фичей)"""
+        if "feature_schema" in self.metadata:
+            return self.metadata["feature_schema"]
+        if "feature_names" in self.metadata:
+            return build_feature_schema(self.metadata["feature_names"])
+        return None
+    
+    def horizon_indices(self, horizons: List[int]) -> List[int]:
+        """Индексы колонок predict для запрошенных горизонтов"""
+        missing = [h for h in horizons if h not in self.horizons]
+        if missing:
+            raise ValueError(f"Model has no forecasts for horizons {missing}, available: {self.horizons}")
+        return [self.horizons.index(h) for h in horizons]
+    
+    def to_bytes(self, metadata: Dict[str, Any] = None, export_compiled_models: bool = False) -> bytes:
+        """Сериализация в bundle (опционально - с компилированными версиями моделей)"""
+        metadata = {
+            **self.metadata,
+            **(metadata or {}),
+            "model_type": self.model_type,
+            "horizons": self.horizons,
+            "quantiles": self.quantiles
+        }
+        if self.model_type == "lightgbm":
+            files = {
+                f"horizon_{horizon}.txt": booster.model_to_string().encode()
+                for horizon, booster in zip(self.horizons, self.models)
+            }
+            if self.quantile_models is not None:
+                for horizon, horizon_boosters in zip(self.horizons, self.quantile_models):
+                    for quantile, booster in zip(self.quantiles, horizon_boosters):
+                        files[f"horizon_{horizon}_q{quantile}.txt"] = booster.model_to_string().encode()
+        elif self.model_type == "neural":
+            buffer = BytesIO()
+            torch.save(self.models.state_dict(), buffer)
+            files = {"model.pt": buffer.getvalue()}
+            metadata["architecture"] = {
+                "input_size": self.models.lstm.input_size,
+                "hidden_size": self.models.lstm.hidden_size,
+                "num_layers": self.models.lstm.num_layers,
+                "output_size": self.models.fc.out_features
+            }
+        else:
+            raise ValueError(f"Unknown model type: {self.model_type}")
+        
+        if export_compiled_models:
+            try:
+                compiled_files, compiled = export_compiled(
+                    self.model_type, self.horizons, self.quantiles, self.models, self.quantile_models
+                )
+            except Exception as e:
+                # Экспорт необязателен - модель будет обслуживаться нативно
+                print(f"Compiled export failed, bundle will be native only: {e}")
+                compiled_files, compiled = {}, None
+            if compiled is not None:
+                files.update(compiled_files)
+                metadata["compiled"] = compiled
+        return pack_bundle(metadata, files)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes, backend: str = "native") -> "MultiHorizonModel":
+        """Десериализация bundle.
+        
+        backend="compiled" загружает ONNX/TorchScript-версию, если она есть в bundle,
+        доступен runtime и ее прогноз совпадает с нативным; иначе - нативная модель.
+        """
+        metadata, files = unpack_bundle(data)
+        model_type = metadata["model_type"]
+        horizons = metadata["horizons"]
+        quantiles = metadata.get("quantiles", [])
+        quantile_models = None
+        if model_type == "lightgbm":
+            models = [lgb.Booster(model_str=files[f"horizon_{horizon}.txt"].decode()) for horizon in horizons]
+            if quantiles and all(f"horizon_{horizon}_q{quantile}.txt" in files for horizon in horizons for quantile in quantiles):
+                quantile_models = [
+                    [lgb.Booster(model_str=files[f"horizon_{horizon}_q{quantile}.txt"].decode()) for quantile in quantiles]
+                    for horizon in horizons
+                ]
+        elif model_type == "neural":
+            schema = metadata.get("feature_schema")
+            if schema and schema["input_size"] != metadata["architecture"]["input_size"]:
+                raise ValueError(
+                    f"Feature schema has {schema['input_size']} columns, "
+                    f"model expects {metadata['architecture']['input_size']}"
+                )
+            model = SimpleTimeSeriesNN(**metadata["architecture"])
+            model.load_state_dict(torch.load(BytesIO(files["model.pt"]), map_location="cpu"))
+            model.eval()
+            models = model
+        else:
+            raise ValueError(f"Unknown model type: {model_type}")
+        native = cls(model_type, horizons, models, metadata, quantiles, quantile_models)
+        
+        if backend == "compiled" and "compiled" in metadata:
+            try:
+                compiled_models, compiled_quantile_models = load_compiled(metadata["compiled"], horizons, quantiles, files)
+                compiled = cls(model_type, horizons, compiled_models, metadata, quantiles, compiled_quantile_models)
+                compiled.backend = metadata["compiled"]["format"]
+                if native.matches(compiled):
+                    return compiled
+                print(f"Compiled {compiled.backend} model diverges from native, using native backend")
+            except Exception as e:
+                print(f"Compiled backend unavailable, using native: {e}")
+        return native
+    
+    @property
+    def input_size(self) -> int:
+        schema = self.feature_schema
+        if schema:
+            return schema["input_size"]
+        if self.model_type == "lightgbm":
+            return self.models[0].num_feature()
+        return self.models.lstm.input_size
+    
+    def matches(self, other: "MultiHorizonModel", n_rows: int = 8) -> bool:
+        """Совпадение прогнозов двух реализаций модели на пробных данных"""
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(n_rows, self.input_size)).astype(np.float32)
+        X[0] = 0.0
+        point, quantile_preds = self.predict_with_quantiles(X)
+        other_point, other_quantile_preds = other.predict_with_quantiles(X)
+        if not np.allclose(point, other_point, rtol=PARITY_RTOL, atol=PARITY_ATOL):
+            return False
+        if (quantile_preds is None) != (other_quantile_preds is None):
+            return False
+        return quantile_preds is None or np.allclose(quantile_preds, other_quantile_preds, rtol=PARITY_RTOL, atol=PARITY_ATOL)
@@ -3,7 +3,6 @@ import lightgbm as lgb
 import numpy as np
 from typing import Dict, Any, Tuple
 import pickle
-import io
 
 
 class LightGBMTrainer:
@@ -53,6 +52,8 @@ class LightGBMTrainer:
             config = self.config.copy()
             config['objective'] = 'quantile'
             config['alpha'] = quantile
+            # Ранняя остановка по pinball loss, а не по RMSE
+            config['metric'] = 'quantile'
             
             train_data = lgb.Dataset(X_train, label=y_train)
             valid_sets = [train_data]
@@ -90,8 +91,5 @@ class LightGBMTrainer:
     
     def serialize_model(self, model: lgb.Booster) -> bytes:
         """Сериализация модели в bytes"""
-        buffer = io.BytesIO()
-        model.save_model(buffer)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return model.model_to_string().encode()
 
@@ -35,10 +35,13 @@ class NeuralTrainer:
     def train(self, X_train, y_train, X_val=None, y_val=None) -> nn.Module:
         """Обучение модели"""
         input_size = X_train.shape[-1]
+        # Несколько колонок y - модель с выходом на каждый горизонт
+        output_size = y_train.shape[1] if np.ndim(y_train) > 1 else 1
         model = SimpleTimeSeriesNN(
             input_size=input_size,
             hidden_size=self.config['hidden_size'],
-            num_layers=self.config['num_layers']
+            num_layers=self.config['num_layers'],
+            output_size=output_size
         ).to(self.device)
         
         criterion = nn.MSELoss()
@@ -46,18 +49,18 @@ class NeuralTrainer:
         
         # Преобразование данных
         X_train_tensor = torch.FloatTensor(X_train).to(self.device)
-        y_train_tensor = torch.FloatTensor(y_train).to(self.device)
+        y_train_tensor = torch.FloatTensor(y_train).reshape(-1, output_size).to(self.device)
         
         if X_val is not None and y_val is not None:
             X_val_tensor = torch.FloatTensor(X_val).to(self.device)
-            y_val_tensor = torch.FloatTensor(y_val).to(self.device)
+            y_val_tensor = torch.FloatTensor(y_val).reshape(-1, output_size).to(self.device)
         
         # Обучение
         for epoch in range(self.config['epochs']):
             model.train()
             optimizer.zero_grad()
             outputs = model(X_train_tensor)
-            loss = criterion(outputs.squeeze(), y_train_tensor)
+            loss = criterion(outputs, y_train_tensor)
             loss.backward()
             optimizer.step()
             
@@ -65,7 +68,7 @@ class NeuralTrainer:
                 model.eval()
                 with torch.no_grad():
                     val_outputs = model(X_val_tensor)
-                    val_loss = criterion(val_outputs.squeeze(), y_val_tensor)
+                    val_loss = criterion(val_outputs, y_val_tensor)
                     print(f"Epoch {epoch}, Train Loss: {loss.item():.4f}, Val Loss: {val_loss.item():.4f}")
         
         return model
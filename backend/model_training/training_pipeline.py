@@ -1,15 +1,17 @@
 """Пайплайн обучения моделей"""
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+import asyncio
+import time
 import httpx
 import boto3
 from botocore.config import Config
-from io import BytesIO
-import torch
 from backend.model_training.config import training_settings
 from backend.model_training.trainers import LightGBMTrainer, NeuralTrainer
+from backend.model_training.feature_loader import FeatureLoader, FeatureMatrix
+from backend.model_training.model_bundle import MultiHorizonModel, build_feature_schema
 from sklearn.metrics import mean_absolute_error, mean_squared_error, mean_absolute_percentage_error
 
 
@@ -25,43 +27,61 @@ class TrainingPipeline:
             aws_secret_access_key=training_settings.MINIO_SECRET_KEY,
             config=Config(signature_version='s3v4')
         )
+        self.feature_loader = FeatureLoader()
     
-    async def load_features(self, asset_id: str, start_date: datetime, end_date: datetime) -> pd.DataFrame:
-        """Загрузка фичей из Feature Pipeline"""
-        # В реальной реализации здесь будет загрузка из S3/ClickHouse
-        # Для примера используем мок-данные
-        dates = pd.date_range(start_date, end_date, freq='H')
-        n_samples = len(dates)
-        
-        # Генерация тестовых фичей
-        np.random.seed(42)
-        features = pd.DataFrame({
-            'timestamp': dates,
-            'close_lag_1': np.random.randn(n_samples) * 10 + 100,
-            'close_lag_2': np.random.randn(n_samples) * 10 + 100,
-            'close_ma_5': np.random.randn(n_samples) * 10 + 100,
-            'close_ma_10': np.random.randn(n_samples) * 10 + 100,
-            'close_volatility_5': np.abs(np.random.randn(n_samples)),
-            'news_count': np.random.randint(0, 10, n_samples),
-            'avg_sentiment': np.random.uniform(-1, 1, n_samples),
-        })
-        
-        # Генерация целевой переменной (цена через N дней)
-        features['target'] = features['close_lag_1'] + np.random.randn(n_samples) * 2
-        
-        return features
+    async def load_features(self, asset_id: str, start_date: datetime, end_date: datetime) -> FeatureMatrix:
+        """Загрузка фичей из Feature Store (Parquet в S3, fallback - ClickHouse)"""
+        # Чтение из S3/ClickHouse блокирующее - выполняем вне event loop
+        return await asyncio.to_thread(self.feature_loader.load, asset_id, start_date, end_date)
     
-    def prepare_data(self, df: pd.DataFrame, target_col: str = 'target', test_size: float = 0.2) -> Tuple:
-        """Подготовка данных для обучения"""
-        # Разделение на признаки и целевую переменную
-        feature_cols = [col for col in df.columns if col not in ['timestamp', target_col]]
-        X = df[feature_cols].values
-        y = df[target_col].values
+    async def get_forecast_horizons(self, asset_id: str) -> List[int]:
+        """Горизонты прогноза (в днях) из AssetConfig актива"""
+        url = f"{training_settings.ASSET_SERVICE_URL}/assets/{asset_id}/config"
+        try:
+            response = await self.http_client.get(url)
+        except httpx.HTTPError:
+            return list(training_settings.DEFAULT_FORECAST_HORIZONS)
+        if response.status_code == 200:
+            horizons = response.json().get("forecast_horizons")
+            if horizons:
+                return sorted(set(horizons))
+        return list(training_settings.DEFAULT_FORECAST_HORIZONS)
+    
+    def build_targets(self, features: FeatureMatrix, horizons_hours: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Целевые переменные - цена закрытия через каждый из горизонтов (в часах).
+        
+        Возвращает индексы строк, для которых есть бар хотя бы для одного горизонта,
+        и матрицу целей (n_rows, n_horizons); отсутствующие цели - NaN.
+        """
+        n_rows = len(features)
+        Y = np.full((n_rows, len(horizons_hours)), np.nan, dtype=np.float32)
+        if n_rows == 0:
+            return np.empty(0, dtype=np.int64), Y
+        
+        close = features.column('close')
+        for j, horizon_hours in enumerate(horizons_hours):
+            target_times = features.timestamps + np.timedelta64(horizon_hours, 'h')
+            target_idx = np.searchsorted(features.timestamps, target_times)
+            clipped_idx = np.minimum(target_idx, n_rows - 1)
+            valid = (target_idx < n_rows) & (features.timestamps[clipped_idx] == target_times)
+            Y[valid, j] = close[target_idx[valid]]
+        
+        rows = np.flatnonzero(~np.isnan(Y).all(axis=1))
+        return rows, Y[rows]
+    
+    def prepare_data(self, features: FeatureMatrix, horizons_hours: List[int], test_size: float = 0.2) -> Tuple:
+        """Подготовка данных для обучения (цели - матрица по горизонтам)"""
+        rows, Y = self.build_targets(features, horizons_hours)
+        if len(rows) == 0:
+            raise ValueError("Not enough feature history to build training targets")
+        
+        feature_cols = list(features.feature_names)
+        X = features.values[rows]
         
         # Разделение на train/test
         split_idx = int(len(X) * (1 - test_size))
         X_train, X_test = X[:split_idx], X[split_idx:]
-        y_train, y_test = y[:split_idx], y[split_idx:]
+        y_train, y_test = Y[:split_idx], Y[split_idx:]
         
         # Разделение train на train/val
         val_size = int(len(X_train) * training_settings.VALIDATION_SPLIT)
@@ -70,53 +90,121 @@ class TrainingPipeline:
         
         return X_train, y_train, X_val, y_val, X_test, y_test, feature_cols
     
-    def train_lightgbm(self, X_train, y_train, X_val, y_val) -> Tuple[Any, Dict[str, float]]:
-        """Обучение LightGBM модели"""
-        trainer = LightGBMTrainer()
-        model = trainer.train(X_train, y_train, X_val, y_val)
-        
-        # Вычисление метрик
-        train_pred = trainer.predict(model, X_train)
-        val_pred = trainer.predict(model, X_val)
-        
-        metrics = {
-            'train_mae': mean_absolute_error(y_train, train_pred),
-            'train_rmse': np.sqrt(mean_squared_error(y_train, train_pred)),
-            'train_mape': mean_absolute_percentage_error(y_train, train_pred),
-            'val_mae': mean_absolute_error(y_val, val_pred),
-            'val_rmse': np.sqrt(mean_squared_error(y_val, val_pred)),
-            'val_mape': mean_absolute_percentage_error(y_val, val_pred),
+    @staticmethod
+    def _regression_metrics(y_true: np.ndarray, y_pred: np.ndarray, dataset: str, suffix: str = "") -> Dict[str, float]:
+        return {
+            f'{dataset}_mae{suffix}': mean_absolute_error(y_true, y_pred),
+            f'{dataset}_rmse{suffix}': np.sqrt(mean_squared_error(y_true, y_pred)),
+            f'{dataset}_mape{suffix}': mean_absolute_percentage_error(y_true, y_pred),
         }
+    
+    def _horizon_metrics(self, Y_true: np.ndarray, Y_pred: np.ndarray, dataset: str, horizons: List[int]) -> Dict[str, float]:
+        """Метрики по каждому горизонту (суффикс _h{дни}d) и средние по горизонтам"""
+        metrics = {}
+        for j, horizon in enumerate(horizons):
+            valid = ~np.isnan(Y_true[:, j])
+            if valid.any():
+                metrics.update(self._regression_metrics(Y_true[valid, j], Y_pred[valid, j], dataset, f"_h{horizon}d"))
+        for name in ('mae', 'rmse', 'mape'):
+            values = [metrics[f'{dataset}_{name}_h{horizon}d'] for horizon in horizons if f'{dataset}_{name}_h{horizon}d' in metrics]
+            if values:
+                metrics[f'{dataset}_{name}'] = float(np.mean(values))
+        return metrics
+    
+    def _interval_metrics(
+        self,
+        Y_true: np.ndarray,
+        Q_pred: np.ndarray,
+        dataset: str,
+        horizons: List[int],
+        quantiles: List[float]
+    ) -> Dict[str, float]:
+        """Качество интервалов: pinball loss по квантилям, покрытие и ширина интервала"""
+        metrics = {}
+        for j, horizon in enumerate(horizons):
+            valid = ~np.isnan(Y_true[:, j])
+            if not valid.any():
+                continue
+            y = Y_true[valid, j]
+            q_pred = Q_pred[valid, j]
+            for k, quantile in enumerate(quantiles):
+                error = y - q_pred[:, k]
+                metrics[f'{dataset}_pinball_q{quantile}_h{horizon}d'] = float(np.mean(np.maximum(quantile * error, (quantile - 1) * error)))
+            # Доля фактов внутри [нижний, верхний квантиль] (ожидается q_max - q_min)
+            metrics[f'{dataset}_coverage_h{horizon}d'] = float(np.mean((y >= q_pred[:, 0]) & (y <= q_pred[:, -1])))
+            metrics[f'{dataset}_interval_width_h{horizon}d'] = float(np.mean(q_pred[:, -1] - q_pred[:, 0]))
+        return metrics
+    
+    def evaluate(self, model: MultiHorizonModel, X_train, y_train, X_val, y_val) -> Dict[str, float]:
+        """Метрики точечного прогноза, интервалов и стоимости инференса"""
+        metrics = {}
+        for dataset, X, Y in (('train', X_train, y_train), ('val', X_val, y_val)):
+            if len(X) == 0:
+                continue
+            started = time.perf_counter()
+            point, quantile_preds = model.predict_with_quantiles(X)
+            elapsed = time.perf_counter() - started
+            
+            metrics.update(self._horizon_metrics(Y, point, dataset, model.horizons))
+            if quantile_preds is not None:
+                metrics.update(self._interval_metrics(Y, quantile_preds, dataset, model.horizons, model.quantiles))
+            if dataset == 'val':
+                # Батчевый прогноз всех горизонтов и квантилей, микросекунд на строку
+                metrics['val_inference_us_per_row'] = elapsed / len(X) * 1e6
+        return metrics
+    
+    def train_lightgbm(self, X_train, y_train, X_val, y_val, horizons: List[int]) -> Tuple[MultiHorizonModel, Dict[str, float]]:
+        """Обучение LightGBM: бустер и квантильные бустеры на каждый горизонт"""
+        trainer = LightGBMTrainer()
+        quantiles = training_settings.QUANTILES
+        boosters, quantile_boosters = [], []
+        for j in range(len(horizons)):
+            # Для каждого горизонта - строки, где известна его цель
+            train_mask = ~np.isnan(y_train[:, j])
+            val_mask = ~np.isnan(y_val[:, j])
+            if not train_mask.any():
+                raise ValueError(f"Not enough feature history for horizon {horizons[j]}d")
+            X_val_h = X_val[val_mask] if val_mask.any() else None
+            y_val_h = y_val[val_mask, j] if val_mask.any() else None
+            boosters.append(trainer.train(X_train[train_mask], y_train[train_mask, j], X_val_h, y_val_h))
+            
+            quantile_models = trainer.train_quantile(
+                X_train[train_mask], y_train[train_mask, j], quantiles, X_val=X_val_h, y_val=y_val_h
+            )
+            quantile_boosters.append([quantile_models[f'quantile_{quantile}'] for quantile in quantiles])
         
-        return model, metrics
+        model = MultiHorizonModel("lightgbm", horizons, boosters, quantiles=quantiles, quantile_models=quantile_boosters)
+        return model, self.evaluate(model, X_train, y_train, X_val, y_val)
     
-    def train_neural(self, X_train, y_train, X_val, y_val) -> Tuple[Any, Dict[str, float]]:
-        """Обучение нейросетевой модели"""
+    def train_neural(self, X_train, y_train, X_val, y_val, horizons: List[int]) -> Tuple[MultiHorizonModel, Dict[str, float]]:
+        """Обучение нейросетевой модели с выходом на все горизонты"""
+        # Многовыходной модели нужны строки с известными целями всех горизонтов
+        train_mask = ~np.isnan(y_train).any(axis=1)
+        val_mask = ~np.isnan(y_val).any(axis=1)
+        X_train, y_train = X_train[train_mask], y_train[train_mask]
+        X_val, y_val = X_val[val_mask], y_val[val_mask]
+        if len(X_train) == 0:
+            raise ValueError(f"Not enough feature history for horizon {max(horizons)}d")
+        
         # Преобразование для LSTM (нужна 3D форма)
         X_train_3d = X_train.reshape(X_train.shape[0], 1, X_train.shape[1])
         X_val_3d = X_val.reshape(X_val.shape[0], 1, X_val.shape[1])
         
         trainer = NeuralTrainer()
-        model = trainer.train(X_train_3d, y_train, X_val_3d, y_val)
-        
-        # Вычисление метрик
-        train_pred = trainer.predict(model, X_train_3d)
-        val_pred = trainer.predict(model, X_val_3d)
-        
-        metrics = {
-            'train_mae': mean_absolute_error(y_train, train_pred),
-            'train_rmse': np.sqrt(mean_squared_error(y_train, train_pred)),
-            'train_mape': mean_absolute_percentage_error(y_train, train_pred),
-            'val_mae': mean_absolute_error(y_val, val_pred),
-            'val_rmse': np.sqrt(mean_squared_error(y_val, val_pred)),
-            'val_mape': mean_absolute_percentage_error(y_val, val_pred),
-        }
+        network = trainer.train(X_train_3d, y_train, X_val_3d, y_val)
+        model = MultiHorizonModel("neural", horizons, network.cpu().eval())
+        
+        # Интервалы - эмпирические квантили остатков на валидации, по горизонтам
+        calibration_X, calibration_y = (X_val, y_val) if len(X_val) else (X_train, y_train)
+        residuals = calibration_y - model.predict(calibration_X)
+        model.quantiles = training_settings.QUANTILES
+        model.metadata["residual_quantiles"] = np.quantile(residuals, model.quantiles, axis=0).T.tolist()
         
-        return model, metrics
+        return model, self.evaluate(model, X_train, y_train, X_val, y_val)
     
     def save_model_to_s3(self, model_bytes: bytes, model_id: str, version: str) -> str:
         """Сохранение модели в S3"""
-        key = f"models/{model_id}/{version}/model.pkl"
+        key = f"models/{model_id}/{version}/model.bundle"
         self.s3_client.put_object(
             Bucket=training_settings.MINIO_BUCKET_MODELS,
             Key=key,
@@ -125,17 +213,30 @@ class TrainingPipeline:
         )
         return key
     
-    async def register_model(self, model_id: str, version: str, artifact_path: str, metrics: Dict[str, float], model_type: str):
+    async def register_model(
+        self,
+        model_id: str,
+        version: str,
+        artifact_path: str,
+        metrics: Dict[str, float],
+        model_type: str,
+        horizons: List[int],
+        inference_backend: Optional[str] = None
+    ):
         """Регистрация модели в Model Registry"""
         url = f"{training_settings.MODEL_REGISTRY_URL}/models/{model_id}/versions"
         
         version_data = {
             "version": version,
             "artifact_path": artifact_path,
-            "training_config": {"model_type": model_type},
+            "training_config": {"model_type": model_type, "horizons": horizons},
             "status": "archived"
         }
         
+        if inference_backend:
+            # Backend инференса этой модели в Forecast Service (native / compiled)
+            version_data["training_config"]["inference_backend"] = inference_backend
+        
         response = await self.http_client.post(url, json=version_data)
         version_id = response.json()["id"]
         
@@ -154,43 +255,53 @@ class TrainingPipeline:
         
         return version_id
     
-    async def train_and_register(self, asset_id: str, model_id: str, model_type: str = "lightgbm"):
+    async def train_and_register(
+        self,
+        asset_id: str,
+        model_id: str,
+        model_type: str = "lightgbm",
+        inference_backend: Optional[str] = None
+    ):
         """Полный цикл обучения и регистрации"""
-        # Загрузка данных
-        end_date = datetime.utcnow()
+        # Загрузка данных (границы по часу, чтобы повторные обучения попадали в локальный кеш)
+        end_date = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
         start_date = end_date - pd.Timedelta(days=90)
         
-        features_df = await self.load_features(asset_id, start_date, end_date)
+        features = await self.load_features(asset_id, start_date, end_date)
         
-        # Подготовка данных
-        X_train, y_train, X_val, y_val, X_test, y_test, feature_cols = self.prepare_data(features_df)
+        # Горизонты прогноза актива (дни) и подготовка данных
+        horizons = await self.get_forecast_horizons(asset_id)
+        X_train, y_train, X_val, y_val, X_test, y_test, feature_cols = self.prepare_data(
+            features, [horizon * 24 for horizon in horizons]
+        )
         
         # Обучение
         if model_type == "lightgbm":
-            model, metrics = self.train_lightgbm(X_train, y_train, X_val, y_val)
-            trainer = LightGBMTrainer()
-            model_bytes = trainer.serialize_model(model)
+            model, metrics = self.train_lightgbm(X_train, y_train, X_val, y_val, horizons)
         elif model_type == "neural":
-            X_train_3d = X_train.reshape(X_train.shape[0], 1, X_train.shape[1])
-            X_val_3d = X_val.reshape(X_val.shape[0], 1, X_val.shape[1])
-            model, metrics = self.train_neural(X_train_3d, y_train, X_val_3d, y_val)
-            # Сериализация PyTorch модели
-            buffer = BytesIO()
-            torch.save(model.state_dict(), buffer)
-            model_bytes = buffer.getvalue()
+            model, metrics = self.train_neural(X_train, y_train, X_val, y_val, horizons)
         else:
             raise ValueError(f"Unknown model type: {model_type}")
         
+        # Все горизонты и схема входа (колонки, типы, размерность) - в одном артефакте
+        model_bytes = model.to_bytes(
+            {"feature_schema": build_feature_schema(feature_cols, str(X_train.dtype))},
+            export_compiled_models=training_settings.EXPORT_COMPILED_MODELS
+        )
+        
         # Сохранение в S3
         version = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         artifact_path = self.save_model_to_s3(model_bytes, model_id, version)
         
         # Регистрация в Model Registry
-        version_id = await self.register_model(model_id, version, artifact_path, metrics, model_type)
+        version_id = await self.register_model(
+            model_id, version, artifact_path, metrics, model_type, horizons, inference_backend
+        )
         
         return {
             "version_id": version_id,
             "version": version,
+            "horizons": horizons,
             "metrics": metrics,
             "artifact_path": artifact_path
         }
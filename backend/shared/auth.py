@@ -1,11 +1,26 @@
 """JWT авторизация"""
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from backend.shared.config import settings
 
+try:
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
+else:
+    # Модуль jwt ставят и другие пакеты (jwt, python-jwt) с иным API - нужен именно PyJWT
+    if not (hasattr(pyjwt, "PyJWKClient") and hasattr(pyjwt, "PyJWTError")):
+        pyjwt = None
+
+if settings.JWT_BACKEND == "pyjwt" and pyjwt is None:
+    print('JWT_BACKEND=pyjwt, but PyJWT is not installed (extra "fast-jwt"), using python-jose')
+
 security = HTTPBearer()
 
 
@@ -21,25 +36,98 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Верификация JWT токена"""
+def decode_token(token: str) -> Dict[str, Any]:
+    """Проверка подписи и claims токена выбранным backend (JWT_BACKEND: jose или pyjwt).
+    
+    Ошибки обоих backend приводятся к JWTError.
+    """
+    if settings.JWT_BACKEND == "pyjwt" and pyjwt is not None:
+        try:
+            return pyjwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        except pyjwt.PyJWTError as e:
+            raise JWTError(str(e))
+    return jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+
+
+class TokenCache:
+    """LRU-кеш проверенных токенов: sha256(токен) -> (пользователь, срок действия записи).
+    
+    Запись живет до exp токена, но не дольше JWT_CACHE_MAX_TTL_SECONDS.
+    Кешируются только успешно проверенные токены.
+    """
+    
+    def __init__(self, max_size: int, max_ttl: int):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token: str) -> Optional[str]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        username, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return username
+    
+    def put(self, token: str, username: str, payload: Dict[str, Any]):
+        expires_at = time.time() + self.max_ttl
+        if payload.get("exp") is not None:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        self._entries[key] = (username, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(settings.JWT_CACHE_MAX_TOKENS, settings.JWT_CACHE_MAX_TTL_SECONDS)
+
+
+def verify_token_value(token: str) -> str:
+    """Пользователь (sub) проверенного токена; повторные проверки - из кеша"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if settings.JWT_CACHE_ENABLED:
+        username = token_cache.get(token)
+        if username is not None:
+            return username
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        return username
     except JWTError:
         raise credentials_exception
+    if settings.JWT_CACHE_ENABLED:
+        token_cache.put(token, username, payload)
+    return username
+
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Верификация JWT токена"""
+    # async: проверка (обычно попадание в кеш) выполняется в event loop, без перехода в threadpool
+    return verify_token_value(credentials.credentials)
 
 
 async def get_current_user(username: str = Depends(verify_token)):
     """Получение текущего пользователя"""
     return username
-
@@ -0,0 +1,54 @@
+"""Накладные расходы проверки JWT на запрос: jose, PyJWT и кеш проверенных токенов
+
+Пример: python -m backend.shared.benchmark_auth --iterations 20000
+"""
+import argparse
+import json
+import time
+import statistics
+from typing import Callable, Dict, Any
+from jose import jwt
+from backend.shared.auth import create_access_token, verify_token_value, pyjwt
+from backend.shared.config import settings
+
+
+def measure(name: str, func: Callable[[], Any], iterations: int) -> Dict[str, Any]:
+    """Задержка одного вызова: p50 / p99 / среднее в микросекундах"""
+    for _ in range(100):
+        func()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        "name": name,
+        "p50_us": round(latencies[len(latencies) // 2], 2),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)], 2),
+        "mean_us": round(statistics.fmean(latencies), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JWT verification overhead")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    
+    token = create_access_token({"sub": "benchmark"})
+    key, algorithms = settings.JWT_SECRET_KEY, [settings.JWT_ALGORITHM]
+    
+    results = [measure("jose.decode", lambda: jwt.decode(token, key, algorithms=algorithms), args.iterations)]
+    if pyjwt is not None:
+        results.append(measure("pyjwt.decode", lambda: pyjwt.decode(token, key, algorithms=algorithms), args.iterations))
+    else:
+        print("PyJWT is not installed, skipping pyjwt backend")
+    
+    # Полный путь зависимости gateway; при включенном кеше прогрев заполняет его, дальше - попадания
+    name = f"verify_token (backend={settings.JWT_BACKEND}, cache={'on' if settings.JWT_CACHE_ENABLED else 'off'})"
+    results.append(measure(name, lambda: verify_token_value(token), args.iterations))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,12 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = "your-secret-key-change-in-production"
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Проверка токенов: jose или pyjwt (быстрее, extra "fast-jwt"; без пакета - jose)
+    JWT_BACKEND: str = "jose"
+    # Кеш проверенных токенов (до exp токена, не дольше JWT_CACHE_MAX_TTL_SECONDS)
+    JWT_CACHE_ENABLED: bool = True
+    JWT_CACHE_MAX_TOKENS: int = 10000
+    JWT_CACHE_MAX_TTL_SECONDS: int = 300
     
     # Services URLs
     ASSET_SERVICE_URL: str = "http://asset-service:8001"
@@ -37,6 +43,8 @@ class Settings(BaseSettings):
     # Redis
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
+    # Канал событий смены версий моделей (Model Registry -> все реплики Forecast Service)
+    MODEL_EVENTS_CHANNEL: str = "model-version-changes"
     
     # MinIO (S3)
     MINIO_ENDPOINT: str = "minio:9000"
@@ -50,6 +50,70 @@ PARTITION BY toYYYYMM(timestamp)
 ORDER BY (asset_id, timestamp, feature_name)
 TTL timestamp + INTERVAL 1 YEAR;
 
+-- Таблица фичей в wide-формате (колонка на фичу, CLICKHOUSE_FEATURES_LAYOUT=wide)
+-- Колонки фичей - FeatureEngineer.feature_names(); Feature Pipeline сверяет их с таблицей при старте
+CREATE TABLE IF NOT EXISTS features_wide (
+    asset_id String,
+    timestamp DateTime64(3),
+    open Float64,
+    high Float64,
+    low Float64,
+    close Float64,
+    volume Float64,
+    close_lag_1 Float64,
+    close_lag_2 Float64,
+    close_lag_3 Float64,
+    close_lag_5 Float64,
+    close_lag_10 Float64,
+    close_lag_20 Float64,
+    close_ma_5 Float64,
+    close_ma_10 Float64,
+    close_ma_20 Float64,
+    close_ma_50 Float64,
+    volume_ma_5 Float64,
+    volume_ma_10 Float64,
+    volume_ma_20 Float64,
+    close_volatility_5 Float64,
+    close_volatility_10 Float64,
+    close_volatility_20 Float64,
+    hour Float64,
+    day_of_week Float64,
+    day_of_month Float64,
+    month Float64,
+    is_weekend Float64,
+    news_count Float64,
+    avg_sentiment Float64,
+    max_sentiment Float64,
+    min_sentiment Float64,
+    avg_importance Float64,
+    negative_news_count Float64,
+    news_count_1h Float64,
+    news_sentiment_mean_1h Float64,
+    news_sentiment_min_1h Float64,
+    news_sentiment_max_1h Float64,
+    news_negative_count_1h Float64,
+    news_importance_mean_1h Float64,
+    news_count_6h Float64,
+    news_sentiment_mean_6h Float64,
+    news_sentiment_min_6h Float64,
+    news_sentiment_max_6h Float64,
+    news_negative_count_6h Float64,
+    news_importance_mean_6h Float64,
+    news_count_24h Float64,
+    news_sentiment_mean_24h Float64,
+    news_sentiment_min_24h Float64,
+    news_sentiment_max_24h Float64,
+    news_negative_count_24h Float64,
+    news_importance_mean_24h Float64,
+    price_change Float64,
+    high_low_ratio Float64,
+    volume_price_trend Float64,
+    created_at DateTime DEFAULT now()
+) ENGINE = ReplacingMergeTree(created_at)
+PARTITION BY toYYYYMM(timestamp)
+ORDER BY (asset_id, timestamp)
+TTL timestamp + INTERVAL 1 YEAR;
+
 -- Индексы для производительности
 ALTER TABLE market_data ADD INDEX idx_asset_time asset_id TYPE minmax GRANULARITY 3;
 ALTER TABLE news_feed ADD INDEX idx_asset_time asset_id TYPE minmax GRANULARITY 3;